@@ -1,39 +1,62 @@
-from fastapi import FastAPI
+# api.py
+"""
+Servicio ligero de búsqueda (sin LLM, sin Chroma) sobre la instantánea de
+snapshot.py: la matriz de vectores se abre con mmap, así que varios workers
+de uvicorn comparten las mismas páginas en la caché del sistema operativo.
+
+Uso (desde backend/):
+    python snapshot.py export
+    uvicorn api:app --workers 4 --port 8001
+"""
+import threading
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-import pickle
 
-from rag.answer import answer_with_RAG
-from embeddings import embedding_model  # donde crees tu Ollama/OpenRouter embeddings
+from snapshot import SNAPSHOT_DIR, Snapshot
 
 app = FastAPI(title="RAG Backend")
 
-# ---- Cargar vectorstore UNA vez al arrancar ----
-with open("vectorstore.pkl", "rb") as f:
-    vectorstore = pickle.load(f)
+# ---- Abrir la instantánea UNA vez al arrancar (mmap: no copia nada a RAM) ----
+snapshot = Snapshot(SNAPSHOT_DIR)
 
-
-class ChatRequest(BaseModel):
-    question: str
-    top_k: int = 5
+_query_model = None
+# /search es síncrono (pool de hilos): sin el lock, las primeras peticiones cargarían el modelo a la vez
+_query_model_lock = threading.Lock()
 
 
-class ChatResponse(BaseModel):
-    answer: str
+def embed_question(question: str) -> List[float]:
+    # el modelo solo se carga si llegan preguntas en texto (EMBEDDING_BACKEND=onnx lo aligera)
+    global _query_model
+    if _query_model is None:
+        with _query_model_lock:
+            if _query_model is None:
+                from embeddings import get_base_embeddings
 
+                _query_model = get_base_embeddings()
+    return _query_model.embed_query(question)
 
-@app.get("/")
-def healthcheck():
-    return {"status": "ok"}
 
+class SearchRequest(BaseModel):
+    question: Optional[str] = None
+    vector: Optional[List[float]] = None  # alternativa a question, ya embebida
+    top_k: int = 5
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    answer = answer_with_RAG(
-        query=req.question,
-        vectorstore=vectorstore,
-        embedding_model=embedding_model,
-        top_k=req.top_k,
-        with_context=True
-    )
 
-    return {"answer": answer}
+@app.get("/")
+def healthcheck():
+    return {"status": "ok", "chunks": len(snapshot), "created_at": snapshot.manifest["created_at"]}
+
+
+@app.post("/search")
+def search(req: SearchRequest):
+    if req.vector is None and not req.question:
+        raise HTTPException(status_code=400, detail="Indica question o vector")
+    start = time.perf_counter()
+    vector = req.vector if req.vector is not None else embed_question(req.question)
+    if len(vector) != snapshot.manifest["dim"]:
+        raise HTTPException(status_code=400, detail=f"El vector debe tener {snapshot.manifest['dim']} dimensiones")
+    results = snapshot.search(vector, max(1, min(req.top_k, 50)))
+    return {"results": results, "took_ms": round((time.perf_counter() - start) * 1000, 2)}
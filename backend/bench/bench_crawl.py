@@ -0,0 +1,83 @@
+# bench/bench_crawl.py
+"""
+Crawler de /upload-url contra el sitio local de bench/fake_site.py:
+- primer rastreo con distinta concurrencia por host (páginas/s)
+- refresco sin cambios: con validadores todo responde 304; sin ellos, el
+  hash del texto evita reembeber
+- refresco tras cambiar un porcentaje de páginas: solo esas salen "changed"
+
+Uso (desde backend/):
+    python -m bench.bench_crawl --pages 200 --delay-ms 20 --per-host 1 4 16
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from typing import Dict, List
+
+from bench.fake_site import FakeSite
+from crawler import Crawler, Page
+
+
+def as_known(pages: List[Page]) -> Dict[str, dict]:
+    """Lo que guardaría CrawlState tras el rastreo"""
+    return {
+        p.url: {"etag": p.etag, "last_modified": p.last_modified, "sha256": p.sha256, "links": p.links}
+        for p in pages
+        if p.status != "error"
+    }
+
+
+def run(url: str, known: Dict[str, dict], per_host: int, max_pages: int) -> dict:
+    crawler = Crawler(max_depth=20, max_pages=max_pages, per_host=per_host)
+    start = time.perf_counter()
+    pages = asyncio.run(crawler.crawl(url, known))
+    seconds = time.perf_counter() - start
+    return {"pages": pages, "seconds": seconds, "counts": Counter(p.status for p in pages)}
+
+
+def report(name: str, result: dict) -> None:
+    counts = ", ".join(f"{k}={v}" for k, v in sorted(result["counts"].items()))
+    n = len(result["pages"])
+    print(f"{name:>28} {n:>6} {result['seconds']:>8.2f} {n / result['seconds']:>9.1f}  {counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--delay-ms", type=float, default=20)
+    parser.add_argument("--per-host", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--change", type=float, default=0.1, help="fracción de páginas que cambian")
+    args = parser.parse_args()
+
+    print(f"{'':>28} {'páginas':>6} {'s':>8} {'páginas/s':>9}  estados")
+    for validators in (True, False):
+        site = FakeSite(pages=args.pages, delay_ms=args.delay_ms, validators=validators)
+        server = site.serve()
+        url = f"http://127.0.0.1:{server.server_port}/"
+        label = "con ETag" if validators else "sin ETag"
+        try:
+            first = None
+            for per_host in args.per_host:
+                result = run(url, {}, per_host, args.pages)
+                report(f"{label}, inicial, {per_host}/host", result)
+                first = first or result
+            assert len(first["pages"]) == args.pages, "el crawler no ha llegado a todas las páginas"
+
+            per_host = max(args.per_host)
+            known = as_known(first["pages"])
+            refresh = run(url, known, per_host, args.pages)
+            report(f"{label}, refresco", refresh)
+            assert refresh["counts"].get("new", 0) + refresh["counts"].get("changed", 0) == 0
+
+            changed = list(range(0, args.pages, max(int(1 / args.change), 1)))
+            site.touch(changed)
+            after = run(url, as_known(refresh["pages"]), per_host, args.pages)
+            report(f"{label}, {len(changed)} cambiadas", after)
+            assert after["counts"].get("changed", 0) == len(changed)
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
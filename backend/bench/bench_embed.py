@@ -0,0 +1,64 @@
+# bench/bench_embed.py
+"""
+Embeddings de preguntas por segundo con 1, 8 y 64 llamantes concurrentes:
+una llamada a embed_query por pregunta (como antes) frente al
+BatchingEmbedder que agrupa las peticiones que llegan a la vez.
+
+Uso (desde backend/):
+    python -m bench.bench_embed --concurrency 1 8 64 --total 512
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from embeddings import EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS, BatchingEmbedder, get_embeddings
+
+QUESTIONS = json.loads((Path(__file__).parent / "questions.json").read_text(encoding="utf-8"))
+
+
+async def run(embed, concurrency: int, total: int) -> float:
+    queue = asyncio.Queue()
+    for i in range(total):
+        # sufijo para que ninguna pregunta sea idéntica a otra
+        queue.put_nowait(f"{QUESTIONS[i % len(QUESTIONS)]} ({i})")
+
+    async def worker():
+        while not queue.empty():
+            await embed(queue.get_nowait())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def main_async(args):
+    embeddings = get_embeddings()
+    embeddings.embed_queries(QUESTIONS[:4])  # calentamiento del modelo
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    loop = asyncio.get_running_loop()
+
+    async def single(text):
+        return await loop.run_in_executor(executor, embeddings.embed_query, text)
+
+    batching = BatchingEmbedder(
+        embeddings.embed_queries, executor, max_batch=args.max_batch, max_wait_ms=args.wait_ms
+    )
+
+    print(f"{'concurrencia':>12} {'por pregunta/s':>15} {'en lote/s':>10} {'x':>6}")
+    for concurrency in args.concurrency:
+        single_rate = await run(single, concurrency, args.total)
+        batch_rate = await run(batching.embed, concurrency, args.total)
+        print(f"{concurrency:>12} {single_rate:>15.1f} {batch_rate:>10.1f} {batch_rate / single_rate:>6.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--total", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=2, help="hilos del executor (EMBED_WORKERS)")
+    parser.add_argument("--max-batch", type=int, default=EMBED_BATCH_MAX)
+    parser.add_argument("--wait-ms", type=float, default=EMBED_BATCH_WAIT_MS)
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,121 @@
+# bench/bench_embed_backends.py
+"""
+Compara los backends de embeddings (torch, onnx, int8) sobre los chunks de data/:
+textos/s, RSS pico y deriva coseno frente a los vectores de torch. Cada backend
+corre en un proceso nuevo para que el RSS sea el suyo.
+
+Con --check sale con código 1 si algún backend supera la tolerancia
+(comprobación de paridad antes de cambiar EMBEDDING_BACKEND en producción).
+
+Uso (desde backend/):
+    python -m bench.bench_embed_backends --limit 2000 --check
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bench.common import process_rss_mb
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# deriva máxima admitida (1 - coseno) frente a torch
+TOLERANCE = {"onnx": 1e-4, "int8": 0.02}
+
+
+def corpus_texts(limit: int) -> list:
+    """Textos de los chunks de data/, PDF a PDF hasta llegar a `limit`"""
+    from ingest import PDF_DIR, get_file_chunks
+
+    texts = []
+    for pdf_file in sorted(PDF_DIR.glob("*.pdf")):
+        texts.extend(c["page_content"] for c in get_file_chunks(pdf_file))
+        if len(texts) >= limit:
+            break
+    return texts[:limit]
+
+
+def worker(backend: str, texts_path: str, out_path: str, batch_size: int) -> None:
+    """Se ejecuta en el proceso hijo: embebe el corpus y guarda vectores + métricas"""
+    from embeddings import get_base_embeddings
+
+    texts = json.loads(Path(texts_path).read_text(encoding="utf-8"))
+    start = time.perf_counter()
+    model = get_base_embeddings(backend)
+    model.embed_documents(texts[:8])  # calentamiento
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(model.embed_documents(texts[i : i + batch_size]))
+    seconds = time.perf_counter() - start
+
+    np.save(out_path, np.asarray(vectors, dtype=np.float32))
+    print(json.dumps({
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "texts_per_s": round(len(texts) / seconds, 1),
+        **process_rss_mb(os.getpid()),
+    }))
+
+
+def run_backend(backend: str, texts_path: str, out_path: str, batch_size: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "bench.bench_embed_backends", "--worker", backend,
+         "--texts", texts_path, "--out", out_path, "--batch-size", str(batch_size)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(args) -> int:
+    from embeddings import cosine_drift
+
+    texts = corpus_texts(args.limit)
+    print(f"{len(texts)} chunks de data/")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_path = str(Path(tmp) / "texts.json")
+        Path(texts_path).write_text(json.dumps(texts), encoding="utf-8")
+
+        results = {}
+        for backend in ["torch", *args.backends]:
+            out_path = str(Path(tmp) / f"{backend}.npy")
+            results[backend] = run_backend(backend, texts_path, out_path, args.batch_size)
+            results[backend]["vectors"] = out_path
+
+        reference = np.load(results["torch"]["vectors"])
+        print(f"{'backend':>8} {'carga s':>8} {'textos/s':>9} {'RSS pico MB':>12} {'deriva media':>13} {'deriva máx':>11}")
+        for backend, r in results.items():
+            drift = cosine_drift(reference, np.load(r["vectors"]))
+            ok = backend == "torch" or drift.max() <= TOLERANCE[backend]
+            failed |= not ok
+            print(
+                f"{backend:>8} {r['load_seconds']:>8.2f} {r['texts_per_s']:>9.1f} "
+                f"{r['peak_rss_mb'] or 0:>12.0f} {drift.mean():>13.2e} {drift.max():>11.2e}"
+                + ("" if ok else "  <-- supera la tolerancia")
+            )
+    return 1 if args.check and failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["onnx", "int8"])
+    parser.add_argument("--limit", type=int, default=2000, help="máximo de chunks del corpus")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--check", action="store_true", help="falla si la deriva supera la tolerancia")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--texts", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.worker, args.texts, args.out, args.batch_size)
+    else:
+        sys.exit(main(args))
@@ -0,0 +1,139 @@
+# bench/bench_excel.py
+"""
+Ingesta de un Excel grande: loader en streaming (excel.py) frente al camino
+anterior (UnstructuredExcelLoader + RecursiveCharacterTextSplitter). Genera un
+libro de indicadores sintético y mide en un proceso nuevo por loader el tiempo
+de lectura y troceo, filas/s, chunks, RSS pico y, con --embed, chunks/s al
+embeber por lotes.
+
+Uso (desde backend/):
+    python -m bench.bench_excel --rows 20000 --sheets 2
+    python -m bench.bench_excel --rows 20000 --embed --loaders stream
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.common import process_rss_mb
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+HEADER = ["Código", "Indicador", "Región", "Año", "Valor", "Unidad", "Fuente", "Observaciones"]
+REGIONS = ["Araba", "Bizkaia", "Gipuzkoa", "Navarra", "Total"]
+UNITS = ["%", "euros", "personas", "tasa por 1000"]
+
+
+def generate_workbook(path: str, rows: int, sheets: int, seed: int = 0) -> None:
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    for s in range(sheets):
+        ws = workbook.create_sheet(f"Indicadores {s + 1}")
+        ws.append(HEADER)
+        for i in range(rows):
+            ws.append([
+                f"IND-{s}-{i // 20:05d}",
+                f"Indicador {i // 20} de la serie {s}",
+                rng.choice(REGIONS),
+                2000 + i % 20,
+                round(rng.uniform(0, 1000), 2),
+                rng.choice(UNITS),
+                "Encuesta anual",
+                "" if rng.random() < 0.8 else "Dato provisional, pendiente de revisión",
+            ])
+    workbook.save(path)
+
+
+def load_stream(path: str) -> list:
+    from excel import iter_excel_chunks
+
+    return [text for text, _ in iter_excel_chunks(path, {"file_name": "bench.xlsx"})]
+
+
+def load_unstructured(path: str) -> list:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import UnstructuredExcelLoader
+
+    docs = UnstructuredExcelLoader(path, mode="elements").load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=150, add_start_index=True)
+    return [d.page_content for d in splitter.split_documents(docs)]
+
+
+LOADERS = {"stream": load_stream, "unstructured": load_unstructured}
+
+
+def worker(loader: str, path: str, rows: int, embed: bool, batch_size: int) -> None:
+    """Se ejecuta en el proceso hijo para que el RSS pico sea el del loader"""
+    start = time.perf_counter()
+    texts = LOADERS[loader](path)
+    load_seconds = time.perf_counter() - start
+    result = {
+        "loader": loader,
+        "load_seconds": round(load_seconds, 2),
+        "rows_per_s": round(rows / load_seconds, 1),
+        "chunks": len(texts),
+        "avg_chars": round(sum(len(t) for t in texts) / max(len(texts), 1)),
+        **process_rss_mb(os.getpid()),
+    }
+    if embed:
+        from embeddings import get_base_embeddings
+
+        model = get_base_embeddings()
+        model.embed_documents(texts[:8])  # calentamiento
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            model.embed_documents(texts[i : i + batch_size])
+        result["embed_chunks_per_s"] = round(len(texts) / (time.perf_counter() - start), 1)
+        result["peak_rss_mb"] = process_rss_mb(os.getpid())["peak_rss_mb"]
+    print(json.dumps(result))
+
+
+def run_loader(loader: str, path: str, rows: int, embed: bool, batch_size: int) -> dict:
+    cmd = [sys.executable, "-m", "bench.bench_excel", "--worker", loader, "--path", path,
+           "--rows", str(rows), "--batch-size", str(batch_size)]
+    if embed:
+        cmd.append("--embed")
+    out = subprocess.run(cmd, cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "indicadores.xlsx")
+        start = time.perf_counter()
+        generate_workbook(path, args.rows, args.sheets)
+        size_mb = os.path.getsize(path) / 2**20
+        total_rows = args.rows * args.sheets
+        print(f"libro: {total_rows} filas en {args.sheets} hojas, {size_mb:.1f} MB "
+              f"(generado en {time.perf_counter() - start:.1f} s)")
+
+        print(f"{'loader':>13} {'lectura s':>10} {'filas/s':>10} {'chunks':>8} {'chars/chunk':>12} "
+              f"{'RSS pico MB':>12} {'embed chunks/s':>15}")
+        for loader in args.loaders:
+            r = run_loader(loader, path, total_rows, args.embed, args.batch_size)
+            print(
+                f"{loader:>13} {r['load_seconds']:>10.2f} {r['rows_per_s']:>10.0f} {r['chunks']:>8} "
+                f"{r['avg_chars']:>12} {r['peak_rss_mb'] or 0:>12.0f} {r.get('embed_chunks_per_s', '-'):>15}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000, help="filas por hoja")
+    parser.add_argument("--sheets", type=int, default=2)
+    parser.add_argument("--loaders", nargs="+", choices=list(LOADERS), default=list(LOADERS))
+    parser.add_argument("--embed", action="store_true", help="mide también los embeddings por lotes")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.worker, args.path, args.rows, args.embed, args.batch_size)
+    else:
+        main(args)
@@ -0,0 +1,88 @@
+# bench/bench_hedge.py
+"""
+Cobertura de peticiones entre endpoints LLM con servidores falsos locales:
+un primario que se atasca en una fracción de las peticiones (FAKE_LLM_STALL_RATE)
+y un secundario más lento pero estable. Compara el primario solo (con su
+timeout) frente a HedgedLLM con los dos, en latencia p50/p95/p99 de la
+respuesta completa.
+
+Uso (desde backend/):
+    python -m bench.bench_hedge --requests 200 --stall-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from bench.common import drive
+from bench.run import wait_until_up
+from llm import Endpoint, HedgedLLM
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def start_fake(port: int, first_token_ms: float, stall_rate: float, stall_ms: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "FAKE_LLM_FIRST_TOKEN_DELAY_MS": str(first_token_ms),
+        "FAKE_LLM_TOKEN_DELAY_MS": "5",
+        "FAKE_LLM_TOKENS": "40",
+        "FAKE_LLM_STALL_RATE": str(stall_rate),
+        "FAKE_LLM_STALL_MS": str(stall_ms),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench.fake_llm:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+async def measure(llm: HedgedLLM, concurrency: int, total: int) -> dict:
+    async def request(i: int):
+        await llm.ainvoke(f"pregunta {i}")
+
+    return await drive(concurrency, total, request)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    parser.add_argument("--stall-ms", type=float, default=20000)
+    parser.add_argument("--timeout", type=float, default=30, help="timeout por endpoint (s)")
+    parser.add_argument("--port", type=int, default=9101)
+    args = parser.parse_args()
+
+    procs = [
+        start_fake(args.port, 150, args.stall_rate, args.stall_ms),
+        start_fake(args.port + 1, 400, 0, 0),
+    ]
+    try:
+        for port in (args.port, args.port + 1):
+            wait_until_up(f"http://127.0.0.1:{port}/v1/models")
+
+        def endpoint(name: str, port: int) -> Endpoint:
+            return Endpoint(name, f"http://127.0.0.1:{port}/v1", "fake", "bench", timeout=args.timeout)
+
+        single = HedgedLLM([endpoint("primary-only", args.port)])
+        hedged = HedgedLLM([endpoint("primary", args.port), endpoint("secondary", args.port + 1)])
+
+        print(f"{'modo':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>9} {'errores':>8} {'coberturas':>11}")
+        for name, llm in (("solo", single), ("cubierto", hedged)):
+            r = asyncio.run(measure(llm, args.concurrency, args.requests))
+            print(
+                f"{name:>10} {r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {r['p99_ms']:>9.0f} "
+                f"{r['errors']:>8} {llm.hedged:>11}"
+            )
+        for s in hedged.stats():
+            print(f"  {s['name']}: {s['wins']} victorias, p95 primer token {s['first_token_p95']} s")
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench/bench_ingest.py
+"""
+Benchmark de ingesta sobre backend/data/: modo serie vs pipeline paralelo.
+
+Cada modo se ejecuta en un subproceso propio, con un vector_db y una caché de
+embeddings vacíos en un directorio temporal, para medir docs/s, chunks/s y el
+pico de memoria (RSS) sin que un modo contamine al otro.
+
+Uso (desde backend/):
+    python -m bench.bench_ingest --workers 4 --batch-size 256
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import ingest
+from embeddings import MODEL_NAME, CachedEmbeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+
+def run_once(mode: str, workers: int, batch_size: int, pdf_dir: Path) -> dict:
+    base = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+    with tempfile.TemporaryDirectory() as tmp:
+        embeddings = CachedEmbeddings(base, MODEL_NAME, str(Path(tmp) / "embedding_cache.sqlite3"))
+        start = time.perf_counter()
+        stats = ingest.ingest_pdfs(
+            workers=workers if mode == "pipeline" else 0,
+            batch_size=batch_size,
+            pdf_dir=pdf_dir,
+            persist_directory=str(Path(tmp) / "vector_db"),
+            embeddings=embeddings,
+        )
+        elapsed = time.perf_counter() - start
+
+    # ru_maxrss está en KiB en Linux
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {
+        "mode": mode,
+        "workers": workers if mode == "pipeline" else 0,
+        "seconds": elapsed,
+        "docs": stats["docs"],
+        "chunks": stats["chunks"],
+        "docs_per_s": stats["docs"] / elapsed,
+        "chunks_per_s": stats["chunks"] / elapsed,
+        "peak_rss_mb": self_rss,
+        "peak_worker_rss_mb": children_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--pdf-dir", type=Path, default=ingest.PDF_DIR)
+    parser.add_argument("--mode", choices=["serial", "pipeline"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # subproceso: un solo modo, resultado en JSON por stdout
+        print(json.dumps(run_once(args.mode, args.workers, args.batch_size, args.pdf_dir)))
+        return
+
+    results = []
+    for mode in ("serial", "pipeline"):
+        out = subprocess.run(
+            [
+                sys.executable, "-m", "bench.bench_ingest", "--mode", mode,
+                "--workers", str(args.workers), "--batch-size", str(args.batch_size),
+                "--pdf-dir", str(args.pdf_dir),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    for r in results:
+        print(
+            f"{r['mode']:9s} workers={r['workers']:2d}  {r['seconds']:8.1f} s  "
+            f"{r['docs_per_s']:6.2f} docs/s  {r['chunks_per_s']:8.1f} chunks/s  "
+            f"RSS={r['peak_rss_mb']:.0f} MB (workers {r['peak_worker_rss_mb']:.0f} MB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
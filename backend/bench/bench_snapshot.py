@@ -0,0 +1,127 @@
+# bench/bench_snapshot.py
+"""
+Instantánea mmap (snapshot.py) frente al enfoque antiguo de api.py (un pickle
+cargado entero en cada worker): tiempo de carga, RSS y memoria privada por
+worker con varios workers a la vez, y latencia de búsqueda top-k.
+
+Uso (desde backend/):
+    python snapshot.py export
+    python -m bench.bench_snapshot --workers 4 --queries 200
+"""
+import argparse
+import multiprocessing as mp
+import pickle
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bench.common import percentile, process_rss_mb
+from snapshot import SNAPSHOT_DIR, Snapshot
+
+K = 5
+
+
+def private_mb(pid: int) -> float:
+    """Memoria no compartida con otros procesos (Private_Clean + Private_Dirty)"""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    total += int(line.split()[1])
+    except OSError:
+        return float("nan")
+    return total / 1024
+
+
+def write_pickle(snapshot: Snapshot, path: Path) -> None:
+    data = {
+        "vectors": np.asarray(snapshot.vectors, dtype=np.float32),
+        "records": [snapshot.record(i) for i in range(len(snapshot))],
+    }
+    with open(path, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def worker(mode: str, path: str, queries: np.ndarray, barrier, results) -> None:
+    import os
+
+    start = time.perf_counter()
+    if mode == "pickle":
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        vectors, records = data["vectors"], data["records"]
+
+        def search(q):
+            scores = vectors @ q
+            top = np.argpartition(-scores, K)[:K]
+            return [records[i] for i in top[np.argsort(-scores[top])]]
+    else:
+        snapshot = Snapshot(path)
+
+        def search(q):
+            return snapshot.search(q, K)
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        search(q)
+        latencies.append(time.perf_counter() - t)
+
+    # medir la memoria con todos los workers cargados a la vez
+    barrier.wait()
+    results.put({
+        "load_s": load_s,
+        "rss_mb": process_rss_mb(os.getpid())["rss_mb"],
+        "private_mb": private_mb(os.getpid()),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    })
+    barrier.wait()
+
+
+def run(mode: str, path: str, queries: np.ndarray, workers: int) -> dict:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, path, queries, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return {key: float(np.mean([r[key] for r in rows])) for key in rows[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", default=SNAPSHOT_DIR)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    snapshot = Snapshot(args.snapshot)
+    rng = np.random.default_rng(0)
+    # consultas realistas: vectores del propio índice con algo de ruido
+    picks = rng.integers(0, len(snapshot), args.queries)
+    queries = np.asarray(snapshot.vectors[picks], dtype=np.float32)
+    queries += rng.normal(0, 0.05, queries.shape).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = Path(tmp) / "vectorstore.pkl"
+        write_pickle(snapshot, pickle_path)
+        print(f"{len(snapshot)} chunks; pickle {pickle_path.stat().st_size / 2**20:.1f} MB, "
+              f"vectors.npy {(Path(args.snapshot) / 'vectors.npy').stat().st_size / 2**20:.1f} MB "
+              f"({snapshot.manifest['dtype']})")
+        print(f"{'formato':>8} {'carga s':>8} {'RSS MB':>8} {'privada MB':>11} {'p50 ms':>8} {'p95 ms':>8}  ({args.workers} workers)")
+        for mode, path in (("pickle", str(pickle_path)), ("mmap", args.snapshot)):
+            r = run(mode, path, queries, args.workers)
+            print(f"{mode:>8} {r['load_s']:>8.3f} {r['rss_mb']:>8.1f} {r['private_mb']:>11.1f} "
+                  f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench/bench_startup.py
+"""
+Arranque en frío del backend: tiempo de `import main`, tiempo hasta que
+/healthz responde (proceso vivo) y hasta que /readyz da 200 (modelo e índice
+calientes). Cada medida se repite --runs veces en procesos nuevos.
+
+Uso (desde backend/):
+    python -m bench.bench_startup --runs 3
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+ENV = {
+    **os.environ,
+    "CONVERSATION_STORE": "sqlite",
+    "SUPABASE_JWT_SECRET": os.getenv("SUPABASE_JWT_SECRET", "bench-secret"),
+    "OPENROUTER_API_KEY": os.getenv("OPENROUTER_API_KEY", "bench"),
+}
+
+
+def import_seconds() -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=ENV,
+        capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def time_to_ready(port: int, timeout: float = 300) -> tuple[float, float]:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=ENV,
+    )
+    live = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if live is None and httpx.get(f"http://127.0.0.1:{port}/healthz", timeout=1).status_code == 200:
+                    live = time.perf_counter() - start
+                if live is not None and httpx.get(f"http://127.0.0.1:{port}/readyz", timeout=1).status_code == 200:
+                    ready = time.perf_counter() - start
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    if ready is None:
+        raise SystemExit(f"El backend no estuvo listo en {timeout:.0f} s")
+    return live, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args()
+
+    imports = [import_seconds() for _ in range(args.runs)]
+    lives, readies = zip(*(time_to_ready(args.port) for _ in range(args.runs)))
+
+    print(f"import main       mediana {statistics.median(imports):6.2f} s  ({', '.join(f'{v:.2f}' for v in imports)})")
+    print(f"hasta /healthz    mediana {statistics.median(lives):6.2f} s")
+    print(f"hasta /readyz     mediana {statistics.median(readies):6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
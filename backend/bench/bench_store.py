@@ -0,0 +1,144 @@
+# bench/bench_store.py
+"""
+Coste por turno de /chat según la longitud de la conversación:
+read-modify-write del array `messages` (esquema antiguo) vs filas append-only
+(db.SQLiteConversationStore). Todo en SQLite en memoria, sin Supabase.
+
+También lanza turnos concurrentes sobre el mismo hilo para contar los
+mensajes perdidos con el esquema antiguo.
+
+Uso (desde backend/):
+    python -m bench.bench_store --turns 500
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from db import SQLiteConversationStore
+
+HISTORY_MESSAGES = 6
+SOURCES = [{"file": "5.2.pdf", "pages": "3, 4, 12"}, {"file": "AEF 2015.pdf", "pages": "21"}]
+ANSWER = "La medición del impacto social es un proceso iterativo de cinco pasos. " * 20
+
+
+class LegacyStore:
+    """Esquema anterior: una fila por conversación con el array JSON completo"""
+
+    def __init__(self):
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, user_id TEXT, messages TEXT)")
+        self._lock = threading.Lock()
+
+    def _read(self, cid, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages FROM conversations WHERE id = ? AND user_id = ?", (cid, user_id)
+            ).fetchone()
+        return json.loads(row[0])
+
+    def turn(self, cid, user_id, messages):
+        # /chat leía el historial y upsert_conversation lo volvía a leer antes de reescribirlo
+        self._read(cid, user_id)[-HISTORY_MESSAGES:]
+        current = self._read(cid, user_id)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE conversations SET messages = ? WHERE id = ? AND user_id = ?",
+                (json.dumps(current + messages, ensure_ascii=False), cid, user_id),
+            )
+            self._conn.commit()
+
+    def create(self, user_id):
+        cid = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute("INSERT INTO conversations VALUES (?, ?, '[]')", (cid, user_id))
+        return cid
+
+    def count(self, cid, user_id):
+        return len(self._read(cid, user_id))
+
+
+def turn_messages(i):
+    return [
+        {"role": "user", "content": f"Pregunta {i}"},
+        {"role": "assistant", "content": ANSWER, "sources": SOURCES},
+    ]
+
+
+async def bench_append(turns: int, checkpoints: set) -> dict:
+    store = SQLiteConversationStore(":memory:")
+    cid = await store.append_messages("u", turn_messages(0))
+    out = {}
+    for i in range(1, turns + 1):
+        start = time.perf_counter()
+        await store.recent_messages("u", cid, HISTORY_MESSAGES)
+        await store.append_messages("u", turn_messages(i), cid)
+        if i in checkpoints:
+            out[i] = (time.perf_counter() - start) * 1000
+    return out
+
+
+def bench_legacy(turns: int, checkpoints: set) -> dict:
+    store = LegacyStore()
+    cid = store.create("u")
+    out = {}
+    for i in range(1, turns + 1):
+        start = time.perf_counter()
+        store.turn(cid, "u", turn_messages(i))
+        if i in checkpoints:
+            out[i] = (time.perf_counter() - start) * 1000
+    return out
+
+
+async def lost_updates(concurrent: int) -> tuple[int, int]:
+    """Mensajes perdidos al lanzar `concurrent` turnos a la vez sobre el mismo hilo"""
+    legacy = LegacyStore()
+    cid = legacy.create("u")
+    # pequeña pausa entre lectura y escritura, como la latencia de red real
+    original_read = legacy._read
+
+    def slow_read(*args):
+        result = original_read(*args)
+        time.sleep(0.001)
+        return result
+
+    legacy._read = slow_read
+    await asyncio.gather(
+        *(asyncio.to_thread(legacy.turn, cid, "u", turn_messages(i)) for i in range(concurrent))
+    )
+    legacy_lost = 2 * concurrent - legacy.count(cid, "u")
+
+    store = SQLiteConversationStore(":memory:")
+    cid = await store.append_messages("u", [])
+    await asyncio.gather(*(store.append_messages("u", turn_messages(i), cid) for i in range(concurrent)))
+    conv = await store.get_conversation("u", cid)
+    append_lost = 2 * concurrent - conv["message_count"]
+    return legacy_lost, append_lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--concurrent", type=int, default=20)
+    args = parser.parse_args()
+
+    checkpoints = {n for n in (1, 10, 50, 100, 250, 500, 1000, 2000) if n <= args.turns}
+    legacy = bench_legacy(args.turns, checkpoints)
+    append = asyncio.run(bench_append(args.turns, checkpoints))
+
+    print("turno   read-modify-write   append-only   (ms por turno)")
+    for n in sorted(checkpoints):
+        print(f"{n:5d}   {legacy[n]:17.3f}   {append[n]:11.3f}")
+
+    legacy_lost, append_lost = asyncio.run(lost_updates(args.concurrent))
+    print(
+        f"\n{args.concurrent} turnos concurrentes: mensajes perdidos "
+        f"read-modify-write={legacy_lost}  append-only={append_lost}"
+    )
+
+
+if __name__ == "__main__":
+    main()
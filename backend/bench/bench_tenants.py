@@ -0,0 +1,94 @@
+# bench/bench_tenants.py
+"""
+Latencia de búsqueda a medida que otros usuarios suben documentos:
+colección única (como antes, todo junto) frente a TenantIndex (base + colección
+del usuario). Usa vectores aleatorios de la misma dimensión que MiniLM, sin
+cargar el modelo.
+
+Uso (desde backend/):
+    python -m bench.bench_tenants --others 0 20000 100000 --queries 200
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from bench.common import percentile
+from vectorstore import TenantIndex, query_collection
+
+DIM = 384
+K = 10
+
+
+def random_vectors(rng, n: int) -> np.ndarray:
+    v = rng.standard_normal((n, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def add(vectordb, rng, n: int, prefix: str, owner: str) -> None:
+    collection = vectordb._collection
+    for start in range(0, n, 5000):
+        size = min(5000, n - start)
+        collection.add(
+            ids=[f"{prefix}-{start + i}" for i in range(size)],
+            embeddings=random_vectors(rng, size).tolist(),
+            documents=[f"{prefix} chunk {start + i}" for i in range(size)],
+            metadatas=[{"owner": owner, "corpus_id": "personal", "file_name": prefix}] * size,
+        )
+
+
+def timed(fn, queries) -> dict:
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        latencies.append(time.perf_counter() - start)
+    return {"p50_ms": percentile(latencies, 50) * 1000, "p95_ms": percentile(latencies, 95) * 1000}
+
+
+def main():
+    from langchain_community.vectorstores import Chroma
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base", type=int, default=5000, help="chunks del corpus base")
+    parser.add_argument("--mine", type=int, default=500, help="chunks subidos por el usuario que pregunta")
+    parser.add_argument("--others", type=int, nargs="+", default=[0, 20000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = random_vectors(rng, args.queries).tolist()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Chroma(persist_directory=f"{tmp}/tenants")
+        shared = Chroma(collection_name="all_in_one", client=base._client)
+        index = TenantIndex(base, None)
+
+        add(base, rng, args.base, "base", "")
+        add(shared, rng, args.base, "base", "")
+        add(index.collection("me", create=True), rng, args.mine, "mine", "me")
+        add(shared, rng, args.mine, "mine", "me")
+
+        print(f"{'otros':>8} {'única p50':>10} {'única p95':>10} {'tenant p50':>11} {'tenant p95':>11}")
+        loaded = 0
+        for others in sorted(args.others):
+            extra = others - loaded
+            if extra > 0:
+                # los demás usuarios suben a sus colecciones (y, en el esquema antiguo, a la única)
+                per_user = max(1, extra // 10)
+                for u in range(10):
+                    add(index.collection(f"other{loaded}-{u}", create=True), rng, per_user, f"o{loaded}-{u}", f"other{u}")
+                    add(shared, rng, per_user, f"o{loaded}-{u}", f"other{u}")
+                loaded = others
+
+            single = timed(lambda q: query_collection(shared, [q], K), queries)
+            tenant = timed(lambda q: index.search("me", q, K), queries)
+            print(
+                f"{others:>8} {single['p50_ms']:>10.2f} {single['p95_ms']:>10.2f} "
+                f"{tenant['p50_ms']:>11.2f} {tenant['p95_ms']:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench/common.py
+"""Utilidades compartidas por los scripts de benchmark"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+
+import jwt
+
+
+def make_token(sub: str = "bench-user") -> str:
+    """Firma un JWT como los de Supabase con SUPABASE_JWT_SECRET"""
+    secret = os.getenv("SUPABASE_JWT_SECRET")
+    if not secret:
+        raise SystemExit("Define SUPABASE_JWT_SECRET para firmar el token de prueba")
+    payload = {
+        "sub": sub,
+        "aud": "authenticated",
+        "role": "authenticated",
+        "exp": int(time.time()) + 3600,
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def drive(concurrency: int, total: int, request: Callable[[int], Awaitable[None]]) -> dict:
+    """
+    Ejecuta `request(i)` para i en [0, total) con `concurrency` trabajadores
+    y devuelve throughput y latencias p50/p95/p99.
+    """
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await request(i)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def process_rss_mb(pid: int) -> dict:
+    """RSS actual y pico (VmHWM) de un proceso, leídos de /proc (solo Linux)"""
+    out = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    out["rss_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    out["peak_rss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return out
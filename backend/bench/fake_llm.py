@@ -0,0 +1,105 @@
+# bench/fake_llm.py
+"""
+Servidor compatible con la API de OpenAI para pruebas y benchmarks locales.
+
+Responde a /v1/chat/completions (normal y con stream=true) con un texto fijo,
+emitiendo un token cada FAKE_LLM_TOKEN_DELAY_MS milisegundos. Para simular un
+proveedor con mala cola de latencia, FAKE_LLM_STALL_RATE es la fracción de
+peticiones que se quedan FAKE_LLM_STALL_MS sin dar el primer token, y
+FAKE_LLM_FAIL_RATE la fracción que responde 503.
+
+Uso (desde backend/):
+    FAKE_LLM_TOKEN_DELAY_MS=30 uvicorn bench.fake_llm:app --port 9000
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/v1 OPENROUTER_API_KEY=x uvicorn main:app
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TOKEN_DELAY_MS = float(os.getenv("FAKE_LLM_TOKEN_DELAY_MS", "30"))
+FIRST_TOKEN_DELAY_MS = float(os.getenv("FAKE_LLM_FIRST_TOKEN_DELAY_MS", "200"))
+N_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "120"))
+STALL_RATE = float(os.getenv("FAKE_LLM_STALL_RATE", "0"))
+STALL_MS = float(os.getenv("FAKE_LLM_STALL_MS", "30000"))
+FAIL_RATE = float(os.getenv("FAKE_LLM_FAIL_RATE", "0"))
+
+ANSWER_WORDS = (
+    "La medición del impacto social es un proceso iterativo de cinco pasos "
+    "según la guía de la EVPA: establecimiento de objetivos, análisis de los "
+    "agentes involucrados, medición de resultados, verificación y valoración, "
+    "y seguimiento y presentación de resultados."
+).split()
+
+app = FastAPI(title="Fake OpenAI")
+
+
+def fake_tokens(n: int) -> list[str]:
+    return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(n)]
+
+
+def first_token_delay() -> float:
+    """Segundos hasta el primer token, con los atascos inyectados"""
+    if random.random() < STALL_RATE:
+        return STALL_MS / 1000
+    return FIRST_TOKEN_DELAY_MS / 1000
+
+
+def completion_chunk(cid: str, model: str, delta: dict, finish_reason=None) -> str:
+    body = {
+        "id": cid,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(body)}\n\n"
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": "fake", "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    cid = f"chatcmpl-{uuid.uuid4().hex}"
+    tokens = fake_tokens(N_TOKENS)
+    if random.random() < FAIL_RATE:
+        return JSONResponse(status_code=503, content={"error": {"message": "fake overload"}})
+    delay = first_token_delay()
+
+    if body.get("stream"):
+        async def stream():
+            await asyncio.sleep(delay)
+            yield completion_chunk(cid, model, {"role": "assistant", "content": ""})
+            for tok in tokens:
+                yield completion_chunk(cid, model, {"content": tok})
+                await asyncio.sleep(TOKEN_DELAY_MS / 1000)
+            yield completion_chunk(cid, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    await asyncio.sleep(delay + TOKEN_DELAY_MS * len(tokens) / 1000)
+    return {
+        "id": cid,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+    }
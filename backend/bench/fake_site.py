@@ -0,0 +1,141 @@
+# bench/fake_site.py
+"""
+Sitio web local para probar el crawler sin salir a Internet.
+
+Sirve FAKE_SITE_PAGES páginas HTML en árbol (cada una enlaza a FAKE_SITE_FANOUT
+hijas, a la portada y a un dominio externo que no se debe seguir), con ETag y
+Last-Modified, responde 304 a las peticiones condicionales y tarda
+FAKE_SITE_DELAY_MS en cada respuesta. touch() cambia el texto de unas páginas
+y remove() hace que respondan 404.
+
+Uso (desde backend/):
+    python -m bench.fake_site --pages 200 --port 9100
+"""
+import argparse
+import os
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Set
+
+PAGES = int(os.getenv("FAKE_SITE_PAGES", "200"))
+FANOUT = int(os.getenv("FAKE_SITE_FANOUT", "5"))
+DELAY_MS = float(os.getenv("FAKE_SITE_DELAY_MS", "20"))
+
+PARAGRAPH = (
+    "La guía describe cómo medir el impacto social de un proyecto: objetivos, agentes "
+    "involucrados, resultados, verificación y seguimiento. "
+)
+
+
+class FakeSite:
+    def __init__(self, pages: int = PAGES, fanout: int = FANOUT, delay_ms: float = DELAY_MS, validators: bool = True):
+        self.pages = pages
+        self.fanout = fanout
+        self.delay_ms = delay_ms
+        # sin validadores el servidor responde siempre 200 (el crawler compara hashes)
+        self.validators = validators
+        self.versions: Dict[int, int] = {i: 0 for i in range(pages)}
+        self.modified: Dict[int, float] = {i: time.time() for i in range(pages)}
+        self.removed: Set[int] = set()
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def touch(self, pages: Iterable[int]) -> None:
+        with self._lock:
+            for i in pages:
+                self.versions[i] += 1
+                self.modified[i] = time.time()
+
+    def remove(self, pages: Iterable[int]) -> None:
+        with self._lock:
+            self.removed.update(pages)
+
+    def etag(self, i: int) -> str:
+        return f'"{i}-{self.versions[i]}"'
+
+    def html(self, i: int) -> str:
+        children = range(i * self.fanout + 1, min((i + 1) * self.fanout + 1, self.pages))
+        links = "".join(f'<li><a href="/page/{c}.html#top">Página {c}</a></li>' for c in children)
+        body = "".join(
+            f"<p>Sección {s} de la página {i} (versión {self.versions[i]}). {PARAGRAPH}</p>" for s in range(6)
+        )
+        return (
+            f"<html><head><title>Página {i}</title><style>p {{}}</style></head><body>"
+            f'<nav><a href="/">Inicio</a> <a href="https://externo.example.com/">Externo</a></nav>'
+            f"<h1>Página {i}</h1>{body}<ul>{links}</ul><script>var x = 1;</script></body></html>"
+        )
+
+    def page_index(self, path: str):
+        if path in ("/", "/index.html"):
+            return 0
+        if path.startswith("/page/") and path.endswith(".html"):
+            try:
+                i = int(path[len("/page/") : -len(".html")])
+            except ValueError:
+                return None
+            return i if 0 <= i < self.pages and i not in self.removed else None
+        return None
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive: el crawler reutiliza conexiones
+
+            def do_GET(self):
+                time.sleep(site.delay_ms / 1000)
+                with site._lock:
+                    site.requests += 1
+                    i = site.page_index(self.path.split("?")[0])
+                    if i is None:
+                        self._send(404, b"no encontrada", {})
+                        return
+                    headers = {}
+                    if site.validators:
+                        etag = site.etag(i)
+                        headers = {"ETag": etag, "Last-Modified": formatdate(site.modified[i], usegmt=True)}
+                        if self.headers.get("If-None-Match") == etag:
+                            site.not_modified += 1
+                            self._send(304, b"", headers)
+                            return
+                    body = site.html(i).encode("utf-8")
+                self._send(200, body, {**headers, "Content-Type": "text/html; charset=utf-8"})
+
+            def _send(self, status: int, body: bytes, headers: Dict[str, str]) -> None:
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def serve(self, port: int = 0) -> ThreadingHTTPServer:
+        """Arranca el servidor en un hilo; port=0 elige uno libre (server.server_port)"""
+        server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=PAGES)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--no-validators", action="store_true", help="sin ETag ni Last-Modified")
+    args = parser.parse_args()
+    site = FakeSite(pages=args.pages, validators=not args.no_validators)
+    server = site.serve(args.port)
+    print(f"http://127.0.0.1:{server.server_port}/ ({args.pages} páginas)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
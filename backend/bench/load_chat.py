@@ -0,0 +1,64 @@
+# bench/load_chat.py
+"""
+Prueba de carga de /chat con N usuarios concurrentes.
+
+Lanza `--requests` peticiones por nivel de concurrencia y muestra
+throughput (req/s) y latencias p50/p95. Para comparar el /chat síncrono
+con el asíncrono, ejecútalo contra el backend de cada commit con el mismo
+LLM falso (bench/fake_llm.py) y etiqueta cada corrida con --label.
+
+Uso (desde backend/):
+    python -m bench.load_chat --url http://127.0.0.1:8000 --concurrency 1 10 50 100
+"""
+import argparse
+import asyncio
+
+import httpx
+
+from bench.common import drive, make_token
+
+QUESTIONS = [
+    "¿Qué es el paso 3 de la medición del impacto?",
+    "¿Cómo se analizan los agentes involucrados?",
+    "¿Qué indicadores propone la EVPA?",
+    "¿Cómo se verifica y valora el impacto?",
+]
+
+
+async def run_level(url: str, token: str, concurrency: int, total: int, path: str) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with httpx.AsyncClient(headers=headers, timeout=300, limits=limits) as client:
+
+        async def request(i: int):
+            res = await client.post(f"{url}{path}", json={"question": QUESTIONS[i % len(QUESTIONS)]})
+            res.raise_for_status()
+
+        return await drive(concurrency, total, request)
+
+
+async def main_async(args):
+    token = make_token()
+    print(f"[{args.label}] {args.url}{args.path}")
+    for c in args.concurrency:
+        total = max(args.requests, c)
+        r = await run_level(args.url, token, c, total, args.path)
+        print(
+            f"  c={r['concurrency']:4d}  n={r['requests']:5d}  err={r['errors']:3d}  "
+            f"{r['throughput_rps']:7.2f} req/s  p50={r['p50_ms']:8.1f} ms  p95={r['p95_ms']:8.1f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/chat")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--label", default="actual")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# bench/run.py
+"""
+Suite de benchmark reproducible, sin red ni Supabase.
+
+Arranca (salvo que se pase --url) un LLM falso compatible con OpenAI
+(bench/fake_llm.py) y el backend con CONVERSATION_STORE=sqlite en memoria,
+sobre una copia temporal de vector_db/. Después:
+
+- /chat con las preguntas fijas de bench/questions.json
+- GET /conversations
+- /upload-pdf con los PDFs de data/ (ingesta en chunks/s según los jobs)
+
+para cada nivel de concurrencia, y guarda los resultados (p50/p95/p99,
+throughput, RSS del servidor) en bench/results/<commit>-<fecha>.json.
+Con --compare <json> muestra la diferencia frente a una ejecución anterior.
+
+Uso (desde backend/):
+    python -m bench.run --concurrency 1 8 32 --token-delay-ms 20
+    python -m bench.run --compare bench/results/abc1234-20260101T120000.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from bench.common import drive, make_token, process_rss_mb
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+QUESTIONS = json.loads((Path(__file__).parent / "questions.json").read_text(encoding="utf-8"))
+RESULTS_DIR = Path(__file__).parent / "results"
+BENCH_JWT_SECRET = "bench-secret"
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def wait_until_up(url: str, timeout: float = 300) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"{url} no respondió en {timeout:.0f} s")
+
+
+class LocalStack:
+    """LLM falso + backend en subprocesos, con datos en un directorio temporal"""
+
+    def __init__(self, port: int, llm_port: int, token_delay_ms: float, first_token_ms: float, answer_cache: bool):
+        self.answer_cache = answer_cache
+        self.port = port
+        self.llm_port = llm_port
+        self.token_delay_ms = token_delay_ms
+        self.first_token_ms = first_token_ms
+        self.procs: list[subprocess.Popen] = []
+        self.tmp = tempfile.TemporaryDirectory(prefix="bench-")
+        self.server_pid = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        tmp = Path(self.tmp.name)
+        shutil.copytree(BACKEND_DIR / "vector_db", tmp / "vector_db")
+
+        env = {
+            **os.environ,
+            "FAKE_LLM_TOKEN_DELAY_MS": str(self.token_delay_ms),
+            "FAKE_LLM_FIRST_TOKEN_DELAY_MS": str(self.first_token_ms),
+            "OPENROUTER_BASE_URL": f"http://127.0.0.1:{self.llm_port}/v1",
+            "OPENROUTER_API_KEY": "bench",
+            "CONVERSATION_STORE": "sqlite",
+            "CONVERSATION_DB_PATH": ":memory:",
+            "SUPABASE_JWT_SECRET": BENCH_JWT_SECRET,
+            "VECTOR_DB_DIR": str(tmp / "vector_db"),
+            "EMBEDDING_CACHE_PATH": str(tmp / "vector_db" / "embedding_cache.sqlite3"),
+            "UPLOAD_REGISTRY_PATH": str(tmp / "uploads_manifest.json"),
+            "UPLOAD_DIR": str(tmp),
+        }
+        if not self.answer_cache:
+            # umbral imposible: todas las preguntas llegan al LLM
+            env["SEMANTIC_CACHE_THRESHOLD"] = "2"
+        os.environ["SUPABASE_JWT_SECRET"] = BENCH_JWT_SECRET
+
+        self.procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "bench.fake_llm:app", "--port", str(self.llm_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        ))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        )
+        self.procs.append(server)
+        self.server_pid = server.pid
+
+        wait_until_up(f"http://127.0.0.1:{self.llm_port}/v1/models")
+        wait_until_up(f"{self.url}/readyz")
+        return self
+
+    def __exit__(self, *exc):
+        for p in self.procs:
+            p.terminate()
+        for p in self.procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        self.tmp.cleanup()
+
+
+async def bench_chat(client: httpx.AsyncClient, url: str, concurrency: int, total: int) -> dict:
+    async def request(i: int):
+        res = await client.post(f"{url}/chat", json={"question": QUESTIONS[i % len(QUESTIONS)]})
+        res.raise_for_status()
+
+    return await drive(concurrency, total, request)
+
+
+async def bench_conversations(client: httpx.AsyncClient, url: str, concurrency: int, total: int) -> dict:
+    async def request(i: int):
+        res = await client.get(f"{url}/conversations")
+        res.raise_for_status()
+
+    return await drive(concurrency, total, request)
+
+
+async def wait_job(client: httpx.AsyncClient, url: str, job_id: str) -> dict:
+    while True:
+        res = await client.get(f"{url}/jobs/{job_id}")
+        res.raise_for_status()
+        job = res.json()["job"]
+        if job["status"] in ("done", "error"):
+            return job
+        await asyncio.sleep(0.2)
+
+
+async def bench_uploads(client: httpx.AsyncClient, url: str, concurrency: int, pdfs: list[Path]) -> dict:
+    jobs: list[dict] = []
+
+    async def request(i: int):
+        pdf = pdfs[i]
+        with open(pdf, "rb") as f:
+            res = await client.post(
+                f"{url}/upload-pdf", files={"file": (pdf.name, f.read(), "application/pdf")}
+            )
+        res.raise_for_status()
+        job = await wait_job(client, url, res.json()["job_id"])
+        if job["status"] != "done":
+            raise RuntimeError(job["error"])
+        jobs.append(job)
+
+    result = await drive(concurrency, len(pdfs), request)
+    ingest_seconds = sum(j["finished_at"] - j["started_at"] for j in jobs)
+    chunks = sum(j["chunks_processed"] for j in jobs)
+    result["chunks"] = chunks
+    result["ingest_chunks_per_s"] = chunks / ingest_seconds if ingest_seconds else 0.0
+    return result
+
+
+async def run_suite(url: str, args, server_pid) -> dict:
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    pdfs = sorted((BACKEND_DIR / "data").glob("*.pdf"), key=lambda p: p.stat().st_size)[: args.upload_files]
+    results = {"chat": [], "conversations": [], "upload": None}
+
+    max_c = max(args.concurrency)
+    limits = httpx.Limits(max_connections=max_c, max_keepalive_connections=max_c)
+    async with httpx.AsyncClient(headers=headers, timeout=600, limits=limits) as client:
+        for c in args.concurrency:
+            r = await bench_chat(client, url, c, max(args.requests, c))
+            r.update(process_rss_mb(server_pid) if server_pid else {})
+            results["chat"].append(r)
+            print_row("chat", r)
+
+        for c in args.concurrency:
+            r = await bench_conversations(client, url, c, max(args.requests, c))
+            results["conversations"].append(r)
+            print_row("conversations", r)
+
+        if pdfs:
+            r = await bench_uploads(client, url, min(max_c, len(pdfs)), pdfs)
+            r.update(process_rss_mb(server_pid) if server_pid else {})
+            results["upload"] = r
+            print_row("upload-pdf", r)
+            print(f"  ingesta: {r['chunks']} chunks, {r['ingest_chunks_per_s']:.1f} chunks/s")
+
+    return results
+
+
+def print_row(name: str, r: dict) -> None:
+    rss = f"  RSS={r['rss_mb']:.0f} MB" if r.get("rss_mb") else ""
+    print(
+        f"{name:14s} c={r['concurrency']:3d} n={r['requests']:4d} err={r['errors']:3d}  "
+        f"{r['throughput_rps']:8.2f} req/s  p50={r['p50_ms']:8.1f}  p95={r['p95_ms']:8.1f}  "
+        f"p99={r['p99_ms']:8.1f} ms{rss}"
+    )
+
+
+def compare(current: dict, previous: dict) -> None:
+    print(f"\nComparación con {previous['commit']} ({previous['timestamp']}):")
+    for scenario in ("chat", "conversations"):
+        before = {r["concurrency"]: r for r in previous["results"].get(scenario, [])}
+        for r in current["results"][scenario]:
+            old = before.get(r["concurrency"])
+            if not old:
+                continue
+            print(
+                f"  {scenario:14s} c={r['concurrency']:3d}  p95 {old['p95_ms']:8.1f} -> {r['p95_ms']:8.1f} ms  "
+                f"throughput {old['throughput_rps']:7.2f} -> {r['throughput_rps']:7.2f} req/s"
+            )
+    old_up, new_up = previous["results"].get("upload"), current["results"].get("upload")
+    if old_up and new_up:
+        print(
+            f"  ingesta        {old_up['ingest_chunks_per_s']:.1f} -> {new_up['ingest_chunks_per_s']:.1f} chunks/s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Usar un backend ya arrancado en lugar de levantar uno local")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="Peticiones por nivel de concurrencia")
+    parser.add_argument("--upload-files", type=int, default=3, help="Nº de PDFs de data/ (los más pequeños)")
+    parser.add_argument("--token-delay-ms", type=float, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-port", type=int, default=8766)
+    parser.add_argument("--answer-cache", action="store_true", help="Dejar activa la caché semántica")
+    parser.add_argument("--compare", type=Path, help="JSON de una ejecución anterior")
+    parser.add_argument("--output", type=Path, help="Ruta del JSON de resultados")
+    args = parser.parse_args()
+
+    if args.url:
+        results = asyncio.run(run_suite(args.url, args, None))
+    else:
+        with LocalStack(
+            args.port, args.llm_port, args.token_delay_ms, args.first_token_ms, args.answer_cache
+        ) as stack:
+            results = asyncio.run(run_suite(stack.url, args, stack.server_pid))
+
+    now = datetime.now(timezone.utc)
+    report = {
+        "commit": git_commit(),
+        "timestamp": now.isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "upload_files": args.upload_files,
+            "token_delay_ms": args.token_delay_ms,
+            "first_token_ms": args.first_token_ms,
+            "answer_cache": args.answer_cache,
+            "external_url": args.url,
+        },
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"{report['commit']}-{now.strftime('%Y%m%dT%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nResultados guardados en {output}")
+
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
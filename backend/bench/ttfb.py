@@ -0,0 +1,69 @@
+# bench/ttfb.py
+"""
+Compara el tiempo hasta el primer byte (TTFB) de /chat y /chat/stream.
+
+Requiere el backend arrancado contra bench/fake_llm.py (ver su docstring).
+
+Uso (desde backend/):
+    python -m bench.ttfb --url http://127.0.0.1:8000 --runs 5
+"""
+import argparse
+import statistics
+import time
+
+import httpx
+
+from bench.common import make_token
+
+QUESTION = "¿Qué es el paso 3 de la medición del impacto?"
+
+
+def measure_chat(client: httpx.Client, url: str) -> tuple[float, float]:
+    start = time.perf_counter()
+    with client.stream("POST", f"{url}/chat", json={"question": QUESTION}) as res:
+        res.raise_for_status()
+        ttfb = None
+        for _ in res.iter_bytes():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+    return ttfb, time.perf_counter() - start
+
+
+def measure_stream(client: httpx.Client, url: str) -> tuple[float, float, float]:
+    """Devuelve (ttfb, primer token, total)"""
+    start = time.perf_counter()
+    ttfb = first_token = None
+    with client.stream("POST", f"{url}/chat/stream", json={"question": QUESTION}) as res:
+        res.raise_for_status()
+        for line in res.iter_lines():
+            now = time.perf_counter() - start
+            if ttfb is None:
+                ttfb = now
+            if first_token is None and line.startswith("event: token"):
+                first_token = now
+    return ttfb, first_token, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    with httpx.Client(headers=headers, timeout=120) as client:
+        chat = [measure_chat(client, args.url) for _ in range(args.runs)]
+        stream = [measure_stream(client, args.url) for _ in range(args.runs)]
+
+    def med(values):
+        return statistics.median(v for v in values if v is not None) * 1000
+
+    print(f"/chat         ttfb={med(c[0] for c in chat):8.1f} ms  total={med(c[1] for c in chat):8.1f} ms")
+    print(
+        f"/chat/stream  ttfb={med(s[0] for s in stream):8.1f} ms  "
+        f"primer token={med(s[1] for s in stream):8.1f} ms  total={med(s[2] for s in stream):8.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
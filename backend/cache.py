@@ -0,0 +1,112 @@
+# cache.py
+"""Caché semántica de respuestas: evita repetir la llamada al LLM para preguntas casi iguales"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+def doc_set_key(docs: Iterable[Any]) -> str:
+    """Huella del conjunto de documentos recuperados (independiente del orden)"""
+    digests = []
+    for d in docs:
+        meta = d.metadata or {}
+        h = hashlib.sha1()
+        h.update(str(meta.get("file_name", meta.get("source", ""))).encode("utf-8"))
+        h.update(b"\0")
+        h.update(d.page_content.encode("utf-8"))
+        digests.append(h.hexdigest())
+    return hashlib.sha1("|".join(sorted(digests)).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    vector: np.ndarray
+    doc_key: str
+    answer: str
+    sources: List[Dict[str, str]]
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class SemanticCache:
+    """
+    LRU con TTL indexada por el embedding de la pregunta.
+
+    Hay acierto si la similitud coseno supera `threshold` y el conjunto de
+    documentos recuperados es exactamente el mismo que el de la entrada guardada.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def lookup(self, vector, doc_key: str) -> Optional[CacheEntry]:
+        q = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_sim = None, self.threshold
+            for entry_id, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[entry_id]
+                    continue
+                if entry.doc_key != doc_key:
+                    continue
+                sim = float(np.dot(q, entry.vector))
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]
+
+    def store(self, vector, doc_key: str, answer: str, sources: List[Dict[str, str]]) -> None:
+        entry = CacheEntry(self._normalize(vector), doc_key, answer, sources)
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Vacía la caché (p.ej. cuando cambia el corpus)"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+                "threshold": self.threshold,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
@@ -0,0 +1,203 @@
+# context.py
+"""
+Montaje del contexto del prompt: fusiona chunks vecinos o solapados de la misma
+página, descarta casi duplicados (MMR) y rellena un presupuesto de tokens.
+Sustituye al "stuff" de k chunks tal cual.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain.schema import Document
+
+from metrics import Histogram, register_histogram
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# por encima de esta similitud entre fragmentos, el segundo se considera duplicado
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.95"))
+
+# los splitters usan chunk_overlap=150 caracteres; se busca algo más por si acaso
+MAX_TEXT_OVERLAP = 300
+MIN_TEXT_OVERLAP = 20
+
+SEPARATOR = "\n\n"
+
+CONTEXT_TOKENS = register_histogram(
+    Histogram(
+        "rag_context_tokens",
+        "Tokens de contexto por petición (packed: enviados; saved: ahorrados frente a los k chunks)",
+        "kind",
+        buckets=(0, 50, 100, 250, 500, 1000, 1500, 2000, 3000, 5000, 8000),
+    )
+)
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens con tiktoken (cl100k) si está instalado; si no, ~4 caracteres por token"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class Fragment:
+    """Uno o varios chunks fusionados de la misma página"""
+    text: str
+    metadata: Dict[str, Any]
+    vectors: List[np.ndarray] = field(default_factory=list)
+    rank: int = 0  # mejor posición en la búsqueda entre sus chunks
+
+    @property
+    def vector(self) -> np.ndarray:
+        v = np.mean(self.vectors, axis=0)
+        return v / (np.linalg.norm(v) or 1.0)
+
+
+@dataclass
+class PackedContext:
+    docs: List[Document]
+    tokens: int
+    tokens_saved: int
+    chunks_in: int
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "chunks_in": self.chunks_in,
+            "fragments": len(self.docs),
+            "tokens": self.tokens,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+def page_key(meta: Dict[str, Any]) -> tuple:
+    return (meta.get("file_name", meta.get("source")), meta.get("page_number"))
+
+
+def text_overlap(a: str, b: str) -> int:
+    """Longitud del sufijo de `a` que es prefijo de `b` (0 si no solapan)"""
+    for size in range(min(len(a), len(b), MAX_TEXT_OVERLAP), MIN_TEXT_OVERLAP - 1, -1):
+        if a.endswith(b[:size]):
+            return size
+    return 0
+
+
+def try_merge(a: Fragment, b: Fragment) -> Optional[Fragment]:
+    """Une dos fragmentos de la misma página si uno contiene al otro, son contiguos o solapan"""
+    merged = None
+    if b.text in a.text:
+        merged = a.text
+    elif a.text in b.text:
+        merged = b.text
+    else:
+        # con start_index (subidas nuevas) la contigüidad es exacta
+        sa, sb = a.metadata.get("start_index"), b.metadata.get("start_index")
+        if isinstance(sa, int) and isinstance(sb, int):
+            first, second, start = (a, b, sa) if sa <= sb else (b, a, sb)
+            offset = abs(sb - sa)
+            if offset <= len(first.text):
+                merged = first.text + second.text[len(first.text) - offset :]
+                metadata = {**first.metadata, "start_index": start}
+                return Fragment(merged, metadata, a.vectors + b.vectors, min(a.rank, b.rank))
+        for first, second in ((a, b), (b, a)):
+            size = text_overlap(first.text, second.text)
+            if size:
+                merged = first.text + second.text[size:]
+                break
+    if merged is None:
+        return None
+    return Fragment(merged, dict(a.metadata), a.vectors + b.vectors, min(a.rank, b.rank))
+
+
+def merge_neighbours(fragments: List[Fragment]) -> List[Fragment]:
+    """Fusiona, página a página, los fragmentos que se solapan o son contiguos"""
+    by_page: Dict[tuple, List[Fragment]] = {}
+    for f in fragments:
+        by_page.setdefault(page_key(f.metadata), []).append(f)
+
+    out: List[Fragment] = []
+    for group in by_page.values():
+        changed = True
+        while changed:
+            changed = False
+            for i in range(len(group)):
+                for j in range(i + 1, len(group)):
+                    merged = try_merge(group[i], group[j])
+                    if merged is not None:
+                        group[i] = merged
+                        del group[j]
+                        changed = True
+                        break
+                if changed:
+                    break
+        out.extend(group)
+    return sorted(out, key=lambda f: f.rank)
+
+
+def mmr_order(query: np.ndarray, fragments: List[Fragment], lambda_: float) -> List[Fragment]:
+    """Orden MMR; descarta los fragmentos casi idénticos a uno ya elegido"""
+    if not fragments:
+        return []
+    matrix = np.stack([f.vector for f in fragments])
+    relevance = matrix @ (query / (np.linalg.norm(query) or 1.0))
+    chosen: List[int] = []
+    remaining = list(range(len(fragments)))
+    while remaining:
+        if chosen:
+            redundancy = (matrix[remaining] @ matrix[chosen].T).max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy
+        best = int(np.argmax(scores))
+        idx = remaining.pop(best)
+        if chosen and redundancy[best] >= CONTEXT_DUPLICATE_THRESHOLD:
+            continue
+        chosen.append(idx)
+    return [fragments[i] for i in chosen]
+
+
+def pack_context(
+    query_vector: Sequence[float],
+    docs: List[Document],
+    doc_vectors: Sequence[Sequence[float]],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    lambda_: float = CONTEXT_MMR_LAMBDA,
+) -> PackedContext:
+    """
+    `docs` en orden de relevancia y sus embeddings. Devuelve los fragmentos que
+    caben en `budget` tokens (0 = sin límite) y los tokens ahorrados frente a
+    meter los k chunks tal cual.
+    """
+    baseline = count_tokens(SEPARATOR.join(d.page_content for d in docs))
+    fragments = [
+        Fragment(d.page_content, dict(d.metadata or {}), [np.asarray(v, dtype=np.float32)], rank)
+        for rank, (d, v) in enumerate(zip(docs, doc_vectors))
+    ]
+    ordered = mmr_order(np.asarray(query_vector, dtype=np.float32), merge_neighbours(fragments), lambda_)
+
+    separator_tokens = count_tokens(SEPARATOR)
+    picked: List[Document] = []
+    used = 0
+    for f in ordered:
+        cost = count_tokens(f.text) + (separator_tokens if picked else 0)
+        if budget and picked and used + cost > budget:
+            # el más relevante entra siempre; de los demás, uno más pequeño todavía puede caber
+            continue
+        picked.append(Document(page_content=f.text, metadata=f.metadata))
+        used += cost
+
+    saved = max(baseline - used, 0)
+    CONTEXT_TOKENS.observe("packed", used)
+    CONTEXT_TOKENS.observe("saved", saved)
+    return PackedContext(docs=picked, tokens=used, tokens_saved=saved, chunks_in=len(docs))
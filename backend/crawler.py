@@ -0,0 +1,246 @@
+# crawler.py
+"""
+Rastreo de sitios web para /upload-url.
+
+Desde una URL inicial se siguen los enlaces del mismo dominio por niveles
+(CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES), con un cliente httpx asíncrono que
+reutiliza conexiones y como mucho CRAWL_PER_HOST peticiones a la vez por host.
+
+Para refrescar una fuente sin reprocesarla entera, CrawlState guarda por
+página ETag, Last-Modified, el hash del texto y los ids de sus chunks:
+- se pide con If-None-Match / If-Modified-Since y un 304 no se descarga
+- si el texto no ha cambiado (mismo hash) no se vuelve a embeber
+- si ha cambiado, sus chunks antiguos se sustituyen por los nuevos
+- si ya no existe (404/410), sus chunks se borran
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from uploads import UPLOAD_DIR
+
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "4"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "15"))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "usuarioBot-crawler/1.0")
+CRAWL_STATE_PATH = os.getenv("CRAWL_STATE_PATH", os.path.join(UPLOAD_DIR, "crawl_state.json"))
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+# respuestas con las que una página ya rastreada se da por eliminada
+GONE_STATUS = (404, 410)
+
+
+def normalize_url(url: str) -> str:
+    """Sin fragmento (#...) y con la ruta vacía como "/": la misma página, la misma clave"""
+    url, _ = urldefrag(url.strip())
+    parsed = urlparse(url)
+    return parsed._replace(path=parsed.path or "/", netloc=parsed.netloc.lower()).geturl()
+
+
+def same_site(url: str, root: str) -> bool:
+    a, b = urlparse(url), urlparse(root)
+    return a.scheme in ("http", "https") and a.netloc == b.netloc
+
+
+def extract(html: str, base_url: str) -> Tuple[str, str, List[str]]:
+    """Título, texto visible y enlaces absolutos de una página"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    links = [normalize_url(urljoin(base_url, a["href"])) for a in soup.find_all("a", href=True)]
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    lines = (line.strip() for line in soup.get_text("\n").splitlines())
+    text = "\n".join(line for line in lines if line)
+    return title, text, list(dict.fromkeys(links))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Page:
+    url: str
+    depth: int
+    # new | changed | unchanged (mismo texto) | not_modified (304) | gone (ya rastreada, ahora 404/410) | error
+    status: str
+    title: str = ""
+    text: str = ""
+    links: List[str] = field(default_factory=list)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    sha256: Optional[str] = None
+    error: Optional[str] = None
+
+
+class Crawler:
+    """
+    Rastreo por niveles (BFS). `known` son las entradas de CrawlState de este
+    sitio: con ellas se hacen las peticiones condicionales y se siguen los
+    enlaces de las páginas que responden 304.
+    """
+
+    def __init__(
+        self,
+        max_depth: int = CRAWL_MAX_DEPTH,
+        max_pages: int = CRAWL_MAX_PAGES,
+        per_host: int = CRAWL_PER_HOST,
+        timeout: float = CRAWL_TIMEOUT,
+    ):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.per_host = per_host
+        self.timeout = timeout
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    async def fetch(self, client, url: str, depth: int, known: Optional[Dict[str, Any]]) -> Page:
+        headers = {}
+        if known:
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+        try:
+            async with self._host_slot(url):
+                response = await client.get(url, headers=headers)
+        except Exception as e:
+            return Page(url=url, depth=depth, status="error", error=str(e))
+
+        if response.status_code == 304 and known:
+            return Page(
+                url=url,
+                depth=depth,
+                status="not_modified",
+                links=known.get("links", []),
+                etag=known.get("etag"),
+                last_modified=known.get("last_modified"),
+                sha256=known.get("sha256"),
+            )
+        if response.status_code in GONE_STATUS and known:
+            return Page(url=url, depth=depth, status="gone", error=f"HTTP {response.status_code}")
+        # las redirecciones ya se han seguido: aquí solo llegan 304 sin entrada previa
+        if response.status_code >= 300:
+            return Page(url=url, depth=depth, status="error", error=f"HTTP {response.status_code}")
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type and content_type not in HTML_TYPES:
+            return Page(url=url, depth=depth, status="error", error=f"tipo no soportado: {content_type}")
+
+        title, text, links = extract(response.text, str(response.url))
+        sha256 = text_hash(text)
+        if not known:
+            status = "new"
+        elif known.get("sha256") == sha256:
+            status = "unchanged"
+        else:
+            status = "changed"
+        return Page(
+            url=url,
+            depth=depth,
+            status=status,
+            title=title,
+            text=text,
+            links=links,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            sha256=sha256,
+        )
+
+    async def crawl(self, start_url: str, known: Dict[str, Dict[str, Any]]) -> List[Page]:
+        import httpx
+
+        root = normalize_url(start_url)
+        seen: Set[str] = {root}
+        level = [root]
+        pages: List[Page] = []
+        limits = httpx.Limits(max_connections=self.per_host * 4, max_keepalive_connections=self.per_host * 4)
+        async with httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=limits,
+            follow_redirects=True,
+            headers={"User-Agent": CRAWL_USER_AGENT},
+        ) as client:
+            for depth in range(self.max_depth + 1):
+                if not level:
+                    break
+                results = await asyncio.gather(*(self.fetch(client, url, depth, known.get(url)) for url in level))
+                pages.extend(results)
+                if depth == self.max_depth:
+                    break
+                # siguiente nivel: enlaces nuevos del mismo sitio, hasta max_pages en total
+                level = []
+                for page in results:
+                    for link in page.links:
+                        if len(seen) >= self.max_pages:
+                            break
+                        if link not in seen and same_site(link, root):
+                            seen.add(link)
+                            level.append(link)
+        return pages
+
+
+def crawl_site(
+    start_url: str,
+    known: Dict[str, Dict[str, Any]],
+    max_depth: int = CRAWL_MAX_DEPTH,
+    max_pages: int = CRAWL_MAX_PAGES,
+) -> Tuple[List[Page], float]:
+    """Versión síncrona para los trabajos de ingesta (corren en un hilo del pool); devuelve páginas y segundos"""
+    start = time.perf_counter()
+    pages = asyncio.run(Crawler(max_depth=max_depth, max_pages=max_pages).crawl(start_url, known))
+    return pages, time.perf_counter() - start
+
+
+class CrawlState:
+    """
+    Páginas ya rastreadas por usuario y corpus -> validadores HTTP, hash del
+    texto, enlaces e ids de sus chunks (mismo formato de archivo que UploadRegistry)
+    """
+
+    def __init__(self, path: str = CRAWL_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+
+    @staticmethod
+    def prefix(user_id: str, corpus_id: str) -> str:
+        return f"{user_id}/{corpus_id}/"
+
+    def pages(self, user_id: str, corpus_id: str) -> Dict[str, Dict[str, Any]]:
+        """url -> entrada, de las páginas de este usuario y corpus"""
+        prefix = self.prefix(user_id, corpus_id)
+        with self._lock:
+            return {k[len(prefix):]: dict(v) for k, v in self._entries.items() if k.startswith(prefix)}
+
+    def update(
+        self, user_id: str, corpus_id: str, entries: Dict[str, Dict[str, Any]], removed: Iterable[str] = ()
+    ) -> None:
+        """Guarda `entries` y olvida las páginas de `removed`"""
+        prefix = self.prefix(user_id, corpus_id)
+        with self._lock:
+            for url, entry in entries.items():
+                self._entries[prefix + url] = entry
+            for url in removed:
+                self._entries.pop(prefix + url, None)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
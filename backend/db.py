@@ -1,53 +1,563 @@
 # db.py
+"""
+Almacenamiento de conversaciones.
+
+Los mensajes se guardan como filas (append-only) en vez de reescribir el array
+`messages` entero en cada turno: cada turno de /chat hace una sola lectura (los
+últimos N mensajes) y una sola escritura (las filas nuevas).
+
+CONVERSATION_STORE elige la implementación:
+- "supabase" (por defecto): tablas conversations + conversation_messages y la
+  función append_messages (ver migrations/, en orden)
+- "sqlite": SQLite local en CONVERSATION_DB_PATH (":memory:" por defecto),
+  para pruebas y benchmarks sin Supabase
+"""
+import asyncio
+import json
 import os
-from typing import List, Dict, Any, Optional
-from supabase import create_client, Client
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-
-def upsert_conversation(user_id, messages, conversation_id=None):
-    if conversation_id is None:
-        # primer mensaje del hilo = primer role user
-        title = ""
-        for m in messages:
-            if m.get("role") == "user":
-                title = m.get("content", "")[:80]  # recortado
-                break
-
-        result = (
-            supabase.table("conversations")
-            .insert(
-                {
-                    "user_id": user_id,
-                    "title": title,
-                    "messages": messages,
-                }
-            )
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "supabase")
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", ":memory:")
+
+
+class ConversationNotFound(Exception):
+    pass
+
+
+def title_from(messages: List[Dict[str, Any]]) -> str:
+    # primer mensaje del hilo = primer role user
+    for m in messages:
+        if m.get("role") == "user":
+            return m.get("content", "")[:80]  # recortado
+    return ""
+
+
+def message_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    msg = {"role": row["role"], "content": row["content"]}
+    if row.get("id") is not None:
+        msg["id"] = row["id"]
+    if row.get("sources") is not None:
+        msg["sources"] = row["sources"]
+    return msg
+
+
+def message_window(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """`rows` viene en orden descendente de id con hasta limit + 1 filas"""
+    has_more = len(rows) > limit
+    rows = list(reversed(rows[:limit]))
+    return {
+        "messages": [message_from_row(r) for r in rows],
+        "has_more": has_more,
+        "next_before": rows[0]["id"] if has_more and rows else None,
+    }
+
+
+def page_cursor(rows: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    `rows` viene ordenado por (created_at, id) descendente con hasta limit + 1
+    filas: devuelve la página y el cursor "created_at|id" de su última fila,
+    solo si hay más detrás
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, f"{rows[-1]['created_at']}|{rows[-1]['id']}"
+
+
+def parse_cursor(cursor: str) -> Tuple[str, Optional[str]]:
+    """(created_at, id) de un cursor; los antiguos solo traían created_at"""
+    created_at, _, cid = cursor.rpartition("|")
+    return (created_at, cid) if created_at else (cid, None)
+
+
+class ConversationStore(ABC):
+    """Interfaz común a Supabase y al sustituto local"""
+
+    async def warm_up(self) -> None:
+        """Abre la conexión por adelantado (en el arranque del servidor)"""
+
+    @abstractmethod
+    async def recent_messages(self, user_id: str, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Últimos `limit` mensajes del hilo, en orden cronológico"""
+        ...
+
+    @abstractmethod
+    async def append_messages(
+        self, user_id: str, messages: List[Dict[str, Any]], conversation_id: Optional[str] = None
+    ) -> str:
+        """Añade mensajes al hilo (lo crea si conversation_id es None) y devuelve su id"""
+        ...
+
+    @abstractmethod
+    async def list_conversations(
+        self, user_id: str, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Página de conversaciones (más recientes primero) con su resumen
+        (message_count, last_activity). `cursor` es el que devolvió la página
+        anterior (created_at e id de su última conversación); devuelve también el
+        siguiente, o None si no hay más.
+        """
+        ...
+
+    @abstractmethod
+    async def get_conversation(
+        self, user_id: str, conversation_id: str, before: Optional[int] = None, limit: int = 50
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Conversación con una ventana de mensajes: los `limit` más recientes con
+        id < `before`, en orden cronológico, más `has_more` y `next_before`.
+        """
+        ...
+
+    @abstractmethod
+    async def message_range(
+        self, user_id: str, conversation_id: str, start: int, stop: int
+    ) -> List[Dict[str, Any]]:
+        """Mensajes en las posiciones [start, stop) del hilo (0 = el primero), en orden cronológico"""
+        ...
+
+    @abstractmethod
+    async def get_summary(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Resumen acumulado del hilo: {"summary", "summarized_count", "message_count"}.
+        `summarized_count` es cuántos mensajes (desde el primero) cubre el resumen.
+        """
+        ...
+
+    @abstractmethod
+    async def load_history(self, user_id: str, conversation_id: str, limit: int) -> Optional[Dict[str, Any]]:
+        """
+        Lo que necesita la memoria de /chat en una sola lectura: lo mismo que
+        get_summary más "messages", los mensajes que el resumen aún no cubre
+        (como mucho los `limit` más recientes) en orden cronológico.
+        """
+        ...
+
+    @abstractmethod
+    async def save_summary(
+        self, user_id: str, conversation_id: str, summary: str, summarized_count: int
+    ) -> None:
+        """Guarda el resumen si cubre más mensajes que el actual (nunca retrocede)"""
+        ...
+
+    @abstractmethod
+    async def rename_conversation(self, user_id: str, conversation_id: str, title: str) -> None:
+        ...
+
+    @abstractmethod
+    async def delete_conversation(self, user_id: str, conversation_id: str) -> bool:
+        ...
+
+
+class SupabaseConversationStore(ConversationStore):
+    def __init__(self, url: str, key: str):
+        self.url = url
+        self.key = key
+        self._client = None
+        self._lock = asyncio.Lock()
+
+    async def client(self):
+        """El cliente asíncrono se crea la primera vez que se usa (necesita un event loop)"""
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    from supabase import acreate_client
+
+                    self._client = await acreate_client(self.url, self.key)
+        return self._client
+
+    async def warm_up(self):
+        await self.client()
+
+    async def recent_messages(self, user_id, conversation_id, limit):
+        client = await self.client()
+        res = await (
+            client.table("conversation_messages")
+            .select("role, content, sources")
+            .eq("conversation_id", conversation_id)
+            .eq("user_id", user_id)
+            .order("id", desc=True)
+            .limit(limit)
+            .execute()
+        )
+        return [message_from_row(r) for r in reversed(res.data or [])]
+
+    async def append_messages(self, user_id, messages, conversation_id=None):
+        # una sola llamada: la función crea el hilo si hace falta e inserta las filas
+        client = await self.client()
+        res = await client.rpc(
+            "append_messages",
+            {
+                "p_user_id": user_id,
+                "p_conversation_id": conversation_id,
+                "p_title": title_from(messages),
+                "p_messages": messages,
+            },
+        ).execute()
+        return res.data
+
+    async def list_conversations(self, user_id, limit, cursor=None):
+        client = await self.client()
+        query = (
+            client.table("conversations")
+            .select("id, title, created_at, message_count, last_activity")
+            .eq("user_id", user_id)
+        )
+        if cursor:
+            created_at, cid = parse_cursor(cursor)
+            if cid is None:
+                query = query.lt("created_at", created_at)
+            else:
+                query = query.or_(
+                    f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{cid})'
+                )
+        res = await (
+            query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+        )
+        return page_cursor(res.data or [], limit)
+
+    async def get_conversation(self, user_id, conversation_id, before=None, limit=50):
+        client = await self.client()
+        conv = await (
+            client.table("conversations")
+            .select("id, title, created_at, message_count, last_activity")
+            .eq("user_id", user_id)
+            .eq("id", conversation_id)
+            .limit(1)
+            .execute()
+        )
+        if not conv.data:
+            return None
+        query = (
+            client.table("conversation_messages")
+            .select("id, role, content, sources")
+            .eq("conversation_id", conversation_id)
+            .eq("user_id", user_id)
+        )
+        if before is not None:
+            query = query.lt("id", before)
+        rows = await query.order("id", desc=True).limit(limit + 1).execute()
+        return {**conv.data[0], **message_window(rows.data or [], limit)}
+
+    async def message_range(self, user_id, conversation_id, start, stop):
+        if stop <= start:
+            return []
+        client = await self.client()
+        res = await (
+            client.table("conversation_messages")
+            .select("role, content, sources")
+            .eq("conversation_id", conversation_id)
+            .eq("user_id", user_id)
+            .order("id")
+            .range(start, stop - 1)
             .execute()
         )
-        return result.data[0]["id"]
-    else:
-        # añadir mensajes al hilo existente
-        # obtener mensajes actuales
-        existing = (
-            supabase.table("conversations")
-            .select("messages")
+        return [message_from_row(r) for r in res.data or []]
+
+    async def get_summary(self, user_id, conversation_id):
+        client = await self.client()
+        res = await (
+            client.table("conversations")
+            .select("summary, summarized_count, message_count")
+            .eq("id", conversation_id)
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+        return res.data[0] if res.data else None
+
+    async def load_history(self, user_id, conversation_id, limit):
+        # una sola petición: la conversación con sus últimos mensajes embebidos
+        client = await self.client()
+        res = await (
+            client.table("conversations")
+            .select("summary, summarized_count, message_count, conversation_messages(id, role, content, sources)")
             .eq("id", conversation_id)
             .eq("user_id", user_id)
-            .single()
+            .order("id", desc=True, foreign_table="conversation_messages")
+            .limit(limit, foreign_table="conversation_messages")
+            .limit(1)
             .execute()
         )
-        current = existing.data.get("messages") or []
-        updated = current + messages
+        if not res.data:
+            return None
+        row = res.data[0]
+        rows = row.pop("conversation_messages", None) or []
+        # el filtro por posición no se puede embeber: los ya resumidos se quitan aquí
+        rows = rows[: max(row["message_count"] - row["summarized_count"], 0)]
+        return {**row, "messages": [message_from_row(r) for r in reversed(rows)]}
 
-        (
-            supabase.table("conversations")
-            .update({"messages": updated})
+    async def save_summary(self, user_id, conversation_id, summary, summarized_count):
+        client = await self.client()
+        await (
+            client.table("conversations")
+            .update({"summary": summary, "summarized_count": summarized_count})
             .eq("id", conversation_id)
             .eq("user_id", user_id)
+            .lt("summarized_count", summarized_count)
             .execute()
         )
-        return conversation_id
+
+    async def rename_conversation(self, user_id, conversation_id, title):
+        client = await self.client()
+        await (
+            client.table("conversations")
+            .update({"title": title})
+            .eq("id", conversation_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+
+    async def delete_conversation(self, user_id, conversation_id):
+        # las filas de conversation_messages se borran en cascada
+        client = await self.client()
+        res = await (
+            client.table("conversations")
+            .delete()
+            .eq("id", conversation_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+        return bool(res.data)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Sustituto local de Supabase con el mismo esquema (":memory:" = en memoria)"""
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._conn.executescript(
+            """
+            PRAGMA foreign_keys = ON;
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                title TEXT,
+                created_at TEXT NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                last_activity TEXT,
+                summary TEXT,
+                summarized_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS conversations_user_created_id_idx
+                ON conversations (user_id, created_at, id);
+            CREATE TABLE IF NOT EXISTS conversation_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+                user_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                sources TEXT,
+                created_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS conversation_messages_conv_idx
+                ON conversation_messages (conversation_id, id);
+            """
+        )
+
+    def _run(self, fn, *args):
+        def locked():
+            with self._lock:
+                return fn(*args)
+
+        return asyncio.to_thread(locked)
+
+    @staticmethod
+    def _row_to_message(row) -> Dict[str, Any]:
+        data = dict(row)
+        data["sources"] = json.loads(data["sources"]) if data.get("sources") else None
+        return message_from_row(data)
+
+    async def recent_messages(self, user_id, conversation_id, limit):
+        def query():
+            rows = self._conn.execute(
+                "SELECT role, content, sources FROM conversation_messages "
+                "WHERE conversation_id = ? AND user_id = ? ORDER BY id DESC LIMIT ?",
+                (conversation_id, user_id, limit),
+            ).fetchall()
+            return [self._row_to_message(r) for r in reversed(rows)]
+
+        return await self._run(query)
+
+    async def append_messages(self, user_id, messages, conversation_id=None):
+        def write():
+            now = datetime.now(timezone.utc).isoformat()
+            with self._conn:  # una transacción
+                cid = conversation_id
+                if cid is None:
+                    cid = str(uuid.uuid4())
+                    self._conn.execute(
+                        "INSERT INTO conversations (id, user_id, title, created_at, last_activity) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (cid, user_id, title_from(messages), now, now),
+                    )
+                elif self._conn.execute(
+                    "SELECT 1 FROM conversations WHERE id = ? AND user_id = ?", (cid, user_id)
+                ).fetchone() is None:
+                    raise ConversationNotFound(cid)
+
+                self._conn.executemany(
+                    "INSERT INTO conversation_messages "
+                    "(conversation_id, user_id, role, content, sources, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            cid,
+                            user_id,
+                            m.get("role"),
+                            m.get("content", ""),
+                            json.dumps(m["sources"], ensure_ascii=False) if m.get("sources") is not None else None,
+                            now,
+                        )
+                        for m in messages
+                    ],
+                )
+                self._conn.execute(
+                    "UPDATE conversations SET message_count = message_count + ?, last_activity = ? "
+                    "WHERE id = ?",
+                    (len(messages), now, cid),
+                )
+            return cid
+
+        return await self._run(write)
+
+    async def list_conversations(self, user_id, limit, cursor=None):
+        def query():
+            sql = (
+                "SELECT id, title, created_at, message_count, last_activity FROM conversations "
+                "WHERE user_id = ?"
+            )
+            params: list = [user_id]
+            if cursor:
+                created_at, cid = parse_cursor(cursor)
+                if cid is None:
+                    sql += " AND created_at < ?"
+                    params.append(created_at)
+                else:
+                    sql += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+                    params.extend([created_at, created_at, cid])
+            sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+            params.append(limit + 1)
+            rows = [dict(r) for r in self._conn.execute(sql, params).fetchall()]
+            return page_cursor(rows, limit)
+
+        return await self._run(query)
+
+    async def get_conversation(self, user_id, conversation_id, before=None, limit=50):
+        def query():
+            conv = self._conn.execute(
+                "SELECT id, title, created_at, message_count, last_activity FROM conversations "
+                "WHERE id = ? AND user_id = ?",
+                (conversation_id, user_id),
+            ).fetchone()
+            if conv is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT id, role, content, sources FROM conversation_messages "
+                "WHERE conversation_id = ? AND user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (conversation_id, user_id, before if before is not None else 2**63 - 1, limit + 1),
+            ).fetchall()
+            rows = [{**dict(r), "sources": json.loads(r["sources"]) if r["sources"] else None} for r in rows]
+            return {**dict(conv), **message_window(rows, limit)}
+
+        return await self._run(query)
+
+    async def message_range(self, user_id, conversation_id, start, stop):
+        def query():
+            if stop <= start:
+                return []
+            rows = self._conn.execute(
+                "SELECT role, content, sources FROM conversation_messages "
+                "WHERE conversation_id = ? AND user_id = ? ORDER BY id LIMIT ? OFFSET ?",
+                (conversation_id, user_id, stop - start, start),
+            ).fetchall()
+            return [self._row_to_message(r) for r in rows]
+
+        return await self._run(query)
+
+    async def get_summary(self, user_id, conversation_id):
+        def query():
+            row = self._conn.execute(
+                "SELECT summary, summarized_count, message_count FROM conversations "
+                "WHERE id = ? AND user_id = ?",
+                (conversation_id, user_id),
+            ).fetchone()
+            return dict(row) if row else None
+
+        return await self._run(query)
+
+    async def load_history(self, user_id, conversation_id, limit):
+        def query():
+            row = self._conn.execute(
+                "SELECT summary, summarized_count, message_count FROM conversations "
+                "WHERE id = ? AND user_id = ?",
+                (conversation_id, user_id),
+            ).fetchone()
+            if row is None:
+                return None
+            pending = max(row["message_count"] - row["summarized_count"], 0)
+            rows = self._conn.execute(
+                "SELECT role, content, sources FROM conversation_messages "
+                "WHERE conversation_id = ? AND user_id = ? ORDER BY id DESC LIMIT ?",
+                (conversation_id, user_id, min(limit, pending)),
+            ).fetchall()
+            return {**dict(row), "messages": [self._row_to_message(r) for r in reversed(rows)]}
+
+        return await self._run(query)
+
+    async def save_summary(self, user_id, conversation_id, summary, summarized_count):
+        def write():
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE conversations SET summary = ?, summarized_count = ? "
+                    "WHERE id = ? AND user_id = ? AND summarized_count < ?",
+                    (summary, summarized_count, conversation_id, user_id, summarized_count),
+                )
+
+        await self._run(write)
+
+    async def rename_conversation(self, user_id, conversation_id, title):
+        def write():
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE conversations SET title = ? WHERE id = ? AND user_id = ?",
+                    (title, conversation_id, user_id),
+                )
+
+        await self._run(write)
+
+    async def delete_conversation(self, user_id, conversation_id):
+        def write():
+            with self._conn:
+                cur = self._conn.execute(
+                    "DELETE FROM conversations WHERE id = ? AND user_id = ?",
+                    (conversation_id, user_id),
+                )
+            return cur.rowcount > 0
+
+        return await self._run(write)
+
+
+_store: Optional[ConversationStore] = None
+
+
+def get_store() -> ConversationStore:
+    global _store
+    if _store is None:
+        if CONVERSATION_STORE == "sqlite":
+            _store = SQLiteConversationStore(CONVERSATION_DB_PATH)
+        else:
+            _store = SupabaseConversationStore(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _store
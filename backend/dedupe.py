@@ -0,0 +1,490 @@
+# dedupe.py
+"""
+Detección de chunks casi duplicados con SimHash (64 bits sobre trigramas de
+palabras) para no indexar varias veces el mismo párrafo: guías revisadas,
+traducciones que repiten bloques, el mismo material subido dos veces...
+
+Cuando un chunk nuevo es casi idéntico a uno ya indexado no se añade: su
+archivo/página se apunta en la metadata `extra_sources` del que ya existe,
+así /chat sigue citando todas las fuentes.
+Los descartados quedan registrados (DuplicateAliases) para que borrar los
+chunks de un archivo no se lleve por delante los de otro: vectorstore.delete_ids
+llama antes a release().
+
+Uso (desde backend/):
+    python dedupe.py compact            # colapsa los duplicados que ya hay en vector_db/
+    python dedupe.py compact --dry-run  # solo informa
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+NEAR_DUP_DEDUPE = os.getenv("NEAR_DUP_DEDUPE", "1") == "1"
+# bits distintos (de 64) para considerar dos chunks casi iguales
+DEDUPE_MAX_HAMMING = int(os.getenv("DEDUPE_MAX_HAMMING", "3"))
+# los chunks muy cortos (títulos, pies de página) se parecen demasiado entre sí
+DEDUPE_MIN_WORDS = int(os.getenv("DEDUPE_MIN_WORDS", "8"))
+SHINGLE_WORDS = 3
+EXTRA_SOURCES_KEY = "extra_sources"
+SIMHASH_KEY = "simhash"
+VECTOR_DB_DIR = os.getenv("VECTOR_DB_DIR", "vector_db")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def simhash(text: str) -> Optional[int]:
+    """SimHash de 64 bits; None si el texto es demasiado corto para compararlo"""
+    tokens = words(text)
+    if len(tokens) < DEDUPE_MIN_WORDS:
+        return None
+    shingles = {" ".join(tokens[i : i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles],
+        dtype=">u8",
+    )
+    # bits de cada hash (el más significativo primero): +1 si está a 1, -1 si no
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1).astype(np.int32)
+    weights = (2 * bits - 1).sum(axis=0)
+    value = 0
+    for bit in weights > 0:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """
+    Búsqueda de SimHash a distancia <= max_distance. Con 4 bandas de 16 bits,
+    dos hashes a distancia <= 3 coinciden por fuerza en al menos una banda.
+    Solo se comparan chunks del mismo `scope` (el corpus_id de las subidas).
+    """
+
+    BANDS = 4
+
+    def __init__(self, max_distance: int = DEDUPE_MAX_HAMMING):
+        self.max_distance = max_distance
+        self._bands: List[Dict[int, List[Tuple[int, str, Optional[str]]]]] = [{} for _ in range(self.BANDS)]
+        self._hashes: Dict[str, Tuple[int, Optional[str]]] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self._hashes)
+
+    def _keys(self, h: int) -> Iterable[Tuple[int, int]]:
+        for b in range(self.BANDS):
+            yield b, (h >> (16 * b)) & 0xFFFF
+
+    def find(self, h: int, scope: Optional[str] = None) -> Optional[str]:
+        for b, key in self._keys(h):
+            for other, cid, other_scope in self._bands[b].get(key, ()):
+                if other_scope == scope and hamming(h, other) <= self.max_distance:
+                    return cid
+        return None
+
+    def add(self, cid: str, h: int, scope: Optional[str] = None) -> None:
+        if cid in self._hashes:
+            return
+        self._hashes[cid] = (h, scope)
+        for b, key in self._keys(h):
+            self._bands[b].setdefault(key, []).append((h, cid, scope))
+
+    def remove(self, cid: str) -> None:
+        entry = self._hashes.pop(cid, None)
+        if entry is None:
+            return
+        for b, key in self._keys(entry[0]):
+            self._bands[b][key] = [e for e in self._bands[b][key] if e[1] != cid]
+
+
+# ---------- FUENTES ----------
+
+def source_ref(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "file_name": meta.get("file_name", meta.get("source", "Unknown")),
+        "page_number": meta.get("page_number"),
+    }
+
+
+def duplicate_ref(cid: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Fuente de un casi duplicado descartado, con su id y su metadata para poder restaurarlo"""
+    own = {k: v for k, v in meta.items() if k not in (EXTRA_SOURCES_KEY, SIMHASH_KEY)}
+    return {**source_ref(meta), "id": cid, "metadata": own}
+
+
+def extra_refs(meta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Fuentes de los casi duplicados fusionados en el chunk"""
+    raw = meta.get(EXTRA_SOURCES_KEY)
+    if not raw:
+        return []
+    try:
+        return list(json.loads(raw))
+    except (TypeError, ValueError):
+        return []
+
+
+def all_source_refs(meta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """La fuente del chunk más las de los casi duplicados que se fusionaron en él"""
+    return [source_ref(meta)] + extra_refs(meta)
+
+
+def with_extra_refs(meta: Dict[str, Any], refs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Chroma solo guarda escalares: la lista va como JSON
+    return {**meta, EXTRA_SOURCES_KEY: json.dumps(refs, ensure_ascii=False)}
+
+
+def merge_source_refs(meta: Dict[str, Any], refs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Copia de `meta` con `refs` añadidas a extra_sources (sin repetir)"""
+    seen = {json.dumps(source_ref(meta), sort_keys=True)}
+    extra = []
+    for ref in extra_refs(meta) + refs:
+        key = ref.get("id") or json.dumps(ref, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            extra.append(ref)
+    return with_extra_refs(meta, extra)
+
+
+# ---------- ALIAS ----------
+
+class DuplicateAliases:
+    """
+    id de cada casi duplicado descartado -> id del chunk que lo representa.
+    El manifest de ingest.py y crawl_state guardan los ids de todos los chunks
+    de un archivo, también los descartados; con esto delete_ids sabe a qué
+    chunk afecta borrarlos. Un JSON por colección en <vector_db>/duplicates/.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @classmethod
+    def for_collection(cls, persist_directory: str, collection_name: str) -> "DuplicateAliases":
+        return cls(os.path.join(persist_directory, "duplicates", f"{collection_name}.json"))
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+
+def aliases_for(vectordb) -> DuplicateAliases:
+    # las colecciones de usuario se abren con el cliente de la base (sin persist_directory propio)
+    persist_directory = getattr(vectordb, "_persist_directory", None) or VECTOR_DB_DIR
+    return DuplicateAliases.for_collection(persist_directory, vectordb._collection.name)
+
+
+# ---------- ÍNDICE POR COLECCIÓN ----------
+
+_indexes: Dict[str, NearDuplicateIndex] = {}
+_lock = threading.Lock()
+PAGE_SIZE = 5000
+
+
+def iter_collection(collection, include: List[str]):
+    """Recorre una colección de Chroma por páginas"""
+    total = collection.count()
+    for offset in range(0, total, PAGE_SIZE):
+        page = collection.get(offset=offset, limit=PAGE_SIZE, include=include)
+        yield page
+
+
+def index_for(vectordb) -> NearDuplicateIndex:
+    """SimHash de lo que ya hay en la colección (se construye la primera vez que se usa)"""
+    collection = vectordb._collection
+    index = _indexes.get(collection.name)
+    if index is None:
+        index = NearDuplicateIndex()
+        for page in iter_collection(collection, ["documents", "metadatas"]):
+            for cid, text, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+                stored = (meta or {}).get(SIMHASH_KEY)
+                h = int(stored, 16) if stored else simhash(text or "")
+                if h is not None:
+                    index.add(cid, h, (meta or {}).get("corpus_id"))
+        _indexes[collection.name] = index
+    return index
+
+
+def filter_near_duplicates(
+    vectordb, texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str]
+) -> Tuple[List[str], List[Dict[str, Any]], List[str], List[str]]:
+    """
+    Quita de (texts, metadatas, ids) los casi duplicados de chunks ya indexados
+    (o de otros del mismo lote) del mismo corpus y apunta su fuente en el chunk que se queda.
+    Los que se quedan llevan su SimHash en la metadata; los descartados quedan
+    en DuplicateAliases para poder restaurarlos al borrar el que se queda.
+    Devuelve también los ids de chunks ya indexados cuyas fuentes han cambiado.
+    """
+    if not NEAR_DUP_DEDUPE or not ids:
+        return texts, metadatas, ids, []
+
+    with _lock:
+        index = index_for(vectordb)
+        aliases = aliases_for(vectordb)
+        keep_texts, keep_metas, keep_ids = [], [], []
+        updates: Dict[str, Dict[str, Any]] = {}
+        batch_metas: Dict[str, Dict[str, Any]] = {}
+        # casi duplicados de chunks ya indexados: (id existente, texto, metadata, id, simhash)
+        deferred = []
+
+        def keep(text, meta, cid, h):
+            if h is not None:
+                meta = {**meta, SIMHASH_KEY: format(h, "016x")}
+                index.add(cid, h, meta.get("corpus_id"))
+            keep_texts.append(text)
+            keep_metas.append(meta)
+            keep_ids.append(cid)
+            batch_metas[cid] = meta
+
+        for text, meta, cid in zip(texts, metadatas, ids):
+            h = simhash(text)
+            match = index.find(h, meta.get("corpus_id")) if h is not None else None
+            if match is None:
+                keep(text, meta, cid, h)
+            elif match in batch_metas:
+                batch_metas[match].update(merge_source_refs(batch_metas[match], [duplicate_ref(cid, meta)]))
+                aliases.entries[cid] = match
+            else:
+                deferred.append((match, text, meta, cid, h))
+
+        if deferred:
+            pending = list(dict.fromkeys(d[0] for d in deferred))
+            found = vectordb._collection.get(ids=pending, include=["metadatas"])
+            existing = {cid: meta or {} for cid, meta in zip(found["ids"], found["metadatas"])}
+            for match, text, meta, cid, h in deferred:
+                if match in existing:
+                    updates[match] = merge_source_refs(updates.get(match, existing[match]), [duplicate_ref(cid, meta)])
+                    aliases.entries[cid] = match
+                else:
+                    # el índice en memoria apuntaba a un chunk ya borrado (p. ej. tras compact en otro proceso)
+                    index.remove(match)
+                    keep(text, meta, cid, h)
+            if updates:
+                vectordb._collection.update(ids=list(updates), metadatas=list(updates.values()))
+        if len(keep_ids) < len(ids):
+            aliases.save()
+
+    return keep_texts, keep_metas, keep_ids, list(updates)
+
+
+def release(vectordb, ids: List[str]) -> None:
+    """
+    Se llama antes de borrar `ids` de la colección, para que los casi duplicados
+    descartados sigan el ciclo de vida de su propio archivo:
+    - si se borra un descartado, su fuente sale del extra_sources de su representante
+    - si se borra un representante, el primero de sus descartados que sigue vivo
+      ocupa su lugar (mismo texto y embedding, con su id y su metadata) y hereda el resto
+    """
+    if not ids:
+        return
+    deleting = set(ids)
+    with _lock:
+        collection = vectordb._collection
+        aliases = aliases_for(vectordb)
+        changed = False
+
+        # 1) descartados que se borran con su archivo
+        pruned: Dict[str, set] = {}
+        for cid in ids:
+            survivor = aliases.entries.pop(cid, None)
+            if survivor is None:
+                continue
+            changed = True
+            if survivor not in deleting:
+                pruned.setdefault(survivor, set()).add(cid)
+        if pruned:
+            found = collection.get(ids=list(pruned), include=["metadatas"])
+            metas = [
+                with_extra_refs(meta or {}, [r for r in extra_refs(meta or {}) if r.get("id") not in pruned[cid]])
+                for cid, meta in zip(found["ids"], found["metadatas"])
+            ]
+            if found["ids"]:
+                collection.update(ids=found["ids"], metadatas=metas)
+
+        # 2) representantes que se borran con descartados vivos
+        orphans: Dict[str, List[Dict[str, Any]]] = {}
+        for i in range(0, len(ids), PAGE_SIZE):
+            found = collection.get(ids=ids[i : i + PAGE_SIZE], include=["metadatas"])
+            for cid, meta in zip(found["ids"], found["metadatas"]):
+                refs = [r for r in extra_refs(meta or {}) if r.get("id") and r["id"] not in deleting]
+                if refs:
+                    orphans[cid] = refs
+        index = _indexes.get(collection.name)
+        if orphans:
+            found = collection.get(ids=list(orphans), include=["documents", "embeddings"])
+            heir_ids, texts, metas, embeddings = [], [], [], []
+            for cid, text, embedding in zip(found["ids"], found["documents"], found["embeddings"]):
+                heir, *rest = orphans[cid]
+                meta = dict(heir.get("metadata") or source_ref(heir))
+                h = simhash(text or "")
+                if h is not None:
+                    meta[SIMHASH_KEY] = format(h, "016x")
+                    if index is not None:
+                        index.add(heir["id"], h, meta.get("corpus_id"))
+                if rest:
+                    meta = with_extra_refs(meta, rest)
+                aliases.entries.pop(heir["id"], None)
+                for ref in rest:
+                    aliases.entries[ref["id"]] = heir["id"]
+                heir_ids.append(heir["id"])
+                texts.append(text)
+                metas.append(meta)
+                embeddings.append(embedding)
+            collection.add(ids=heir_ids, documents=texts, metadatas=metas, embeddings=embeddings)
+            changed = True
+
+        if index is not None:
+            for cid in ids:
+                index.remove(cid)
+        if changed:
+            aliases.save()
+
+
+def reset(vectordb) -> None:
+    """Olvida índice y alias de la colección (antes de vaciarla con ingest.py --full)"""
+    with _lock:
+        _indexes.pop(vectordb._collection.name, None)
+        aliases = aliases_for(vectordb)
+        if os.path.exists(aliases.path):
+            os.remove(aliases.path)
+
+
+# ---------- COMPACTACIÓN ----------
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total / 2**20
+
+
+def measure(collection, query_vectors: List[List[float]], k: int = 10) -> Dict[str, float]:
+    """Latencia de búsqueda y fracción de resultados del top-k que repiten uno anterior"""
+    latencies, duplicated, returned = [], 0, 0
+    for q in query_vectors:
+        start = time.perf_counter()
+        res = collection.query(query_embeddings=[q], n_results=k, include=["documents"])
+        latencies.append(time.perf_counter() - start)
+        hashes = []
+        for text in res["documents"][0]:
+            h = simhash(text or "")
+            returned += 1
+            if h is not None and any(hamming(h, o) <= DEDUPE_MAX_HAMMING for o in hashes):
+                duplicated += 1
+            if h is not None:
+                hashes.append(h)
+    latencies.sort()
+    return {
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "dup_rate": duplicated / returned if returned else 0.0,
+    }
+
+
+def compact(collection, aliases: DuplicateAliases, dry_run: bool = False) -> Dict[str, int]:
+    """Colapsa cada grupo de casi duplicados en su primer chunk, conservando todas las fuentes"""
+    index = NearDuplicateIndex()
+    merged: Dict[str, List[Dict[str, Any]]] = {}  # id que se queda -> fuentes de los que se borran
+    to_delete: List[str] = []
+    simhashes: Dict[str, str] = {}
+    for page in iter_collection(collection, ["documents", "metadatas"]):
+        for cid, text, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+            h = simhash(text or "")
+            if h is None:
+                continue
+            scope = (meta or {}).get("corpus_id")
+            match = index.find(h, scope)
+            if match is None:
+                index.add(cid, h, scope)
+                simhashes[cid] = format(h, "016x")
+            else:
+                refs = [duplicate_ref(cid, meta or {})] + extra_refs(meta or {})
+                merged.setdefault(match, []).extend(refs)
+                to_delete.append(cid)
+
+    if not dry_run and merged:
+        ids = list(merged)
+        for i in range(0, len(ids), PAGE_SIZE):
+            batch = ids[i : i + PAGE_SIZE]
+            found = collection.get(ids=batch, include=["metadatas"])
+            metas = []
+            for cid, meta in zip(found["ids"], found["metadatas"]):
+                metas.append({**merge_source_refs(meta or {}, merged[cid]), SIMHASH_KEY: simhashes[cid]})
+                for ref in merged[cid]:
+                    if ref.get("id"):
+                        aliases.entries[ref["id"]] = cid
+            collection.update(ids=found["ids"], metadatas=metas)
+        aliases.save()
+        for i in range(0, len(to_delete), PAGE_SIZE):
+            collection.delete(ids=to_delete[i : i + PAGE_SIZE])
+    _indexes.pop(collection.name, None)
+    return {"groups": len(merged), "removed": len(to_delete)}
+
+
+def main():
+    import chromadb
+
+    from vectorstore import BASE_COLLECTION, VECTOR_DB_DIR
+
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("compact", help="colapsa los chunks casi duplicados ya indexados")
+    cmd.add_argument("--vector-db", default=VECTOR_DB_DIR)
+    cmd.add_argument("--collection", default=BASE_COLLECTION)
+    cmd.add_argument("--queries", type=int, default=200, help="consultas para medir la latencia")
+    cmd.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(path=args.vector_db)
+    collection = client.get_collection(args.collection)
+
+    count_before = collection.count()
+    if not count_before:
+        raise SystemExit("La colección está vacía: no hay nada que compactar")
+    # consultas: embeddings de chunks al azar (las mismas antes y después)
+    rng = np.random.default_rng(0)
+    sample = rng.choice(count_before, size=min(args.queries, count_before), replace=False)
+    queries = []
+    for offset in sample:
+        page = collection.get(offset=int(offset), limit=1, include=["embeddings"])
+        queries.append(list(page["embeddings"][0]))
+
+    size_before = dir_size_mb(args.vector_db)
+    before = measure(collection, queries)
+    aliases = DuplicateAliases.for_collection(args.vector_db, args.collection)
+    result = compact(collection, aliases, dry_run=args.dry_run)
+    count_after = collection.count()
+    size_after = dir_size_mb(args.vector_db)
+    after = measure(collection, queries)
+
+    print(f"grupos de casi duplicados: {result['groups']}, chunks eliminados: {result['removed']}"
+          + (" (dry-run: no se ha cambiado nada)" if args.dry_run else ""))
+    print(f"{'':>12} {'chunks':>8} {'MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'dup top-10':>11}")
+    for name, count, size, m in (("antes", count_before, size_before, before), ("después", count_after, size_after, after)):
+        print(f"{name:>12} {count:>8} {size:>8.1f} {m['p50_ms']:>8.2f} {m['p95_ms']:>8.2f} {m['dup_rate']:>10.1%}")
+    # HNSW no devuelve el espacio de los borrados al disco hasta reconstruir el índice
+    print("Nota: el tamaño en disco de Chroma no baja hasta reindexar (python ingest.py --full).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# embeddings.py
+"""Modelo de embeddings compartido por ingest.py y main.py, con caché persistente en disco"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from metrics import Histogram, register_histogram
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "vector_db/embedding_cache.sqlite3")
+
+# torch (precisión completa), onnx (ONNX Runtime) o int8 (ONNX cuantizado dinámicamente)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# variante cuantizada publicada en el repo del modelo; avx2 funciona en cualquier x86 reciente
+EMBEDDING_INT8_FILE = os.getenv("EMBEDDING_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_BACKENDS = ("torch", "onnx", "int8")
+
+
+def text_hash(text: str, model_name: str) -> str:
+    """Clave de la caché: hash del texto + nombre del modelo"""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envuelve un modelo de embeddings y guarda cada vector en SQLite,
+    direccionado por contenido. Los textos ya vistos no se vuelven a embeber.
+    """
+
+    def __init__(self, base: Embeddings, model_name: str, path: str = EMBEDDING_CACHE_PATH):
+        self.base = base
+        self.model_name = model_name
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def _get_many(self, keys: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            # SQLite limita el nº de parámetros por consulta
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _put_many(self, items: List[tuple]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items],
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_hash(t, self.model_name) for t in texts]
+        cached = self._get_many(list(set(keys)))
+
+        # embeber solo los textos que faltan (sin repetir)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.base.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self._put_many(new_items)
+            cached.update(new_items)
+
+        return [cached[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        # las preguntas de los usuarios no se guardan: casi nunca se repiten literalmente
+        return self.base.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Varias preguntas en una sola pasada del modelo (sin caché, como embed_query)"""
+        return self.base.embed_documents(texts)
+
+
+def backend_model_kwargs(backend: str) -> dict:
+    """Argumentos de SentenceTransformer para cada backend"""
+    if backend == "torch":
+        return {}
+    if backend == "onnx":
+        return {"backend": "onnx"}
+    if backend == "int8":
+        return {"backend": "onnx", "model_kwargs": {"file_name": EMBEDDING_INT8_FILE}}
+    raise ValueError(f"EMBEDDING_BACKEND desconocido: {backend} (opciones: {', '.join(EMBEDDING_BACKENDS)})")
+
+
+def get_base_embeddings(backend: str = EMBEDDING_BACKEND) -> Embeddings:
+    """Modelo sin caché para el backend pedido"""
+    # import diferido: cargar sentence-transformers/torch tarda varios segundos
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=MODEL_NAME, model_kwargs=backend_model_kwargs(backend))
+
+
+def get_embeddings(path: Optional[str] = None, backend: str = EMBEDDING_BACKEND) -> CachedEmbeddings:
+    base = get_base_embeddings(backend)
+    # los vectores de cada backend difieren ligeramente: no comparten entradas de caché
+    cache_name = MODEL_NAME if backend == "torch" else f"{MODEL_NAME}@{backend}"
+    return CachedEmbeddings(base, cache_name, path or EMBEDDING_CACHE_PATH)
+
+
+def cosine_drift(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """1 - similitud coseno fila a fila entre dos matrices de embeddings"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return 1.0 - np.sum(reference * candidate, axis=1)
+
+
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+
+BATCH_SIZES = register_histogram(
+    Histogram(
+        "embed_batch_size",
+        "Preguntas por lote del servicio de embeddings",
+        "service",
+        buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+    )
+)
+
+
+class BatchingEmbedder:
+    """
+    Agrupa las peticiones de embedding concurrentes: espera hasta `max_wait_ms`
+    o hasta reunir `max_batch` textos, los codifica en una sola pasada en
+    `executor` y devuelve a cada llamante su vector.
+    """
+
+    def __init__(
+        self,
+        embed_many: Callable[[List[str]], List[List[float]]],
+        executor,
+        max_batch: int = EMBED_BATCH_MAX,
+        max_wait_ms: float = EMBED_BATCH_WAIT_MS,
+        name: str = "query",
+    ):
+        self.embed_many = embed_many
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch :]
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+        if self._pending:
+            # lo que no cabía en este lote sale en el siguiente sin esperar
+            self._timer = asyncio.get_running_loop().call_soon(self._flush)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = [text for text, _ in batch]
+        BATCH_SIZES.observe(self.name, len(texts))
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.embed_many, texts
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
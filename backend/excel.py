@@ -0,0 +1,122 @@
+# excel.py
+"""
+Lectura de Excel (.xlsx) en streaming para /upload-excel.
+
+openpyxl en modo read-only recorre las filas sin cargar el libro entero en
+memoria. Cada chunk son EXCEL_ROWS_PER_CHUNK filas completas (nunca se corta
+una celda) precedidas de la cabecera de su hoja, con la hoja y el rango de
+filas en la metadata para citarlas como fuente.
+"""
+import datetime
+import os
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+EXCEL_ROWS_PER_CHUNK = int(os.getenv("EXCEL_ROWS_PER_CHUNK", "20"))
+# un chunk se cierra antes de llegar a N filas si ya pasa de estos caracteres
+EXCEL_MAX_CHUNK_CHARS = int(os.getenv("EXCEL_MAX_CHUNK_CHARS", "1500"))
+
+Chunk = Tuple[str, Dict[str, Any]]
+
+
+def is_xlsx(path: str) -> bool:
+    """xlsx/xlsm son zip; el .xls antiguo (binario) no lo lee openpyxl"""
+    return zipfile.is_zipfile(path)
+
+
+def format_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time(0):
+        return value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    # una fila = una línea
+    return " ".join(str(value).split()).replace("|", "/")
+
+
+def format_row(values: Sequence[Any]) -> Optional[List[str]]:
+    """Celdas como texto, sin las vacías del final; None si la fila está vacía"""
+    cells = [format_cell(v) for v in values]
+    while cells and not cells[-1]:
+        cells.pop()
+    return cells or None
+
+
+def chunk_rows(
+    rows: Iterable[Sequence[Any]],
+    sheet: str,
+    metadata: Dict[str, Any],
+    rows_per_chunk: int = EXCEL_ROWS_PER_CHUNK,
+    max_chars: int = EXCEL_MAX_CHUNK_CHARS,
+) -> Iterator[Chunk]:
+    """
+    Agrupa las filas de una hoja en chunks con la cabecera (primera fila no
+    vacía) repetida. Los números de fila son los de Excel (desde 1).
+    """
+    header: Optional[str] = None
+    lines: List[str] = []
+    size = 0
+    first = last = header_row = 0
+
+    def flush() -> Chunk:
+        title = f"Hoja: {sheet} (filas {first}-{last})"
+        text = "\n".join([title, header, *lines] if header else [title, *lines])
+        meta = {
+            **metadata,
+            "sheet": sheet,
+            "row_start": first,
+            "row_end": last,
+            # etiqueta que /chat muestra en "pages"
+            "page_number": f"{sheet} {first}-{last}",
+        }
+        return text, meta
+
+    for number, values in enumerate(rows, start=1):
+        cells = format_row(values)
+        if cells is None:
+            continue
+        line = " | ".join(cells)
+        if header is None:
+            header, header_row = line, number
+            continue
+        if lines and (len(lines) >= rows_per_chunk or size + len(line) > max_chars):
+            yield flush()
+            lines, size = [], 0
+        if not lines:
+            first = number
+        lines.append(line)
+        size += len(line) + 1
+        last = number
+
+    if lines:
+        yield flush()
+    elif header is not None:
+        # hoja con una sola fila: se indexa tal cual
+        first = last = header_row
+        header, lines = None, [header]
+        yield flush()
+
+
+def iter_excel_chunks(
+    path: str,
+    metadata: Dict[str, Any],
+    rows_per_chunk: int = EXCEL_ROWS_PER_CHUNK,
+    max_chars: int = EXCEL_MAX_CHUNK_CHARS,
+) -> Iterator[Chunk]:
+    """(texto, metadata) de cada chunk de todas las hojas, sin cargar el libro en memoria"""
+    from openpyxl import load_workbook
+
+    # data_only: el valor calculado de las fórmulas, no la fórmula
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in workbook.worksheets:
+            # las dimensiones guardadas en el archivo pueden estar mal; se recalculan leyendo
+            ws.reset_dimensions()
+            yield from chunk_rows(
+                ws.iter_rows(values_only=True), ws.title, metadata, rows_per_chunk, max_chars
+            )
+    finally:
+        workbook.close()
@@ -1,16 +1,26 @@
 from pathlib import Path
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import argparse
+import hashlib
+import json
 import logging
+import queue
+import threading
 
 from langchain_unstructured import UnstructuredLoader
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+
+from embeddings import get_embeddings
+from dedupe import reset as reset_duplicates
+from vectorstore import VECTOR_DB_DIR, add_unique_texts, chunk_id, delete_ids, get_vectordb
 
 from unstructured.cleaners.core import clean_extra_whitespace
 
 # ---------- CONFIG ----------
 PDF_DIR = Path("data")
-VECTOR_DB_DIR = "vector_db"
 LANGUAGES = ["es"]
+# hash de contenido e ids de chunks de cada PDF ya ingerido
+MANIFEST_PATH = Path(VECTOR_DB_DIR) / "ingest_manifest.json"
 
 # ---------- LOGGING ----------
 logging.basicConfig(level=logging.INFO)
@@ -26,52 +36,273 @@ def get_info_dict_from(chunk) -> dict:
         },
     }
 
+def get_file_chunks(pdf_file: Path) -> list[dict]:
+    """Trocea un PDF con Unstructured (estrategia by_title)"""
+    logger.info(f"Procesando {pdf_file.name}")
+    loader = UnstructuredLoader(
+        pdf_file,
+        languages=LANGUAGES,
+        post_processors=[clean_extra_whitespace],
+        chunking_strategy="by_title",
+        max_characters=1000,
+        overlap=150,
+    )
+
+    return [get_info_dict_from(chunk) for chunk in loader.load()]
+
 def get_chunks(pdf_dir: Path) -> list[dict]:
     """Itera sobre todos los PDFs del directorio y devuelve lista de chunks"""
     chunks_info = []
 
     for pdf_file in pdf_dir.glob("*.pdf"):
-        logger.info(f"Procesando {pdf_file.name}")
-        loader = UnstructuredLoader(
-            pdf_file,
-            languages=LANGUAGES,
-            post_processors=[clean_extra_whitespace],
-            chunking_strategy="by_title",
-            max_characters=1000,
-            overlap=150,
-        )
-
-        chunks = loader.load()
-        for chunk in chunks:
-            chunks_info.append(get_info_dict_from(chunk))
+        chunks_info.extend(get_file_chunks(pdf_file))
 
     return chunks_info
 
 
-def ingest_pdfs():
-    logger.info("Leyendo PDFs...")
-    chunks_info = get_chunks(PDF_DIR)
+# ---------- MANIFEST ----------
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
-    texts = [c["page_content"] for c in chunks_info]
-    metadatas = [c["metadata"] for c in chunks_info]
+def load_manifest(path: Path = MANIFEST_PATH) -> dict:
+    if not path.exists():
+        return {"files": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
 
-    logger.info(f"{len(texts)} fragmentos creados")
+def save_manifest(manifest: dict, path: Path = MANIFEST_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    tmp.replace(path)  # escritura atómica
 
-    logger.info("Creando embeddings locales...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+def plan_ingest(pdf_dir: Path, manifest: dict) -> dict:
+    """Clasifica los PDFs en nuevos, modificados, sin cambios y eliminados"""
+    known = manifest["files"]
+    current = {p.name: p for p in sorted(pdf_dir.glob("*.pdf"))}
+    hashes = {name: file_sha256(p) for name, p in current.items()}
+
+    plan = {"new": [], "changed": [], "unchanged": [], "removed": []}
+    for name, path in current.items():
+        if name not in known:
+            plan["new"].append(path)
+        elif known[name]["sha256"] != hashes[name]:
+            plan["changed"].append(path)
+        else:
+            plan["unchanged"].append(path)
+    plan["removed"] = [name for name in known if name not in current]
+    plan["hashes"] = hashes
+    return plan
+
+
+def ingest_pdfs(
+    full: bool = False,
+    workers: int = 0,
+    batch_size: int = 256,
+    pdf_dir: Path = PDF_DIR,
+    persist_directory: str = VECTOR_DB_DIR,
+    embeddings=None,
+) -> dict:
+    """
+    Ingesta incremental de los PDFs de `pdf_dir`.
 
-    logger.info("Guardando en Chroma...")
-    Chroma.from_texts(
-        texts=texts,
-        embedding=embeddings,
-        metadatas=metadatas,
-        persist_directory=VECTOR_DB_DIR,
+    Con workers=0 se procesa un PDF tras otro (modo serie); con workers>0 se usa
+    el pipeline paralelo (ver `run_pipeline`). Devuelve estadísticas de la ejecución.
+    """
+    manifest_path = Path(persist_directory) / MANIFEST_PATH.name
+
+    logger.info("Creando embeddings locales (con caché en disco)...")
+    embeddings = embeddings or get_embeddings()
+    vectordb = get_vectordb(embeddings, persist_directory)
+
+    if full:
+        # reconstrucción completa: se vacía la colección (incluidos chunks sin manifest)
+        logger.info("Modo --full: se vacía la colección y se reprocesa todo")
+        reset_duplicates(vectordb)
+        vectordb.delete_collection()
+        vectordb = get_vectordb(embeddings, persist_directory)
+        manifest = {"files": {}}
+    else:
+        if not manifest_path.exists() and vectordb._collection.count():
+            # colección de antes del manifest (ids aleatorios): nada diría qué chunks son de cada PDF,
+            # y los nuevos se descartarían como casi duplicados de los viejos sin poder borrarlos nunca
+            raise SystemExit(
+                f"{persist_directory} tiene chunks pero no {manifest_path.name}: "
+                "ejecuta una vez `python ingest.py --full` para reconstruir la colección con manifest"
+            )
+        manifest = load_manifest(manifest_path)
+
+    plan = plan_ingest(pdf_dir, manifest)
+
+    for path in plan["unchanged"]:
+        logger.info(f"Sin cambios, se omite: {path.name}")
+
+    # 1) Borrar de Chroma los chunks de PDFs eliminados o modificados
+    stale = plan["removed"] + [p.name for p in plan["changed"]]
+    for name in stale:
+        ids = manifest["files"].pop(name)["chunk_ids"]
+        delete_ids(vectordb, ids)
+        logger.info(f"Eliminados {len(ids)} fragmentos antiguos de {name}")
+
+    # 2) Procesar solo los PDFs nuevos o modificados
+    to_process = plan["new"] + plan["changed"]
+    logger.info("Leyendo PDFs...")
+    if workers > 0:
+        stats = run_pipeline(
+            to_process, plan["hashes"], vectordb, manifest, manifest_path, workers, batch_size
+        )
+    else:
+        stats = run_serial(to_process, plan["hashes"], vectordb, manifest, manifest_path)
+
+    save_manifest(manifest, manifest_path)
+    logger.info(
+        f"Ingesta completada: {len(plan['new'])} nuevos, {len(plan['changed'])} modificados, "
+        f"{len(plan['removed'])} eliminados, {len(plan['unchanged'])} sin cambios; "
+        f"{stats['chunks_added']} fragmentos nuevos de {stats['chunks']}"
     )
+    return {"docs": len(to_process), "skipped": len(plan["unchanged"]), **stats}
 
-    logger.info("Ingesta completada")
+
+def manifest_entry(file_hash: str, texts: list[str], metadatas: list[dict]) -> dict:
+    return {
+        "sha256": file_hash,
+        "chunk_ids": list(dict.fromkeys(chunk_id(t, m) for t, m in zip(texts, metadatas))),
+    }
+
+
+def run_serial(to_process, hashes, vectordb, manifest, manifest_path) -> dict:
+    """Un PDF detrás de otro, en un solo núcleo"""
+    total_chunks = total_added = 0
+    for pdf_file in to_process:
+        chunks_info = get_file_chunks(pdf_file)
+        texts = [c["page_content"] for c in chunks_info]
+        metadatas = [c["metadata"] for c in chunks_info]
+
+        added, _ = add_unique_texts(vectordb, texts, metadatas)
+        total_chunks += len(texts)
+        total_added += len(added)
+
+        manifest["files"][pdf_file.name] = manifest_entry(hashes[pdf_file.name], texts, metadatas)
+        save_manifest(manifest, manifest_path)  # tras cada archivo, para poder reanudar
+
+    return {"chunks": total_chunks, "chunks_added": total_added}
+
+
+_END = object()
+
+
+def run_pipeline(to_process, hashes, vectordb, manifest, manifest_path, workers, batch_size) -> dict:
+    """
+    Pipeline paralelo:
+    - un pool de procesos trocea los PDFs (como mucho 2*workers archivos en vuelo)
+    - los chunks pasan por una cola acotada a un hilo escritor
+    - el escritor embebe y escribe en Chroma en lotes de `batch_size`
+
+    Así la memoria no depende del tamaño del corpus, solo de los archivos en vuelo
+    y del tamaño de la cola.
+    """
+    chunk_queue: queue.Queue = queue.Queue(maxsize=batch_size * 4)
+    stats = {"chunks": 0, "chunks_added": 0}
+    errors: list[BaseException] = []
+
+    def writer():
+        texts: list[str] = []
+        metadatas: list[dict] = []
+        done_files: list[tuple[str, dict]] = []
+        ended = False  # ya se ha leído _END: no queda nada que vaciar
+
+        def flush():
+            if texts:
+                added, _ = add_unique_texts(vectordb, texts, metadatas)
+                stats["chunks_added"] += len(added)
+                stats["chunks"] += len(texts)
+                texts.clear()
+                metadatas.clear()
+            # un archivo entra en el manifest cuando todos sus chunks están escritos
+            for name, entry in done_files:
+                manifest["files"][name] = entry
+            if done_files:
+                save_manifest(manifest, manifest_path)
+                done_files.clear()
+
+        try:
+            while True:
+                item = chunk_queue.get()
+                if item is _END:
+                    ended = True
+                    break
+                kind, payload = item
+                if kind == "chunk":
+                    texts.append(payload["page_content"])
+                    metadatas.append(payload["metadata"])
+                    if len(texts) >= batch_size:
+                        flush()
+                else:  # "file": todos los chunks de ese PDF ya están en la cola
+                    done_files.append(payload)
+            flush()
+        except BaseException as e:  # se propaga al hilo principal
+            errors.append(e)
+            # vaciar la cola para no bloquear al productor (si falla el último flush ya no llegará _END)
+            while not ended and chunk_queue.get() is not _END:
+                pass
+
+    writer_thread = threading.Thread(target=writer, name="ingest-writer")
+    writer_thread.start()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque(to_process)
+            in_flight: dict = {}
+            while (pending or in_flight) and not errors:
+                while pending and len(in_flight) < workers * 2:
+                    pdf_file = pending.popleft()
+                    in_flight[pool.submit(get_file_chunks, pdf_file)] = pdf_file
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    pdf_file = in_flight.pop(future)
+                    chunks_info = future.result()
+                    for c in chunks_info:
+                        chunk_queue.put(("chunk", c))
+                    entry = manifest_entry(
+                        hashes[pdf_file.name],
+                        [c["page_content"] for c in chunks_info],
+                        [c["metadata"] for c in chunks_info],
+                    )
+                    chunk_queue.put(("file", (pdf_file.name, entry)))
+                    del chunks_info
+    finally:
+        chunk_queue.put(_END)
+        writer_thread.join()
+
+    if errors:
+        raise errors[0]
+    return stats
 
 
 if __name__ == "__main__":
-    ingest_pdfs()
+    parser = argparse.ArgumentParser(description="Ingesta incremental de los PDFs de data/ en Chroma")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Vacía la colección y reprocesa todos los PDFs aunque no hayan cambiado",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Procesos para trocear PDFs en paralelo (0 = modo serie)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=256,
+        help="Chunks por lote de embedding/escritura en el modo paralelo",
+    )
+    args = parser.parse_args()
+    ingest_pdfs(full=args.full, workers=args.workers, batch_size=args.batch_size)
@@ -0,0 +1,90 @@
+# jobs.py
+"""Cola de trabajos de ingesta en segundo plano (uploads de PDF, Excel y URL)"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    user_id: str
+    status: str = "queued"  # queued | running | done | error
+    chunks_processed: int = 0
+    chunks_added: int = 0
+    chunks_skipped: int = 0
+    error: Optional[str] = None
+    detail: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("user_id")
+        return data
+
+
+class JobManager:
+    """
+    Ejecuta los trabajos en un pool con `max_workers` hilos: como mucho esa
+    cantidad de ingestas a la vez, el resto espera en cola. Así una subida
+    grande no bloquea el event loop ni se come la CPU que necesita /chat.
+    """
+
+    def __init__(self, max_workers: int = 1, max_finished: int = 500):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_finished = max_finished
+
+    def submit(self, kind: str, user_id: str, fn: Callable[..., None], *args, **kwargs) -> Job:
+        """`fn(job, *args, **kwargs)` se ejecuta en el pool y puede ir actualizando `job`"""
+        job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def record_done(self, kind: str, user_id: str, **fields) -> Job:
+        """Registra un trabajo que no necesita ejecutarse (p.ej. un archivo ya ingerido)"""
+        now = time.time()
+        job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id, status="done", **fields)
+        job.started_at = job.finished_at = now
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            fn(job, *args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            print(f"Error en trabajo de ingesta {job.id}:", e)
+            job.status = "error"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        """Olvida los trabajos terminados más antiguos"""
+        finished = [j.id for j in self._jobs.values() if j.status in ("done", "error")]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.status == "queued")
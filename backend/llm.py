@@ -0,0 +1,403 @@
+# llm.py
+"""
+Acceso al LLM compartido por todas las peticiones:
+- LLMGate: como mucho LLM_MAX_CONCURRENCY llamadas a la vez y una cola de
+  LLM_MAX_QUEUE; si la cola está llena se responde 503 con Retry-After en
+  lugar de acumular peticiones esperando
+- SingleFlight: las peticiones idénticas (misma pregunta normalizada y mismo
+  contexto) que llegan mientras otra está en curso comparten su llamada
+- HedgedLLM: varios endpoints compatibles con OpenAI (LLM_ENDPOINTS); si el
+  primero no da el primer token antes de su p95, se lanza la misma petición
+  al siguiente, gana el primero que responde y se cancelan los demás
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+
+from metrics import STAGE_SECONDS, Histogram, register_histogram
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+
+# Lista JSON de endpoints, en orden de preferencia inicial, p. ej.
+# [{"name": "mistral", "base_url": "https://openrouter.ai/api/v1", "model": "mistralai/mistral-7b-instruct:free",
+#   "api_key_env": "OPENROUTER_API_KEY", "timeout": 60}, ...]
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+LLM_ENDPOINT_TIMEOUT = float(os.getenv("LLM_ENDPOINT_TIMEOUT", "60"))
+# el plazo de cobertura es este cuantil del primer token del endpoint en curso
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SECONDS = float(os.getenv("LLM_HEDGE_MIN_SECONDS", "0.5"))
+# plazo mientras un endpoint no tiene LLM_HEDGE_MIN_SAMPLES medidas
+LLM_HEDGE_DEFAULT_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_SECONDS", "5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# últimas medidas del primer token por endpoint con las que se calculan mediana y plazo
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+
+FIRST_TOKEN_SECONDS = register_histogram(
+    Histogram("llm_endpoint_first_token_seconds", "Tiempo hasta el primer token por endpoint", "endpoint")
+)
+ENDPOINT_SECONDS = register_histogram(
+    Histogram("llm_endpoint_seconds", "Duración de las respuestas ganadoras por endpoint", "endpoint")
+)
+
+
+class LLMBusy(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail="Hay demasiadas preguntas en cola, inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class LLMGate:
+    """Semáforo con cola acotada alrededor de las llamadas al LLM"""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def retry_after(self) -> int:
+        """Segundos hasta que se libere hueco, estimados con la mediana de chat.llm"""
+        p50 = STAGE_SECONDS.quantile("chat.llm", 0.5) or 5.0
+        rounds = self.waiting / self.max_concurrency + 1
+        return max(1, math.ceil(rounds * p50))
+
+    def check(self) -> None:
+        """Rechazo rápido (antes de recuperar nada) si la cola ya está llena"""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise LLMBusy(self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+class GatedLLM:
+    """Envuelve el cliente de LangChain: cada ainvoke/astream ocupa un hueco del LLMGate"""
+
+    def __init__(self, llm, gate: LLMGate):
+        self.llm = llm
+        self.gate = gate
+
+    async def ainvoke(self, prompt, **kwargs):
+        async with self.gate.slot():
+            return await self.llm.ainvoke(prompt, **kwargs)
+
+    async def astream(self, prompt, **kwargs):
+        async with self.gate.slot():
+            async for chunk in self.llm.astream(prompt, **kwargs):
+                yield chunk
+
+
+def normalize_query(text: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación y con los espacios colapsados"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def flight_key(full_query: str, doc_key: str) -> str:
+    return hashlib.sha1(f"{normalize_query(full_query)}\0{doc_key}".encode("utf-8")).hexdigest()
+
+
+class _Stream:
+    """Tokens de una llamada en curso, para que varios clientes los reciban a la vez"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+
+
+class SingleFlight:
+    """Deduplica llamadas idénticas en curso (no guarda nada cuando terminan)"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.coalesced = 0
+
+    async def call(self, key: str, fn: Callable[[], Awaitable]):
+        """El primero ejecuta `fn()`; los que llegan mientras tanto esperan su resultado"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn())
+        self._calls[key] = future
+        future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: si el primer cliente se desconecta, los demás siguen esperando la llamada
+        return await asyncio.shield(future)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Como call() pero para streaming: todos reciben los tokens desde el principio"""
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _Stream()
+            self._streams[key] = shared
+            # la tarea sigue aunque se desconecte el cliente que la lanzó
+            task = asyncio.ensure_future(self._produce(key, shared, fn))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self.coalesced += 1
+
+        sent = 0
+        while True:
+            async with shared.changed:
+                await shared.changed.wait_for(lambda: len(shared.parts) > sent or shared.done)
+                new = shared.parts[sent:]
+                finished = shared.done
+            for token in new:
+                yield token
+            sent += len(new)
+            if finished and sent == len(shared.parts):
+                break
+        if shared.error is not None:
+            raise shared.error
+
+    async def _produce(self, key: str, shared: _Stream, fn: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for token in fn():
+                async with shared.changed:
+                    shared.parts.append(token)
+                    shared.changed.notify_all()
+        except Exception as e:
+            shared.error = e
+        finally:
+            self._streams.pop(key, None)
+            async with shared.changed:
+                shared.done = True
+                shared.changed.notify_all()
+
+
+@dataclass
+class Completion:
+    """Respuesta (o fragmento) con la misma forma que los mensajes de LangChain"""
+    content: str
+
+
+@dataclass
+class Endpoint:
+    name: str
+    base_url: str
+    model: str
+    api_key: Optional[str] = None
+    timeout: float = LLM_ENDPOINT_TIMEOUT  # plazo para el primer token y para cada petición
+    temperature: float = 0.1
+    wins: int = 0
+    failures: int = 0  # fallos seguidos; se pone a 0 al ganar
+    cancelled: int = 0  # perdedores cancelados antes del primer token (no se sabe cuánto habrían tardado)
+    first_tokens: Deque[float] = field(default_factory=lambda: deque(maxlen=LLM_HEDGE_WINDOW), repr=False)
+    _client: Any = field(default=None, repr=False)
+
+    def observe_first_token(self, seconds: float) -> None:
+        self.first_tokens.append(seconds)
+        FIRST_TOKEN_SECONDS.observe(self.name, seconds)
+
+    def first_token_quantile(self, q: float) -> Optional[float]:
+        """Cuantil de las últimas medidas reales (sin redondear al bucket del histograma)"""
+        if len(self.first_tokens) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(self.first_tokens)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def client(self):
+        if self._client is None:
+            from langchain_openai import ChatOpenAI
+
+            self._client = ChatOpenAI(
+                model=self.model,
+                temperature=self.temperature,
+                openai_api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,  # los reintentos los hace HedgedLLM en otro endpoint
+            )
+        return self._client
+
+
+def load_endpoints(default_base_url: str, default_model: str, default_api_key: Optional[str]) -> List[Endpoint]:
+    """Endpoints de LLM_ENDPOINTS, o uno solo con la configuración de OpenRouter de siempre"""
+    if not LLM_ENDPOINTS.strip():
+        return [Endpoint("default", default_base_url, default_model, default_api_key)]
+    endpoints = []
+    for i, raw in enumerate(json.loads(LLM_ENDPOINTS)):
+        api_key_env = raw.get("api_key_env")
+        endpoints.append(
+            Endpoint(
+                name=raw.get("name") or f"endpoint{i}",
+                base_url=raw.get("base_url", default_base_url),
+                model=raw.get("model", default_model),
+                api_key=os.getenv(api_key_env) if api_key_env else default_api_key,
+                timeout=float(raw.get("timeout", LLM_ENDPOINT_TIMEOUT)),
+                temperature=float(raw.get("temperature", 0.1)),
+            )
+        )
+    return endpoints
+
+
+class HedgedLLM:
+    """
+    Cliente con la interfaz ainvoke/astream que reparte cada petición entre
+    varios endpoints: empieza por el de menor latencia observada y, si no llega
+    el primer token antes del plazo, cubre la petición con el siguiente.
+    """
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("HedgedLLM necesita al menos un endpoint")
+        self.endpoints = endpoints
+        self.hedged = 0
+
+    def expected_seconds(self, endpoint: Endpoint) -> float:
+        """Mediana del primer token (o el plazo por defecto sin datos) más una penalización por fallos"""
+        median = endpoint.first_token_quantile(0.5)
+        return (LLM_HEDGE_DEFAULT_SECONDS if median is None else median) + endpoint.failures * LLM_HEDGE_DEFAULT_SECONDS
+
+    def ordered(self) -> List[Endpoint]:
+        # sort estable: a igualdad se respeta el orden de LLM_ENDPOINTS
+        return sorted(self.endpoints, key=self.expected_seconds)
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        p = endpoint.first_token_quantile(LLM_HEDGE_QUANTILE)
+        if p is None:
+            return LLM_HEDGE_DEFAULT_SECONDS
+        return max(LLM_HEDGE_MIN_SECONDS, p)
+
+    async def _first_token(self, endpoint: Endpoint, prompt, kwargs):
+        """Abre el stream y espera al primer fragmento con texto"""
+        start = time.perf_counter()
+        stream = endpoint.client().astream(prompt, **kwargs).__aiter__()
+
+        async def first() -> str:
+            async for chunk in stream:
+                if chunk.content:
+                    return chunk.content
+            return ""
+
+        try:
+            token = await asyncio.wait_for(first(), endpoint.timeout)
+        except asyncio.CancelledError:
+            # perdedor: su espera es solo una cota inferior y no entra en las medidas
+            # (un endpoint cancelado a los 10 ms no es un endpoint de 10 ms)
+            endpoint.cancelled += 1
+            await stream.aclose()
+            raise
+        except BaseException:
+            await stream.aclose()
+            raise
+        endpoint.observe_first_token(time.perf_counter() - start)
+        return token, stream, start
+
+    async def astream(self, prompt, **kwargs):
+        endpoints = self.ordered()
+        pending: Dict[asyncio.Task, Endpoint] = {}
+        launched = 0
+
+        def launch() -> None:
+            nonlocal launched
+            endpoint = endpoints[launched]
+            launched += 1
+            pending[asyncio.ensure_future(self._first_token(endpoint, prompt, kwargs))] = endpoint
+
+        winner = None
+        last_error: Optional[BaseException] = None
+        launch()
+        try:
+            while pending and winner is None:
+                can_hedge = launched < len(endpoints)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay(endpoints[launched - 1]) if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # el último lanzado no ha dado el primer token a tiempo: se cubre con el siguiente
+                    self.hedged += 1
+                    launch()
+                    continue
+                for task in done:
+                    endpoint = pending.pop(task)
+                    if task.exception() is None:
+                        if winner is None:
+                            winner = (endpoint, *task.result())
+                        else:
+                            await task.result()[1].aclose()
+                    else:
+                        endpoint.failures += 1
+                        last_error = task.exception()
+                        print(f"Error en el endpoint LLM {endpoint.name}:", last_error)
+                if winner is None and not pending and launched < len(endpoints):
+                    launch()  # todos los lanzados han fallado: se pasa al siguiente ya
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if winner is None:
+            raise last_error or RuntimeError("Ningún endpoint LLM ha respondido")
+
+        endpoint, token, stream, start = winner
+        endpoint.wins += 1
+        endpoint.failures = 0
+        try:
+            if token:
+                yield Completion(token)
+            async for chunk in stream:
+                if chunk.content:
+                    yield Completion(chunk.content)
+            ENDPOINT_SECONDS.observe(endpoint.name, time.perf_counter() - start)
+        finally:
+            await stream.aclose()
+
+    async def ainvoke(self, prompt, **kwargs) -> Completion:
+        # también en streaming, para poder cubrir la petición si tarda en empezar
+        parts = [chunk.content async for chunk in self.astream(prompt, **kwargs)]
+        return Completion("".join(parts))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": e.name,
+                "model": e.model,
+                "wins": e.wins,
+                "failures": e.failures,
+                "cancelled": e.cancelled,
+                "first_token_p50": e.first_token_quantile(0.5),
+                "first_token_p95": e.first_token_quantile(LLM_HEDGE_QUANTILE),
+                "hedge_delay": self.hedge_delay(e),
+            }
+            for e in self.ordered()
+        ]
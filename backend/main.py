@@ -1,35 +1,89 @@
-from fastapi import FastAPI, Depends, Path, HTTPException  # <-- añade Depends
+from fastapi import FastAPI, Depends, Path, HTTPException, Query  # <-- añade Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+import asyncio
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.chains import RetrievalQA
+from langchain.schema import Document
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI  
 
 from collections import defaultdict
 from auth import get_current_user  
 from typing import List, Dict, Any
-from db import supabase, upsert_conversation
+from db import get_store
+from cache import SemanticCache, doc_set_key
+from vectorstore import ADD_BATCH_SIZE, DEFAULT_CORPUS, add_unique_documents, chunk_id, delete_ids
+from dedupe import all_source_refs
+from context import PackedContext, pack_context
+from memory import (
+    MEMORY_CONDENSE,
+    Memory,
+    build_full_query,
+    condense_question,
+    load_memory,
+    schedule_summary,
+)
+from rag import WARMUP_QUERY, RAGComponents
+from embeddings import BatchingEmbedder
+from jobs import Job, JobManager
+from uploads import (
+    MAX_UPLOAD_BYTES,
+    MULTIPART_OVERHEAD,
+    UPLOAD_DIR,
+    StoredUpload,
+    UploadRegistry,
+    UploadSizeLimit,
+    save_upload,
+)
+from llm import GatedLLM, HedgedLLM, LLMGate, SingleFlight, flight_key, load_endpoints
+from metrics import observe, register_counter, register_gauge, render_prometheus, span, timing_middleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Tuple
+from contextlib import asynccontextmanager
 
 from fastapi import File, UploadFile
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import UnstructuredExcelLoader
+from excel import is_xlsx, iter_excel_chunks
 from collections.abc import Mapping
-from langchain_community.document_loaders import WebBaseLoader  # [web:349]
+from crawler import CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES, CrawlState, crawl_site
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # el modelo y el índice se cargan en segundo plano: /healthz responde ya,
+    # /readyz cuando el embedder y Chroma están calientes
+    startup = asyncio.create_task(
+        components.start(build_llm, WARMUP_QUERY, RETRIEVER_K, embed_executor)
+    )
+    yield
+    startup.cancel()
 
-app = FastAPI(title="RAG Chatbot")
+
+app = FastAPI(title="RAG Chatbot", lifespan=lifespan)
+
+# Tiempos por etapa (cabecera Server-Timing) y perfiles de peticiones lentas
+app.middleware("http")(timing_middleware)
 
 origins = [
     "http://localhost:5173",          # para desarrollo Vite
     "https://usuariobot.netlify.app",   # tu dominio en producción
 ]
 
+# 413 por Content-Length o, si no lo hay, en cuanto el cuerpo recibido pasa del límite
+# (antes que CORS: el último en añadirse es el exterior y así el 413 lleva sus cabeceras)
+app.add_middleware(
+    UploadSizeLimit,
+    paths=("/upload-pdf", "/upload-excel"),
+    max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+)
+
 # CORS para que el frontend en Netlify pueda conectarse
 app.add_middleware(
     CORSMiddleware,
@@ -37,25 +91,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 class Question(BaseModel):
     question: str
     conversation_id: Optional[str] = None  # nuevo campo
+    corpus_id: Optional[str] = None  # limitar los documentos propios a un corpus (la base se busca siempre)
 
-# 1. Embeddings (igual que en ingest.py)
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
 
-# 2. Cargar Chroma desde vector_db/
-vectordb = Chroma(
-    embedding_function=embeddings,
-    persist_directory="./vector_db",
-)
+class BatchQuestions(BaseModel):
+    questions: List[str]
+    corpus_id: Optional[str] = None
+    concurrency: int = 4  # llamadas al LLM a la vez para este lote (acotado por BATCH_MAX_CONCURRENCY)
+
+# 1-2. Embeddings (los mismos que en ingest.py) y Chroma desde vector_db/:
+# se cargan en el arranque (ver lifespan y rag.py), no al importar este módulo
+components = RAGComponents()
 
-# 3. Retriever (top 5 documentos más similares)
-retriever = vectordb.as_retriever(search_kwargs={"k": 10})
+# 3. Nº de documentos más similares que se pasan al LLM
+RETRIEVER_K = 10
 
 # 4. Prompt optimizado para español
 prompt_template = """
@@ -111,105 +166,402 @@ PROMPT = PromptTemplate(
 # 5. LLM de Hugging Face (Llama 3.2, gratis)
 # Token de OpenRouter (gratis en openrouter.ai/keys)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-llm = ChatOpenAI(
-    model="mistralai/mistral-7b-instruct:free",  # Específicamente la versión gratis
-    temperature=0.1,
-    openai_api_key=OPENROUTER_API_KEY,
-    base_url="https://openrouter.ai/api/v1",
-)
+# Configurables para poder apuntar a un servidor compatible con OpenAI local (bench/fake_llm.py)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "mistralai/mistral-7b-instruct:free")  # Específicamente la versión gratis
+
+
+# Todas las llamadas al LLM (respuesta, reformulación, resúmenes) pasan por el mismo
+# semáforo con cola acotada; las preguntas idénticas en curso comparten llamada (ver llm.py)
+llm_gate = LLMGate()
+single_flight = SingleFlight()
+
+
+def build_llm():
+    # uno o varios endpoints (LLM_ENDPOINTS) con cobertura por latencia (ver llm.HedgedLLM)
+    endpoints = load_endpoints(OPENROUTER_BASE_URL, LLM_MODEL, OPENROUTER_API_KEY)
+    return GatedLLM(HedgedLLM(endpoints), llm_gate)
+
 
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=retriever,
-    chain_type_kwargs={"prompt": PROMPT},
-    return_source_documents=True,
+def require_llm_capacity():
+    """503 inmediato (con Retry-After) si la cola del LLM está llena"""
+    llm_gate.check()
+
+
+# 6. Pool acotado para el trabajo de CPU (embedding de la query + búsqueda en Chroma),
+# para no competir con el threadpool de FastAPI
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+embed_executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+
+
+# 6b. Las preguntas concurrentes se codifican juntas en lotes (ver embeddings.BatchingEmbedder);
+# el mismo vector sirve para la búsqueda y para la caché semántica
+query_embedder = BatchingEmbedder(
+    lambda texts: components.embeddings.embed_queries(texts), embed_executor
 )
 
-@app.post("/chat")
-def chat(payload: Question, user = Depends(get_current_user)):
-    user_id = user["sub"]
 
-    # ==== 1) Recuperar historial del hilo (si existe) ====
-    history = []
-    if payload.conversation_id:
-        try:
-            row = (
-                supabase.table("conversations")
-                .select("messages")
-                .eq("id", payload.conversation_id)
-                .eq("user_id", user_id)
-                .single()
-                .execute()
-            )
-            history = row.data.get("messages") or []
-        except Exception as e:
-            print("Error cargando historial:", e)
+async def require_ready():
+    """Dependencia de las rutas que necesitan el modelo y el índice"""
+    await components.wait_ready()
+
+
+async def retrieve(
+    user_id: str, query: str, corpus_id: Optional[str] = None
+) -> Tuple[List[float], PackedContext]:
+    """
+    Embedding + búsqueda top-k en el pool acotado y montaje del contexto
+    (fusión de vecinos, MMR y presupuesto de tokens); devuelve también el vector de la query
+    """
+    loop = asyncio.get_running_loop()
+    with span("chat.embed"):
+        vector = await query_embedder.embed(query)
+    with span("chat.search"):
+        docs, doc_vectors = await loop.run_in_executor(
+            embed_executor,
+            partial(components.index.search, user_id, vector, RETRIEVER_K, corpus_id),
+        )
+    with span("chat.pack"):
+        packed = pack_context(vector, docs, doc_vectors)
+    return vector, packed
 
-    # nos quedamos con los últimos N mensajes para no hacer el prompt gigante
-    last_messages = history[-6:]
 
-    history_text = ""
-    for m in last_messages:
-        role = m.get("role")
-        content = m.get("content", "")
-        if not content:
-            continue
-        prefix = "Usuario:" if role == "user" else "Asistente:"
-        history_text += f"{prefix} {content}\n"
+# 7. Caché semántica de respuestas (solo para preguntas sin historial previo,
+# porque con historial la respuesta depende también de la conversación)
+answer_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+)
 
-    # ==== 2) Construir la query con historial + nueva pregunta ====
-    if history_text:
-        full_query = f"{history_text}\nUsuario: {payload.question}\nAsistente:"
+
+async def recall(
+    user_id: str, conversation_id: Optional[str], question: str, corpus_id: Optional[str] = None
+) -> Tuple[Memory, List[float], PackedContext]:
+    """
+    Memoria del hilo y recuperación. La búsqueda usa la pregunta reformulada
+    como independiente (memory.condense_question), nunca el historial en bruto.
+    """
+    if not MEMORY_CONDENSE or not conversation_id:
+        # sin reformular (o en un hilo nuevo, sin historial), historial y búsqueda van en paralelo
+        memory, (vector, packed) = await asyncio.gather(
+            load_memory(user_id, conversation_id), retrieve(user_id, question, corpus_id)
+        )
+        return memory, vector, packed
+
+    # la búsqueda con la pregunta tal cual arranca ya; sirve si la reformulación no la cambia
+    # (historial vacío o pregunta ya independiente)
+    raw = asyncio.create_task(retrieve(user_id, question, corpus_id))
+    raw.add_done_callback(lambda t: t.cancelled() or t.exception())  # sin avisos si se descarta
+    try:
+        memory = await load_memory(user_id, conversation_id)
+        search_question = await condense_question(components.llm, memory, question)
+    except BaseException:
+        raw.cancel()
+        raise
+    if search_question.strip() == question.strip():
+        vector, packed = await raw
     else:
-        full_query = payload.question
+        raw.cancel()
+        vector, packed = await retrieve(user_id, search_question, corpus_id)
+    return memory, vector, packed
+
 
-    # ==== 3) Llamar al QA con la query enriquecida ====
-    out = qa_chain({"query": full_query})
-    answer = out["result"]
-    docs = out.get("source_documents", [])
+def build_prompt(docs: List[Document], full_query: str) -> str:
+    """Mismo formato que la cadena "stuff": chunks separados por una línea en blanco"""
+    context = "\n\n".join(d.page_content for d in docs)
+    return PROMPT.format(context=context, question=full_query)
 
-    # ==== 4) Construir fuentes como antes ====
+
+def build_sources(docs) -> List[Dict[str, str]]:
+    """Agrupa las páginas citadas por archivo"""
     pages_by_file = defaultdict(set)
     for d in docs:
-        meta = d.metadata or {}
-        file_name = meta.get("file_name", meta.get("source", "Unknown"))
-        page = meta.get("page_number")
-        if page is not None:
-            pages_by_file[file_name].add(page)
+        # un chunk fusionado con sus casi duplicados cita también sus fuentes
+        for ref in all_source_refs(d.metadata or {}):
+            if ref["page_number"] is not None:
+                pages_by_file[ref["file_name"]].add(ref["page_number"])
 
     sources = []
     for file_name, pages in pages_by_file.items():
         page_list = sorted(
-            p for p in pages if isinstance(p, int) or str(p).isdigit()
+            int(p) for p in pages if isinstance(p, int) or str(p).isdigit()
         )
-        page_str = ", ".join(str(p) for p in page_list)
+        # etiquetas no numéricas, p. ej. hoja y filas de un Excel ("Datos 2-21")
+        labels = sorted(str(p) for p in pages if not (isinstance(p, int) or str(p).isdigit()))
+        page_str = ", ".join([str(p) for p in page_list] + labels)
         sources.append({"file": file_name, "pages": page_str})
+    return sources
 
-    # ==== 5) Guardar los nuevos mensajes en Supabase ====
+
+async def save_turn(
+    user_id: str,
+    question: str,
+    answer: str,
+    sources: List[Dict[str, str]],
+    conversation_id: Optional[str],
+) -> Optional[str]:
+    """Guarda pregunta y respuesta en Supabase y devuelve el id del hilo"""
     messages_to_save = [
-        {"role": "user", "content": payload.question},
+        {"role": "user", "content": question},
         {"role": "assistant", "content": answer, "sources": sources},
     ]
 
-    conversation_id: Optional[str] = payload.conversation_id
-
     try:
-        conversation_id = upsert_conversation(
-            user_id=user_id,
-            messages=messages_to_save,
-            conversation_id=conversation_id,
-        )
+        with span("chat.save"):
+            conversation_id = await get_store().append_messages(
+                user_id=user_id,
+                messages=messages_to_save,
+                conversation_id=conversation_id,
+            )
     except Exception as e:
         print("Error guardando conversación:", e)
 
+    return conversation_id
+
+
+@app.post("/chat", dependencies=[Depends(require_ready), Depends(require_llm_capacity)])
+async def chat(payload: Question, user = Depends(get_current_user)):
+    user_id = user["sub"]
+
+    # ==== 1) Memoria del hilo y recuperación con la pregunta independiente ====
+    memory, query_vector, packed = await recall(
+        user_id, payload.conversation_id, payload.question, payload.corpus_id
+    )
+    docs = packed.docs
+
+    # ==== 2) Construir la query con resumen + mensajes recientes + nueva pregunta ====
+    full_query = build_full_query(memory, payload.question)
+
+    # ==== 3) Caché semántica o LLM con el contexto recuperado ====
+    cache_key = doc_set_key(docs)
+    cached = None if not memory.empty else answer_cache.lookup(query_vector, cache_key)
+    if cached is not None:
+        answer, sources = cached.answer, cached.sources
+    else:
+        prompt = build_prompt(docs, full_query)
+        with span("chat.llm"):
+            result = await single_flight.call(
+                flight_key(full_query, cache_key), partial(components.llm.ainvoke, prompt)
+            )
+        answer = result.content
+
+        # ==== 4) Construir fuentes como antes ====
+        sources = build_sources(docs)
+        if memory.empty:
+            answer_cache.store(query_vector, cache_key, answer, sources)
+
+    # ==== 5) Guardar los nuevos mensajes en Supabase ====
+    conversation_id = await save_turn(
+        user_id, payload.question, answer, sources, payload.conversation_id
+    )
+    schedule_summary(components.llm, user_id, conversation_id, memory)
+
     return {
         "answer": answer,
         "sources": sources,
         "conversation_id": conversation_id,
+        "cached": cached is not None,
+        "context": packed.to_dict(),
     }
 
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: el proceso responde"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: modelo de embeddings e índice cargados y calentados"""
+    body = {"ready": components.ready, "ready_seconds": components.ready_seconds}
+    if components.error:
+        body["error"] = components.error
+    return JSONResponse(status_code=200 if components.ready else 503, content=body)
+
+
+@app.get("/metrics")
+def metrics():
+    """Histogramas por etapa en formato Prometheus"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/llm/endpoints")
+def llm_endpoints(user = Depends(get_current_user)):
+    """Orden actual de los endpoints LLM, victorias y plazos de cobertura"""
+    return components.llm.llm.stats() if components.llm else []
+
+
+@app.get("/cache/stats")
+def cache_stats(user = Depends(get_current_user)):
+    """Contadores de aciertos/fallos de la caché semántica"""
+    return answer_cache.stats()
+
+
+async def llm_tokens(prompt: str):
+    """Fragmentos de texto no vacíos del LLM en streaming"""
+    async for chunk in components.llm.astream(prompt):
+        if chunk.content:
+            yield chunk.content
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Serializa un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream", dependencies=[Depends(require_ready), Depends(require_llm_capacity)])
+async def chat_stream(payload: Question, user = Depends(get_current_user)):
+    """
+    Variante de /chat en streaming (text/event-stream).
+
+    Eventos, en orden:
+    - sources: fuentes recuperadas y resumen del contexto, antes de llamar al LLM
+    - token:   cada fragmento de texto según lo genera el modelo
+    - done:    conversation_id, después de guardar el hilo
+    - error:   si falla el LLM (no se guarda nada)
+    """
+    user_id = user["sub"]
+
+    async def event_stream():
+        # 1) Memoria del hilo y recuperación con la pregunta independiente
+        memory, query_vector, packed = await recall(
+            user_id, payload.conversation_id, payload.question, payload.corpus_id
+        )
+        docs = packed.docs
+        full_query = build_full_query(memory, payload.question)
+
+        cache_key = doc_set_key(docs)
+        cached = None if not memory.empty else answer_cache.lookup(query_vector, cache_key)
+
+        # 2) Fuentes primero, para que el frontend pueda pintarlas ya
+        sources = cached.sources if cached is not None else build_sources(docs)
+        yield sse_event("sources", {"sources": sources, "context": packed.to_dict()})
+
+        # 3) Tokens según llegan del LLM (o la respuesta cacheada de una vez)
+        parts: List[str] = []
+        if cached is not None:
+            parts.append(cached.answer)
+            yield sse_event("token", {"token": cached.answer})
+        else:
+            try:
+                llm_start = time.perf_counter()
+                tokens = single_flight.stream(
+                    flight_key(full_query, cache_key),
+                    partial(llm_tokens, build_prompt(docs, full_query)),
+                )
+                async for token in tokens:
+                    if not parts:
+                        observe("chat.llm_first_token", time.perf_counter() - llm_start)
+                    parts.append(token)
+                    yield sse_event("token", {"token": token})
+                observe("chat.llm", time.perf_counter() - llm_start)
+            except Exception as e:
+                print("Error en streaming del LLM:", e)
+                yield sse_event("error", {"detail": str(e)})
+                return
+
+        # 4) Guardar y cerrar con el id del hilo
+        answer = "".join(parts)
+        if cached is None and memory.empty:
+            answer_cache.store(query_vector, cache_key, answer, sources)
+        conversation_id = await save_turn(
+            user_id, payload.question, answer, sources, payload.conversation_id
+        )
+        schedule_summary(components.llm, user_id, conversation_id, memory)
+        yield sse_event("done", {"conversation_id": conversation_id})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+
+@app.post("/chat/batch", dependencies=[Depends(require_ready), Depends(require_llm_capacity)])
+async def chat_batch(payload: BatchQuestions, user = Depends(get_current_user)):
+    """
+    Evaluación offline: muchas preguntas sin historial, respondidas en NDJSON
+    (una línea por pregunta, en el orden en que terminan). Las preguntas se
+    embeben en un solo lote y se buscan con una sola consulta a Chroma; las
+    llamadas al LLM van con concurrencia acotada. No usa la caché semántica
+    ni guarda conversaciones.
+    """
+    questions = payload.questions
+    if not questions:
+        raise HTTPException(status_code=400, detail="La lista de preguntas está vacía")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413, detail=f"Máximo {BATCH_MAX_QUESTIONS} preguntas por lote"
+        )
+    concurrency = max(1, min(payload.concurrency, BATCH_MAX_CONCURRENCY))
+
+    async def results():
+        loop = asyncio.get_running_loop()
+
+        # 1) Embeddings y búsqueda de todo el lote de una vez
+        start = time.perf_counter()
+        with span("batch.embed"):
+            vectors = await loop.run_in_executor(
+                embed_executor, components.embeddings.embed_queries, questions
+            )
+        embed_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        with span("batch.search"):
+            hits = await loop.run_in_executor(
+                embed_executor,
+                partial(
+                    components.index.search_many, user["sub"], vectors, RETRIEVER_K, payload.corpus_id
+                ),
+            )
+        search_ms = (time.perf_counter() - start) * 1000
+
+        # 2) LLM con concurrencia acotada; cada respuesta se emite en cuanto termina
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(i: int) -> Dict[str, Any]:
+            packed = pack_context(vectors[i], *hits[i])
+            line: Dict[str, Any] = {
+                "index": i,
+                "question": questions[i],
+                "sources": build_sources(packed.docs),
+                "context": packed.to_dict(),
+            }
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await components.llm.ainvoke(build_prompt(packed.docs, questions[i]))
+                    line["answer"] = result.content
+                except Exception as e:
+                    print(f"Error en el lote (pregunta {i}):", e)
+                    line["error"] = str(e)
+                llm_ms = (time.perf_counter() - start) * 1000
+            observe("batch.llm", llm_ms / 1000)
+            # embed/search son del lote entero; llm es de esta pregunta
+            line["timings"] = {
+                "batch_embed_ms": round(embed_ms, 1),
+                "batch_search_ms": round(search_ms, 1),
+                "llm_ms": round(llm_ms, 1),
+            }
+            return line
+
+        tasks = [asyncio.ensure_future(answer(i)) for i in range(len(questions))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+        finally:
+            # si el cliente corta la conexión no se siguen pidiendo respuestas
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 # @app.post("/chat")
 # def chat(payload: Question, user = Depends(get_current_user)):
 #     user_id = user["sub"]
@@ -259,108 +611,129 @@ def chat(payload: Question, user = Depends(get_current_user)):
 
 
 @app.get("/conversations")
-def list_conversations(user = Depends(get_current_user)):
+async def list_conversations(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+    user = Depends(get_current_user),
+):
     user_id = user["sub"]
 
-    result = (
-        supabase.table("conversations")
-        .select("id, title, created_at")
-        .eq("user_id", user_id)
-        .order("created_at", desc=True)
-        .execute()
-    )
-
-    # result.data ya respeta RLS: solo tus filas
-    return {"conversations": result.data}
+    # solo las filas del usuario, con resumen (message_count, last_activity) y sin mensajes
+    conversations, next_cursor = await get_store().list_conversations(user_id, limit, cursor)
+    return {"conversations": conversations, "next_cursor": next_cursor}
 
 @app.get("/conversations/{conversation_id}")
-def get_conversation(
+async def get_conversation(
     conversation_id: str = Path(...),
+    before: Optional[int] = Query(None, description="id del mensaje más antiguo ya cargado"),
+    limit: int = Query(50, ge=1, le=200),
     user = Depends(get_current_user),
 ):
     user_id = user["sub"]
 
-    result = (
-        supabase.table("conversations")
-        .select("id, title, messages, created_at")
-        .eq("user_id", user_id)
-        .eq("id", conversation_id)
-        .single()
-        .execute()
-    )
+    # ventana de los últimos `limit` mensajes anteriores a `before`
+    conversation = await get_store().get_conversation(user_id, conversation_id, before, limit)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
-    return {"conversation": result.data}
+    return {"conversation": conversation}
 
 class RenamePayload(BaseModel):
   title: str
 
 @app.put("/conversations/{conversation_id}/title")
-def rename_conversation(
+async def rename_conversation(
     conversation_id: str,
     payload: RenamePayload,
     user = Depends(get_current_user),
 ):
     user_id = user["sub"]
-    from db import supabase
-
-    (
-        supabase.table("conversations")
-        .update({"title": payload.title})
-        .eq("id", conversation_id)
-        .eq("user_id", user_id)
-        .execute()
-    )
+
+    await get_store().rename_conversation(user_id, conversation_id, payload.title)
 
     return {"ok": True}
 
 @app.delete("/conversations/{conversation_id}")
-def delete_conversation(conversation_id: str, user = Depends(get_current_user)):
+async def delete_conversation(conversation_id: str, user = Depends(get_current_user)):
     user_id = user["sub"]
-    from db import supabase
-
-    res = (
-        supabase.table("conversations")
-        .delete()
-        .eq("id", conversation_id)
-        .eq("user_id", user_id)
-        .execute()
-    )
 
-    if not res.data:
+    deleted = await get_store().delete_conversation(user_id, conversation_id)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     return {"ok": True}
 
-@app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...), user = Depends(get_current_user)):
-    if file.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="Solo se admiten PDFs")
+# ==== Ingesta de uploads en segundo plano ====
+# Las funciones ingest_* se ejecutan en el pool de jobs.py, nunca en el event loop
+ingest_jobs = JobManager(max_workers=int(os.getenv("MAX_INGEST_JOBS", "1")))
+upload_registry = UploadRegistry()
+crawl_state = CrawlState()
+
+register_gauge("startup_ready_seconds", "Segundos hasta estar listo", lambda: components.ready_seconds or 0)
+register_gauge("ingest_jobs_queued", "Trabajos de ingesta esperando en cola", ingest_jobs.queue_depth)
+register_counter("semantic_cache_hits_total", "Aciertos de la caché semántica", lambda: answer_cache.hits)
+register_counter("semantic_cache_misses_total", "Fallos de la caché semántica", lambda: answer_cache.misses)
+register_gauge("llm_in_flight", "Llamadas al LLM en curso", lambda: llm_gate.in_flight)
+register_gauge("llm_queue_depth", "Llamadas esperando hueco en el LLM", lambda: llm_gate.waiting)
+register_counter("llm_rejected_total", "Peticiones rechazadas con 503 por cola llena", lambda: llm_gate.rejected)
+register_counter(
+    "llm_hedged_total",
+    "Peticiones cubiertas con un segundo endpoint",
+    lambda: components.llm.llm.hedged if components.llm else 0,
+)
+register_counter("llm_coalesced_total", "Peticiones que compartieron una llamada en curso", lambda: single_flight.coalesced)
+
 
-    # 1) Guardar el PDF en disco
-    os.makedirs("pdf_uploads", exist_ok=True)
-    file_path = os.path.join("pdf_uploads", file.filename)
+def add_to_index(job: Job, split_docs, corpus_id: str) -> None:
+    """
+    Añade los chunks nuevos a la colección del usuario (etiquetados con owner y
+    corpus_id) e invalida la caché si cambia el corpus
+    """
+    processed = job.chunks_processed
 
-    contents = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    def progress(n: int):
+        job.chunks_processed += n
+
+    for d in split_docs:
+        d.metadata = {**(d.metadata or {}), "owner": job.user_id, "corpus_id": corpus_id}
+
+    # solo se embeben/añaden los chunks que no estaban ya indexados en este corpus
+    # (corpus_id forma parte del id: el mismo archivo en otro corpus se indexa de nuevo)
+    vectordb = components.index.collection(job.user_id, create=True)
+    added_ids, merged_ids = add_unique_documents(vectordb, split_docs, progress=progress)
+    if added_ids or merged_ids:
+        # el corpus ha cambiado (también si solo han ganado fuentes los chunks que ya estaban)
+        answer_cache.invalidate()
+
+    # acumulado: las subidas grandes llegan en varios lotes
+    job.chunks_processed = processed + len(split_docs)
+    job.chunks_added += len(added_ids)
+    job.chunks_skipped += len(split_docs) - len(added_ids)
+
+
+def ingest_pdf_file(job: Job, upload: StoredUpload, corpus_id: str) -> None:
+    file_path = upload.path
 
     # 2) Cargar y trocear el PDF
     loader = PyPDFLoader(file_path)
-    docs = loader.load()
+    with span("upload.parse"):
+        docs = loader.load()
 
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=800,
         chunk_overlap=150,
+        add_start_index=True,
     )
-    split_docs = splitter.split_documents(docs)
+    with span("upload.split"):
+        split_docs = splitter.split_documents(docs)
 
     # 3) Normalizar metadata para que /chat pueda construir las fuentes
     for d in split_docs:
         meta = d.metadata or {}
 
-        # nombre de archivo amigable
-        source_path = meta.get("source", file_path)
-        meta.setdefault("file_name", os.path.basename(source_path))
+        # nombre de archivo amigable (el original, no el hash con el que se guarda)
+        meta["source"] = upload.file_name
+        meta.setdefault("file_name", upload.file_name)
 
         # page_number a partir de page (PyPDFLoader usa 'page')
         if "page_number" not in meta and "page" in meta:
@@ -369,38 +742,48 @@ async def upload_pdf(file: UploadFile = File(...), user = Depends(get_current_us
         d.metadata = meta
 
     # 4) Añadir a tu Chroma existente
-    vectordb.add_documents(split_docs)
+    add_to_index(job, split_docs, corpus_id)
+    upload_registry.record(job.user_id, corpus_id, upload.sha256, upload.file_name, len(split_docs))
 
-    return {"ok": True, "chunks_added": len(split_docs)}
 
+def ingest_excel_file(job: Job, upload: StoredUpload, corpus_id: str) -> None:
+    file_path = upload.path
 
-@app.post("/upload-excel")
-async def upload_excel(
-    file: UploadFile = File(...),
-    user = Depends(get_current_user),
-):
-    if file.content_type not in (
-        "application/vnd.ms-excel",
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    ):
-        raise HTTPException(status_code=400, detail=f"Tipo no soportado: {file.content_type}")
+    if not is_xlsx(file_path):
+        return ingest_legacy_excel_file(job, upload, corpus_id)
+
+    # 2) Leer el libro fila a fila y embeber/escribir por lotes, sin tenerlo entero en memoria
+    metadata = {"source": upload.file_name, "file_name": upload.file_name}
+    chunks = iter_excel_chunks(file_path, metadata)
+    while True:
+        try:
+            with span("upload.parse"):
+                batch = list(islice(chunks, ADD_BATCH_SIZE))
+        except Exception as e:
+            print("Error cargando Excel:", e)
+            raise RuntimeError(f"Error cargando Excel: {e}")
+        if not batch:
+            break
+        add_to_index(job, [Document(page_content=t, metadata=m) for t, m in batch], corpus_id)
+
+    upload_registry.record(job.user_id, corpus_id, upload.sha256, upload.file_name, job.chunks_processed)
 
-    os.makedirs("excel_uploads", exist_ok=True)
-    file_path = os.path.join("excel_uploads", file.filename)
 
-    contents = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(contents)
+def ingest_legacy_excel_file(job: Job, upload: StoredUpload, corpus_id: str) -> None:
+    """.xls (formato binario antiguo): openpyxl no lo lee, se usa Unstructured"""
+    file_path = upload.path
 
     try:
         loader = UnstructuredExcelLoader(file_path, mode="elements")
-        docs = loader.load()
+        with span("upload.parse"):
+            docs = loader.load()
     except Exception as e:
         print("Error cargando Excel:", e)
-        raise HTTPException(status_code=500, detail=f"Error cargando Excel: {e}")
+        raise RuntimeError(f"Error cargando Excel: {e}")
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=150)
-    split_docs = splitter.split_documents(docs)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=150, add_start_index=True)
+    with span("upload.split"):
+        split_docs = splitter.split_documents(docs)
 
     def sanitize_value(v):
         # Chroma solo acepta str, int, float, bool, None
@@ -416,78 +799,177 @@ async def upload_excel(
 
     for d in split_docs:
         meta = d.metadata or {}
-        source_path = meta.get("source", file_path)
-        meta.setdefault("file_name", os.path.basename(source_path))
+        meta["source"] = upload.file_name
+        meta.setdefault("file_name", upload.file_name)
         meta.setdefault("page_number", 1)
 
         # sanear TODOS los valores de metadata
         meta = {k: sanitize_value(v) for k, v in meta.items()}
         d.metadata = meta
 
-    vectordb.add_documents(split_docs)
-
-    return {"ok": True, "chunks_added": len(split_docs)}
+    add_to_index(job, split_docs, corpus_id)
+    upload_registry.record(job.user_id, corpus_id, upload.sha256, upload.file_name, len(split_docs))
 
-class UrlPayload(BaseModel):
-    url: str
 
-@app.post("/upload-url")
-async def upload_url(payload: UrlPayload, user = Depends(get_current_user)):
-    url = payload.url.strip()
-    if not url.startswith("http://") and not url.startswith("https://"):
-        raise HTTPException(status_code=400, detail="La URL debe empezar por http:// o https://")
+def ingest_url(job: Job, url: str, corpus_id: str, max_depth: int, max_pages: int) -> None:
+    # 2) Rastrear (con peticiones condicionales frente a lo ya indexado de este corpus)
+    known = crawl_state.pages(job.user_id, corpus_id)
+    with span("upload.parse"):
+        pages, seconds = crawl_site(url, known, max_depth=max_depth, max_pages=max_pages)
 
-    try:
-      loader = WebBaseLoader(url)
-      docs = loader.load()  # descarga y parsea la página [web:344][web:349]
-    except Exception as e:
-      print("Error cargando URL:", e)
-      raise HTTPException(status_code=500, detail=f"Error cargando URL: {e}")
+    root = pages[0]
+    if root.status == "error":
+        print("Error cargando URL:", root.error)
+        raise RuntimeError(f"Error cargando URL: {root.error}")
 
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=800,
         chunk_overlap=150,
+        add_start_index=True,
     )
-    split_docs = splitter.split_documents(docs)
-
-    def sanitize_value(v):
-        if isinstance(v, (str, int, float, bool)) or v is None:
-            return v
-        return str(v)
-
-    for d in split_docs:
-        meta = d.metadata or {}
-        meta.setdefault("file_name", url)      # para que salga como fuente
-        meta.setdefault("page_number", 1)
-        meta = {k: sanitize_value(v) for k, v in meta.items()}
-        d.metadata = meta
-
-    vectordb.add_documents(split_docs)
-
-    return {"ok": True, "chunks_added": len(split_docs)}
-
-
-
-
-
-
-
-
+    vectordb = components.index.collection(job.user_id, create=True)
+    entries = {}
+    gone = []
+    for page in pages:
+        if page.status == "error":
+            print("Error cargando URL:", page.url, page.error)
+            continue
+        old_ids = known.get(page.url, {}).get("chunk_ids", [])
+        if page.status == "gone":
+            # ya indexada y ahora 404/410: fuera sus chunks y su entrada
+            if old_ids:
+                delete_ids(vectordb, old_ids)
+                answer_cache.invalidate()
+            gone.append(page.url)
+            continue
+        chunk_ids = old_ids
+
+        # 3) Solo las páginas nuevas o con otro texto se trocean y embeben
+        if page.status in ("new", "changed"):
+            doc = Document(
+                page_content=page.text,
+                metadata={
+                    "source": page.url,
+                    "file_name": page.url,
+                    "page_number": 1,
+                    "title": page.title,
+                    # va en el id del chunk: la misma página en otro corpus son chunks distintos
+                    "corpus_id": corpus_id,
+                },
+            )
+            with span("upload.split"):
+                split_docs = splitter.split_documents([doc])
+            chunk_ids = list(dict.fromkeys(chunk_id(d.page_content, d.metadata) for d in split_docs))
+
+            # los chunks que ya no están en la página nueva se borran; los que siguen igual no se reembeben
+            current = set(chunk_ids)
+            stale = [cid for cid in old_ids if cid not in current]
+            if stale:
+                delete_ids(vectordb, stale)
+                answer_cache.invalidate()
+            add_to_index(job, split_docs, corpus_id)
+
+        entries[page.url] = {
+            "etag": page.etag,
+            "last_modified": page.last_modified,
+            "sha256": page.sha256,
+            "links": page.links,
+            "chunk_ids": chunk_ids,
+            "fetched_at": time.time(),
+        }
+    crawl_state.update(job.user_id, corpus_id, entries, removed=gone)
+
+    counts = defaultdict(int)
+    for page in pages:
+        counts[page.status] += 1
+    job.detail = {
+        "pages": len(pages),
+        **counts,
+        "pages_per_s": round(len(pages) / seconds, 1) if seconds else None,
+    }
 
 
+def job_response(job: Job) -> Dict[str, Any]:
+    return {"ok": True, "job_id": job.id, "status": job.status}
 
 
+def enqueue_upload(
+    kind: str, user_id: str, fn, upload: StoredUpload, corpus_id: str
+) -> Dict[str, Any]:
+    """Encola la ingesta salvo que ese mismo contenido ya esté en el corpus del usuario"""
+    existing = upload_registry.get(user_id, corpus_id, upload.sha256)
+    if existing is not None:
+        job = ingest_jobs.record_done(
+            kind,
+            user_id,
+            chunks_processed=existing["chunks"],
+            chunks_skipped=existing["chunks"],
+            detail={"duplicate_of": existing["file_name"]},
+        )
+        return {**job_response(job), "duplicate": True, "chunks_existing": existing["chunks"]}
 
+    job = ingest_jobs.submit(kind, user_id, fn, upload, corpus_id)
+    return job_response(job)
 
 
+@app.post("/upload-pdf", status_code=202, dependencies=[Depends(require_ready)])
+async def upload_pdf(
+    file: UploadFile = File(...),
+    corpus_id: str = Query(DEFAULT_CORPUS, min_length=1, max_length=64),
+    user = Depends(get_current_user),
+):
+    if file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="Solo se admiten PDFs")
 
+    # 1) Guardar el PDF en disco (por bloques, con límite de tamaño)
+    upload = await save_upload(file, os.path.join(UPLOAD_DIR, "pdf_uploads"))
 
+    # 2-4) Trocear y añadir a Chroma en segundo plano
+    return enqueue_upload("pdf", user["sub"], ingest_pdf_file, upload, corpus_id)
 
 
+@app.post("/upload-excel", status_code=202, dependencies=[Depends(require_ready)])
+async def upload_excel(
+    file: UploadFile = File(...),
+    corpus_id: str = Query(DEFAULT_CORPUS, min_length=1, max_length=64),
+    user = Depends(get_current_user),
+):
+    if file.content_type not in (
+        "application/vnd.ms-excel",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ):
+        raise HTTPException(status_code=400, detail=f"Tipo no soportado: {file.content_type}")
 
+    upload = await save_upload(file, os.path.join(UPLOAD_DIR, "excel_uploads"))
+    return enqueue_upload("excel", user["sub"], ingest_excel_file, upload, corpus_id)
 
+class UrlPayload(BaseModel):
+    url: str
+    corpus_id: str = DEFAULT_CORPUS
+    # False: solo esa página; True: también los enlaces del mismo dominio
+    crawl: bool = False
+    max_depth: Optional[int] = None  # como mucho CRAWL_MAX_DEPTH
+    max_pages: Optional[int] = None  # como mucho CRAWL_MAX_PAGES
 
+@app.post("/upload-url", status_code=202, dependencies=[Depends(require_ready)])
+async def upload_url(payload: UrlPayload, user = Depends(get_current_user)):
+    url = payload.url.strip()
+    if not url.startswith("http://") and not url.startswith("https://"):
+        raise HTTPException(status_code=400, detail="La URL debe empezar por http:// o https://")
 
+    if payload.crawl:
+        max_depth = min(payload.max_depth if payload.max_depth is not None else CRAWL_MAX_DEPTH, CRAWL_MAX_DEPTH)
+        max_pages = min(payload.max_pages or CRAWL_MAX_PAGES, CRAWL_MAX_PAGES)
+    else:
+        max_depth, max_pages = 0, 1
 
+    job = ingest_jobs.submit("url", user["sub"], ingest_url, url, payload.corpus_id, max(max_depth, 0), max_pages)
+    return job_response(job)
 
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, user = Depends(get_current_user)):
+    job = ingest_jobs.get(job_id)
+    if job is None or job.user_id != user["sub"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job": job.to_dict()}
@@ -0,0 +1,205 @@
+# memory.py
+"""
+Memoria de la conversación para /chat:
+- los últimos mensajes, recortados a un presupuesto de tokens
+- un resumen acumulado de los turnos anteriores, que se actualiza de forma
+  incremental después de cada turno y se guarda con la conversación
+- la pregunta reformulada como pregunta independiente, que es lo único que
+  se usa para la búsqueda (no el historial en bruto)
+"""
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from context import count_tokens
+from db import get_store
+from metrics import span
+
+# mensajes recientes que quedan fuera del resumen; los anteriores se van plegando en él
+MEMORY_RECENT_MESSAGES = int(os.getenv("MEMORY_RECENT_MESSAGES", "6"))
+# máximo de mensajes sin resumir que se leen (el presupuesto de tokens lo aplica trim_history)
+MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "30"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "800"))
+# mensajes nuevos fuera de la ventana que hacen falta para rehacer el resumen
+# (8 = cuatro turnos: el resumen no cuesta una llamada al LLM en cada turno)
+MEMORY_SUMMARY_MIN_NEW = int(os.getenv("MEMORY_SUMMARY_MIN_NEW", "8"))
+# 0 = buscar con la pregunta tal cual (sin llamada extra al LLM)
+MEMORY_CONDENSE = os.getenv("MEMORY_CONDENSE", "1") == "1"
+
+SUMMARY_PROMPT = """Actualiza el resumen de una conversación entre un usuario y un asistente.
+
+Resumen actual:
+{summary}
+
+Mensajes nuevos:
+{messages}
+
+Escribe el resumen actualizado en español, en un máximo de 120 palabras. Conserva los temas,
+datos y decisiones importantes; omite saludos y detalles repetidos.
+Resumen actualizado:"""
+
+CONDENSE_PROMPT = """A partir de la conversación y de la pregunta de seguimiento, reformula la pregunta
+para que se entienda sin la conversación. No la respondas; si ya es independiente, devuélvela igual.
+
+{conversation}
+
+Pregunta de seguimiento: {question}
+Pregunta independiente:"""
+
+
+@dataclass
+class Memory:
+    summary: str = ""
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    # posición hasta la que llega el resumen y total de mensajes del hilo al leerlo
+    summarized_count: int = 0
+    message_count: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not self.summary and not self.messages
+
+
+def clip(text: str, max_tokens: int) -> str:
+    """Recorta un texto a ~max_tokens (proporcional en caracteres)"""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[: max(int(len(text) * max_tokens / tokens), 0)].rstrip() + "…"
+
+
+def trim_history(messages: List[Dict[str, Any]], budget: int = MEMORY_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+    """Los mensajes más recientes que caben en `budget`; el más antiguo que no cabe entero se recorta"""
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for m in reversed(messages):
+        content = m.get("content") or ""
+        if not content:
+            continue
+        tokens = count_tokens(content)
+        if used + tokens > budget:
+            remaining = budget - used
+            if remaining > 20:
+                kept.append({**m, "content": clip(content, remaining)})
+            break
+        kept.append(m)
+        used += tokens
+    return list(reversed(kept))
+
+
+def render_messages(messages: List[Dict[str, Any]]) -> str:
+    lines = []
+    for m in messages:
+        content = m.get("content") or ""
+        if not content:
+            continue
+        prefix = "Usuario:" if m.get("role") == "user" else "Asistente:"
+        lines.append(f"{prefix} {content}")
+    return "\n".join(lines)
+
+
+def render_memory(memory: Memory) -> str:
+    parts = []
+    if memory.summary:
+        parts.append(f"Resumen de la conversación anterior: {memory.summary}")
+    if memory.messages:
+        parts.append(render_messages(memory.messages))
+    return "\n".join(parts)
+
+
+async def load_memory(user_id: str, conversation_id: Optional[str]) -> Memory:
+    """Resumen + mensajes que aún no cubre (recortados) del hilo; vacía si es un hilo nuevo"""
+    if not conversation_id:
+        return Memory()
+    try:
+        with span("chat.history"):
+            # una sola lectura por turno: resumen y mensajes sin resumir juntos
+            info = await get_store().load_history(user_id, conversation_id, MEMORY_MAX_MESSAGES)
+    except Exception as e:
+        print("Error cargando historial:", e)
+        return Memory()
+    if not info:
+        return Memory()
+    return Memory(
+        summary=info.get("summary") or "",
+        messages=trim_history(info["messages"]),
+        summarized_count=info.get("summarized_count") or 0,
+        message_count=info.get("message_count") or 0,
+    )
+
+
+def build_full_query(memory: Memory, question: str) -> str:
+    """Pregunta para el LLM: resumen + mensajes recientes + nueva pregunta"""
+    if memory.empty:
+        return question
+    return f"{render_memory(memory)}\n\nUsuario: {question}\nAsistente:"
+
+
+async def condense_question(llm, memory: Memory, question: str) -> str:
+    """Pregunta independiente para la búsqueda (la original si no hay historial o falla el LLM)"""
+    if memory.empty or not MEMORY_CONDENSE:
+        return question
+    try:
+        with span("chat.condense"):
+            result = await llm.ainvoke(
+                CONDENSE_PROMPT.format(conversation=render_memory(memory), question=question)
+            )
+        condensed = (result.content or "").strip()
+        return condensed or question
+    except Exception as e:
+        print("Error reformulando la pregunta:", e)
+        return question
+
+
+# hilos con un resumen en curso (no se lanzan dos a la vez para el mismo hilo)
+_summarizing: Set[str] = set()
+_tasks: Set[asyncio.Task] = set()
+
+
+def pending_summary(memory: Memory, added: int) -> Optional[Tuple[int, int]]:
+    """Posiciones [start, stop) que toca plegar en el resumen tras añadir `added` mensajes, o None"""
+    start = memory.summarized_count
+    stop = memory.message_count + added - MEMORY_RECENT_MESSAGES
+    if stop - start < MEMORY_SUMMARY_MIN_NEW:
+        return None
+    return start, stop
+
+
+async def update_summary(llm, user_id: str, conversation_id: str, summary: str, start: int, stop: int) -> None:
+    """Pliega en el resumen los mensajes [start, stop), que ya han salido de la ventana reciente"""
+    store = get_store()
+    new_messages = await store.message_range(user_id, conversation_id, start, stop)
+    messages_text = render_messages(
+        [{**m, "content": clip(m.get("content") or "", MEMORY_TOKEN_BUDGET)} for m in new_messages]
+    )
+    with span("chat.summarize"):
+        result = await llm.ainvoke(SUMMARY_PROMPT.format(summary=summary or "(vacío)", messages=messages_text))
+    await store.save_summary(user_id, conversation_id, (result.content or "").strip(), stop)
+
+
+def schedule_summary(llm, user_id: str, conversation_id: Optional[str], memory: Memory, added: int = 2) -> None:
+    """
+    Actualiza el resumen en segundo plano, fuera de la latencia de la respuesta.
+    Usa los contadores que ya leyó load_memory (sin otra lectura): `added` son
+    los mensajes que el turno acaba de guardar.
+    """
+    if not conversation_id or conversation_id in _summarizing:
+        return
+    span_range = pending_summary(memory, added)
+    if span_range is None:
+        return
+
+    _summarizing.add(conversation_id)
+
+    async def run():
+        try:
+            await update_summary(llm, user_id, conversation_id, memory.summary, *span_range)
+        except Exception as e:
+            print("Error actualizando el resumen:", e)
+        finally:
+            _summarizing.discard(conversation_id)
+
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
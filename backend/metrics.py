@@ -0,0 +1,180 @@
+# metrics.py
+"""
+Métricas de latencia por etapa, sin dependencias externas.
+
+- `span("chat.llm")` mide una etapa y la acumula en un histograma
+- `timing_middleware` añade la cabecera Server-Timing con las etapas de la
+  petición y, opcionalmente, guarda un perfil cProfile de las peticiones lentas
+- `register_gauge` / `register_counter` publican valores que se leen al exportar
+- `render_prometheus()` exporta todo en formato de texto de Prometheus (/metrics)
+"""
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# límites de los buckets en segundos (de 1 ms a 2 min)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))  # 0 = desactivado
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.1"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        with self._lock:
+            counts, totals = self._series.setdefault(
+                label_value, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[bisect_left(self.buckets, seconds)] += 1
+            totals[0] += seconds
+
+    def count(self, label_value: str) -> int:
+        with self._lock:
+            series = self._series.get(label_value)
+            return sum(series[0]) if series else 0
+
+    def quantile(self, label_value: str, q: float) -> Optional[float]:
+        """Estimación por buckets (límite superior del bucket donde cae el cuantil)"""
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                return None
+            counts = list(series[0])
+        total = sum(counts)
+        if not total:
+            return None
+        target = q * total
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(c), t[0]) for k, (c, t) in self._series.items()}
+        for value, (counts, total) in sorted(series.items()):
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{le}"}} {acc}')
+            acc += counts[-1]
+            lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {acc}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {acc}')
+        return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Duración de cada etapa del pipeline RAG", "stage")
+REQUEST_SECONDS = Histogram("http_request_seconds", "Duración de las peticiones HTTP", "route")
+
+_HISTOGRAMS: List[Histogram] = [STAGE_SECONDS, REQUEST_SECONDS]
+_GAUGES: Dict[str, Tuple[str, Callable[[], float]]] = {}
+_COUNTERS: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+# etapas medidas durante la petición en curso (para Server-Timing)
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def register_histogram(histogram: Histogram) -> Histogram:
+    _HISTOGRAMS.append(histogram)
+    return histogram
+
+
+def register_gauge(name: str, help_text: str, fn) -> None:
+    """`fn()` se evalúa en cada lectura de /metrics"""
+    _GAUGES[name] = (help_text, fn)
+
+
+def register_counter(name: str, help_text: str, fn) -> None:
+    """Como register_gauge, para valores que solo crecen (`*_total`)"""
+    _COUNTERS[name] = (help_text, fn)
+
+
+def observe(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    parts = [f"{stage.replace('.', '-')};dur={seconds * 1000:.1f}" for stage, seconds in timings]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# cProfile no admite dos perfiles activos a la vez: uno como mucho
+_profile_lock = threading.Lock()
+
+
+async def timing_middleware(request, call_next):
+    timings: List[Tuple[str, float]] = []
+    token = _request_timings.set(timings)
+
+    profiler = None
+    if PROFILE_SLOW_MS > 0 and random.random() < PROFILE_SAMPLE_RATE and _profile_lock.acquire(blocking=False):
+        # ojo: en asyncio el perfil incluye también lo que otras peticiones
+        # ejecuten en el event loop mientras tanto
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        elapsed = time.perf_counter() - start
+        _request_timings.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                name = request.url.path.strip("/").replace("/", "_") or "root"
+                profiler.dump_stats(os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}_{name}.prof"))
+
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(getattr(route, "path", "unmatched"), elapsed)
+    # en las respuestas en streaming solo entran las etapas previas al primer byte
+    response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for histogram in _HISTOGRAMS:
+        lines.extend(histogram.render())
+    for kind, series in (("gauge", _GAUGES), ("counter", _COUNTERS)):
+        for name, (help_text, fn) in series.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {fn()}")
+    return "\n".join(lines) + "\n"
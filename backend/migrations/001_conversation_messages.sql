@@ -0,0 +1,66 @@
+-- Mensajes como filas append-only en lugar del array conversations.messages.
+-- Ejecutar en el SQL editor de Supabase antes de desplegar el backend.
+
+create table if not exists public.conversation_messages (
+  id bigint generated always as identity primary key,
+  conversation_id uuid not null references public.conversations(id) on delete cascade,
+  user_id uuid not null,
+  role text not null,
+  content text not null default '',
+  sources jsonb,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists conversation_messages_conv_idx
+  on public.conversation_messages (conversation_id, id desc);
+
+alter table public.conversation_messages enable row level security;
+
+create policy "conversation_messages_owner" on public.conversation_messages
+  for all using (auth.uid() = user_id);
+
+-- Copiar los mensajes existentes (una sola vez)
+insert into public.conversation_messages (conversation_id, user_id, role, content, sources, created_at)
+select c.id, c.user_id, m.value->>'role', coalesce(m.value->>'content', ''), m.value->'sources', c.created_at
+from public.conversations c
+cross join lateral jsonb_array_elements(coalesce(c.messages::jsonb, '[]'::jsonb)) with ordinality as m(value, ord)
+where not exists (
+  select 1 from public.conversation_messages cm where cm.conversation_id = c.id
+)
+order by c.created_at, c.id, m.ord;
+
+-- Un turno de /chat = una llamada: crea el hilo si hace falta e inserta las filas
+create or replace function public.append_messages(
+  p_user_id uuid,
+  p_conversation_id uuid,
+  p_title text,
+  p_messages jsonb
+) returns uuid
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_id uuid := p_conversation_id;
+begin
+  if v_id is null then
+    insert into conversations (user_id, title, messages)
+    values (p_user_id, p_title, '[]')
+    returning id into v_id;
+  elsif not exists (select 1 from conversations where id = v_id and user_id = p_user_id) then
+    raise exception 'conversation % not found', v_id using errcode = 'P0002';
+  end if;
+
+  insert into conversation_messages (conversation_id, user_id, role, content, sources)
+  select v_id, p_user_id, m.value->>'role', coalesce(m.value->>'content', ''), m.value->'sources'
+  from jsonb_array_elements(p_messages) with ordinality as m(value, ord)
+  order by m.ord;
+
+  return v_id;
+end;
+$$;
+
+-- security definer salta RLS: solo la puede llamar el backend (service key),
+-- no el cliente con la anon key (p_user_id no se comprueba contra auth.uid())
+revoke execute on function public.append_messages(uuid, uuid, text, jsonb) from public, anon, authenticated;
+grant execute on function public.append_messages(uuid, uuid, text, jsonb) to service_role;
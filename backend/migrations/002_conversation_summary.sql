@@ -0,0 +1,62 @@
+-- Resumen por conversación para pintar la barra lateral sin leer mensajes,
+-- e índice para paginar por created_at.
+
+alter table public.conversations
+  add column if not exists message_count integer not null default 0,
+  add column if not exists last_activity timestamptz;
+
+update public.conversations c
+set message_count = s.n,
+    last_activity = s.last_at
+from (
+  select conversation_id, count(*) as n, max(created_at) as last_at
+  from public.conversation_messages
+  group by conversation_id
+) s
+where s.conversation_id = c.id;
+
+update public.conversations set last_activity = created_at where last_activity is null;
+
+create index if not exists conversations_user_created_idx
+  on public.conversations (user_id, created_at desc);
+
+-- append_messages mantiene el resumen en la misma transacción
+create or replace function public.append_messages(
+  p_user_id uuid,
+  p_conversation_id uuid,
+  p_title text,
+  p_messages jsonb
+) returns uuid
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_id uuid := p_conversation_id;
+begin
+  if v_id is null then
+    insert into conversations (user_id, title, messages, last_activity)
+    values (p_user_id, p_title, '[]', now())
+    returning id into v_id;
+  elsif not exists (select 1 from conversations where id = v_id and user_id = p_user_id) then
+    raise exception 'conversation % not found', v_id using errcode = 'P0002';
+  end if;
+
+  insert into conversation_messages (conversation_id, user_id, role, content, sources)
+  select v_id, p_user_id, m.value->>'role', coalesce(m.value->>'content', ''), m.value->'sources'
+  from jsonb_array_elements(p_messages) with ordinality as m(value, ord)
+  order by m.ord;
+
+  update conversations
+  set message_count = message_count + jsonb_array_length(p_messages),
+      last_activity = now()
+  where id = v_id;
+
+  return v_id;
+end;
+$$;
+
+-- security definer salta RLS: solo la puede llamar el backend (service key),
+-- no el cliente con la anon key (p_user_id no se comprueba contra auth.uid())
+revoke execute on function public.append_messages(uuid, uuid, text, jsonb) from public, anon, authenticated;
+grant execute on function public.append_messages(uuid, uuid, text, jsonb) to service_role;
@@ -0,0 +1,6 @@
+-- Resumen acumulado de los turnos antiguos de cada conversación (memoria del chat).
+-- summarized_count = cuántos mensajes, desde el primero, están ya dentro de summary.
+
+alter table public.conversations
+  add column if not exists summary text,
+  add column if not exists summarized_count integer not null default 0;
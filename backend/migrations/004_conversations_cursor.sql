@@ -0,0 +1,7 @@
+-- La paginación de conversaciones usa (created_at, id) como cursor: el id
+-- desempata las que comparten created_at.
+
+create index if not exists conversations_user_created_id_idx
+  on public.conversations (user_id, created_at desc, id desc);
+
+drop index if exists public.conversations_user_created_idx;
@@ -0,0 +1,84 @@
+# rag.py
+"""
+Componentes pesados del RAG (modelo de embeddings, índice Chroma, cliente LLM).
+
+No se crean al importar main.py sino en el arranque (lifespan): el modelo se
+carga en segundo plano y /readyz no responde 200 hasta que el embedder y el
+índice se han calentado con una consulta de prueba.
+"""
+import asyncio
+import os
+import time
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+from db import get_store
+from metrics import span
+
+WARMUP_QUERY = os.getenv(
+    "WARMUP_QUERY", "¿Cuáles son los pasos de la medición del impacto social?"
+)
+# cuánto espera una petición que llega antes de estar listo antes de responder 503
+READY_WAIT_SECONDS = float(os.getenv("READY_WAIT_SECONDS", "30"))
+
+
+class RAGComponents:
+    def __init__(self):
+        self.embeddings = None
+        self.vectordb = None
+        self.index = None  # TenantIndex: base + colecciones por usuario
+        self.llm = None
+        self.error: Optional[str] = None
+        self.ready_seconds: Optional[float] = None
+        self._created_at = time.monotonic()
+        self._ready = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def load_index(self, warmup_query: str, k: int) -> None:
+        """Carga el modelo y abre Chroma (bloqueante: se ejecuta en un hilo)"""
+        # imports aquí para que importar main.py no cargue torch/sentence-transformers
+        from embeddings import get_embeddings
+        from vectorstore import TenantIndex, get_vectordb
+
+        with span("startup.embeddings"):
+            self.embeddings = get_embeddings()
+        with span("startup.index"):
+            self.vectordb = get_vectordb(self.embeddings)
+            self.index = TenantIndex(self.vectordb, self.embeddings)
+        if warmup_query:
+            # la primera inferencia y la primera búsqueda son mucho más lentas
+            with span("startup.warmup"):
+                vector = self.embeddings.embed_query(warmup_query)
+                self.vectordb.similarity_search_by_vector(vector, k=k)
+
+    async def start(self, llm_factory: Callable, warmup_query: str, k: int, executor) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            self.llm = llm_factory()
+            await loop.run_in_executor(executor, self.load_index, warmup_query, k)
+            await get_store().warm_up()
+        except Exception as e:
+            print("Error inicializando el RAG:", e)
+            self.error = str(e)
+            return
+        self.ready_seconds = time.monotonic() - self._created_at
+        self._ready.set()
+
+    async def wait_ready(self, timeout: float = READY_WAIT_SECONDS) -> None:
+        if self.ready:
+            return
+        if self.error is None:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+                return
+            except asyncio.TimeoutError:
+                pass
+        raise HTTPException(
+            status_code=503,
+            detail="El servicio se está iniciando, inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": "5"},
+        )
@@ -0,0 +1,160 @@
+# snapshot.py
+"""
+Instantánea de solo lectura del índice para servir búsquedas sin Chroma ni pickle.
+
+Formato (un directorio):
+- vectors.npy   matriz (N, D) float16 o float32, normalizada (producto = coseno);
+                se abre con mmap, así que varios workers comparten las páginas
+                a través de la caché del sistema operativo
+- records.bin   un JSON por chunk ({"id", "text", "metadata"}) concatenados
+- offsets.npy   (N + 1) int64: el registro i ocupa records.bin[offsets[i]:offsets[i + 1]]
+- manifest.json número de chunks, dimensión, dtype, modelo y fecha
+
+Uso (desde backend/):
+    python snapshot.py export --out vector_db/snapshot --dtype float16
+"""
+import argparse
+import json
+import mmap
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from embeddings import EMBEDDING_BACKEND, MODEL_NAME
+from vectorstore import BASE_COLLECTION, VECTOR_DB_DIR
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(VECTOR_DB_DIR, "snapshot"))
+EXPORT_PAGE_SIZE = 5000
+# filas por bloque al puntuar: acota la memoria temporal al convertir float16 -> float32
+SEARCH_BLOCK_ROWS = 65536
+
+
+def export_snapshot(persist_directory: str, out_dir: str, dtype: str = "float16") -> Dict[str, Any]:
+    """Vuelca la colección base de Chroma al formato de instantánea (escritura atómica)"""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=persist_directory)
+    collection = client.get_collection(BASE_COLLECTION)
+    count = collection.count()
+
+    out = Path(out_dir)
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    vectors = None
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    row = 0
+    with open(tmp / "records.bin", "wb") as records:
+        for start in range(0, count, EXPORT_PAGE_SIZE):
+            page = collection.get(
+                offset=start,
+                limit=EXPORT_PAGE_SIZE,
+                include=["embeddings", "documents", "metadatas"],
+            )
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    tmp / "vectors.npy", mode="w+", dtype=dtype, shape=(count, embeddings.shape[1])
+                )
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            vectors[row : row + len(embeddings)] = embeddings / np.where(norms == 0, 1, norms)
+
+            for cid, text, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+                data = json.dumps({"id": cid, "text": text, "metadata": meta or {}}, ensure_ascii=False)
+                records.write(data.encode("utf-8"))
+                offsets[row + 1] = records.tell()
+                row += 1
+
+    if vectors is None:
+        raise SystemExit("La colección está vacía: no hay nada que exportar")
+    vectors.flush()
+    del vectors
+    np.save(tmp / "offsets.npy", offsets)
+
+    manifest = {
+        "count": count,
+        "dim": int(np.load(tmp / "vectors.npy", mmap_mode="r").shape[1]),
+        "dtype": dtype,
+        "model": MODEL_NAME,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+    # sustituir la instantánea anterior de una vez
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return manifest
+
+
+class Snapshot:
+    """Instantánea abierta en modo mmap; search() es un producto escalar vectorizado"""
+
+    def __init__(self, path: str = SNAPSHOT_DIR):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / "manifest.json").read_text(encoding="utf-8"))
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        self._records_file = open(self.path / "records.bin", "rb")
+        self._records = mmap.mmap(self._records_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def record(self, i: int) -> Dict[str, Any]:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(self._records[start:end].decode("utf-8"))
+
+    def search_many(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Top-k (índice, similitud coseno) para cada fila de `queries`"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        k = min(k, len(self))
+
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_score = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start : start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores = queries @ block.T
+            kk = min(k, scores.shape[1])
+            top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            best_idx = np.concatenate([best_idx, top + start], axis=1)
+            best_score = np.concatenate([best_score, np.take_along_axis(scores, top, axis=1)], axis=1)
+            if best_idx.shape[1] > k:
+                keep = np.argpartition(-best_score, k - 1, axis=1)[:, :k]
+                best_idx = np.take_along_axis(best_idx, keep, axis=1)
+                best_score = np.take_along_axis(best_score, keep, axis=1)
+
+        order = np.argsort(-best_score, axis=1)
+        return [
+            [(int(i), float(s)) for i, s in zip(idx[o], score[o])]
+            for idx, score, o in zip(best_idx, best_score, order)
+        ]
+
+    def search(self, query, k: int) -> List[Dict[str, Any]]:
+        return [{**self.record(i), "score": s} for i, s in self.search_many(query, k)[0]]
+
+    def close(self) -> None:
+        self._records.close()
+        self._records_file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="vuelca vector_db/ a una instantánea mmap")
+    export.add_argument("--vector-db", default=VECTOR_DB_DIR)
+    export.add_argument("--out", default=SNAPSHOT_DIR)
+    export.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        start = time.perf_counter()
+        manifest = export_snapshot(args.vector_db, args.out, args.dtype)
+        print(f"{manifest['count']} chunks ({manifest['dim']} dims, {manifest['dtype']}) "
+              f"en {args.out} en {time.perf_counter() - start:.1f} s")
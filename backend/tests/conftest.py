@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# los módulos del backend se importan por nombre (como al arrancar desde backend/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
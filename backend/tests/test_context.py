@@ -0,0 +1,58 @@
+# tests/test_context.py
+"""pack_context: fusión de chunks vecinos, descarte de duplicados y presupuesto de tokens"""
+import numpy as np
+from langchain.schema import Document
+
+from context import count_tokens, pack_context
+
+WORDS = "uno dos tres cuatro cinco seis siete ocho nueve diez once doce trece catorce quince".split()
+
+
+def text(n: int, seed: int) -> str:
+    rng = np.random.default_rng(seed)
+    return " ".join(rng.choice(WORDS, size=n))
+
+
+def axis(i: int, dim: int = 8) -> list:
+    v = np.zeros(dim, dtype=np.float32)
+    v[i] = 1.0
+    return list(v)
+
+
+def doc(content: str, file_name: str = "guia.pdf", page: int = 1, **meta) -> Document:
+    return Document(page_content=content, metadata={"file_name": file_name, "page_number": page, **meta})
+
+
+def test_overlapping_chunks_of_the_same_page_are_merged():
+    full = text(120, 0)
+    first, second = full[:400], full[300:]  # 100 caracteres de solape, como el chunk_overlap de los splitters
+    packed = pack_context(axis(0), [doc(first), doc(second), doc(second, page=2)], [axis(0), axis(1), axis(2)], budget=0)
+    assert [d.page_content for d in packed.docs] == [full, second]
+    assert packed.chunks_in == 3 and packed.tokens_saved > 0
+
+
+def test_contiguous_chunks_are_merged_by_start_index():
+    a, b = text(30, 1), text(30, 2)
+    docs = [doc(b, start_index=len(a)), doc(a, start_index=0)]
+    packed = pack_context(axis(0), docs, [axis(0), axis(1)], budget=0)
+    assert len(packed.docs) == 1
+    assert packed.docs[0].page_content == a + b and packed.docs[0].metadata["start_index"] == 0
+
+
+def test_near_identical_fragments_are_dropped():
+    same = axis(0)
+    docs = [doc(text(40, 3), "a.pdf"), doc(text(40, 4), "b.pdf"), doc(text(40, 5), "c.pdf")]
+    packed = pack_context(same, docs, [same, same, axis(1)], budget=0)
+    assert [d.metadata["file_name"] for d in packed.docs] == ["a.pdf", "c.pdf"]
+
+
+def test_budget_is_respected_and_the_best_fragment_always_fits():
+    docs = [doc(text(200, i), f"{i}.pdf") for i in range(6)]
+    vectors = [axis(i) for i in range(6)]
+    packed = pack_context(axis(0), docs, vectors, budget=300)
+    assert packed.docs[0].metadata["file_name"] == "0.pdf"
+    assert packed.tokens <= 300 and len(packed.docs) < 6
+    assert packed.tokens == count_tokens("\n\n".join(d.page_content for d in packed.docs))
+
+    tiny = pack_context(axis(0), docs, vectors, budget=10)
+    assert len(tiny.docs) == 1 and tiny.docs[0].metadata["file_name"] == "0.pdf"
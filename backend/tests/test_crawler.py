@@ -0,0 +1,99 @@
+# tests/test_crawler.py
+"""
+Crawler contra el sitio local de bench/fake_site.py: primer rastreo,
+refrescos con y sin validadores HTTP, páginas cambiadas y eliminadas.
+"""
+import asyncio
+
+import pytest
+
+from bench.fake_site import FakeSite
+from crawler import Crawler, CrawlState, normalize_url
+
+PAGES = 12
+
+
+@pytest.fixture(params=[True, False], ids=["etag", "sin-etag"])
+def site(request):
+    site = FakeSite(pages=PAGES, fanout=3, delay_ms=0, validators=request.param)
+    server = site.serve()
+    site.url = f"http://127.0.0.1:{server.server_port}/"
+    yield site
+    server.shutdown()
+
+
+def crawl(site, known=None):
+    pages = asyncio.run(Crawler(max_depth=5, max_pages=PAGES, per_host=4).crawl(site.url, known or {}))
+    return {p.url: p for p in pages}
+
+
+def as_known(pages):
+    """Lo que guardaría CrawlState tras el rastreo"""
+    return {
+        url: {"etag": p.etag, "last_modified": p.last_modified, "sha256": p.sha256, "links": p.links}
+        for url, p in pages.items()
+        if p.status not in ("error", "gone")
+    }
+
+
+def page_url(site, i):
+    return site.url if i == 0 else f"{site.url}page/{i}.html"
+
+
+def test_first_crawl_finds_every_page_of_the_site(site):
+    pages = crawl(site)
+    assert len(pages) == PAGES
+    assert {p.status for p in pages.values()} == {"new"}
+    # los enlaces externos y los fragmentos no generan páginas nuevas
+    assert all(url.startswith(site.url) and "#" not in url for url in pages)
+    assert "Sección 0 de la página 1" in pages[page_url(site, 1)].text
+    assert "var x" not in pages[page_url(site, 1)].text
+
+
+def test_refresh_without_changes(site):
+    first = crawl(site)
+    requests = site.requests
+    refresh = crawl(site, as_known(first))
+    expected = "not_modified" if site.validators else "unchanged"
+    assert {p.status for p in refresh.values()} == {expected}
+    assert len(refresh) == PAGES and site.requests - requests == PAGES
+    if site.validators:
+        assert site.not_modified == PAGES
+        # las páginas 304 conservan enlaces y hash de lo ya conocido
+        assert refresh[site.url].links == first[site.url].links
+        assert refresh[site.url].sha256 == first[site.url].sha256
+
+
+def test_refresh_marks_only_changed_pages(site):
+    first = crawl(site)
+    site.touch([2, 5])
+    refresh = crawl(site, as_known(first))
+    changed = {url for url, p in refresh.items() if p.status == "changed"}
+    assert changed == {page_url(site, 2), page_url(site, 5)}
+    assert "versión 1" in refresh[page_url(site, 2)].text
+
+
+def test_removed_known_pages_are_gone(site):
+    first = crawl(site)
+    site.remove([4])
+    refresh = crawl(site, as_known(first))
+    assert refresh[page_url(site, 4)].status == "gone"
+    # sin entrada previa un 404 es un error, no una página eliminada
+    assert crawl(site)[page_url(site, 4)].status == "error"
+
+
+def test_crawl_state_update_and_remove(tmp_path):
+    path = str(tmp_path / "crawl_state.json")
+    state = CrawlState(path)
+    state.update("u", "c", {"https://a.example/": {"sha256": "1"}, "https://a.example/x": {"sha256": "2"}})
+    state.update("u", "otro", {"https://a.example/": {"sha256": "3"}})
+    state.update("u", "c", {}, removed=["https://a.example/x"])
+
+    reloaded = CrawlState(path)
+    assert reloaded.pages("u", "c") == {"https://a.example/": {"sha256": "1"}}
+    assert reloaded.pages("u", "otro") == {"https://a.example/": {"sha256": "3"}}
+
+
+def test_normalize_url():
+    assert normalize_url("https://Example.com#top") == "https://example.com/"
+    assert normalize_url(" https://example.com/a?b=1#c ") == "https://example.com/a?b=1"
@@ -0,0 +1,117 @@
+# tests/test_db.py
+"""
+SQLiteConversationStore, el sustituto local de Supabase: mensajes como filas
+que solo se añaden, paginación de la barra lateral y ventanas de mensajes de
+una conversación.
+"""
+import asyncio
+
+import pytest
+
+from db import ConversationNotFound, SQLiteConversationStore
+
+
+@pytest.fixture
+def store():
+    return SQLiteConversationStore(":memory:")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def turn(i):
+    return [{"role": "user", "content": f"pregunta {i}"}, {"role": "assistant", "content": f"respuesta {i}"}]
+
+
+def all_pages(store, user_id, limit):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = run(store.list_conversations(user_id, limit, cursor))
+        pages.append([r["id"] for r in rows])
+        if cursor is None:
+            return pages
+
+
+def test_pagination_does_not_skip_conversations_with_the_same_created_at(store):
+    ids = [run(store.append_messages("u", turn(i))) for i in range(7)]
+    # varias conversaciones creadas en el mismo instante
+    with store._conn:
+        store._conn.execute("UPDATE conversations SET created_at = '2024-05-01T10:00:00+00:00'")
+
+    pages = all_pages(store, "u", 3)
+    assert [len(p) for p in pages] == [3, 3, 1]
+    assert sorted(i for p in pages for i in p) == sorted(ids)
+
+
+def test_no_cursor_after_the_last_page(store):
+    for i in range(4):
+        run(store.append_messages("u", turn(i)))
+    assert [len(p) for p in all_pages(store, "u", 2)] == [2, 2]
+    rows, cursor = run(store.list_conversations("u", 10))
+    assert len(rows) == 4 and cursor is None
+
+
+def test_pages_are_newest_first_and_per_user(store):
+    ids = []
+    for i in range(3):
+        ids.append(run(store.append_messages("u", turn(i))))
+        with store._conn:
+            store._conn.execute("UPDATE conversations SET created_at = ? WHERE id = ?", (f"2024-05-0{i + 1}", ids[-1]))
+    run(store.append_messages("otro", turn(9)))
+    assert all_pages(store, "u", 2) == [[ids[2], ids[1]], [ids[0]]]
+
+
+def test_message_window(store):
+    cid = run(store.append_messages("u", turn(0)))
+    for i in range(1, 5):
+        run(store.append_messages("u", turn(i), cid))
+
+    page = run(store.get_conversation("u", cid, limit=4))
+    assert [m["content"] for m in page["messages"]] == ["pregunta 3", "respuesta 3", "pregunta 4", "respuesta 4"]
+    assert page["has_more"] and page["message_count"] == 10
+
+    older = run(store.get_conversation("u", cid, before=page["next_before"], limit=4))
+    assert [m["content"] for m in older["messages"]] == ["pregunta 1", "respuesta 1", "pregunta 2", "respuesta 2"]
+    oldest = run(store.get_conversation("u", cid, before=older["next_before"], limit=4))
+    assert [m["content"] for m in oldest["messages"]] == ["pregunta 0", "respuesta 0"]
+    assert not oldest["has_more"] and oldest["next_before"] is None
+
+    assert run(store.get_conversation("otro", cid)) is None
+
+
+def test_append_creates_the_thread_and_adds_rows(store):
+    cid = run(store.append_messages("u", turn(0)))
+    assert run(store.append_messages("u", turn(1), cid)) == cid
+    run(store.append_messages("u", [{"role": "assistant", "content": "con fuentes", "sources": [{"file_name": "a.pdf"}]}], cid))
+
+    rows, _ = run(store.list_conversations("u", 10))
+    assert rows[0]["title"] == "pregunta 0" and rows[0]["message_count"] == 5
+    recent = run(store.recent_messages("u", cid, 3))
+    assert [m["content"] for m in recent] == ["pregunta 1", "respuesta 1", "con fuentes"]
+    assert recent[-1]["sources"] == [{"file_name": "a.pdf"}]
+
+
+def test_append_to_someone_elses_thread_fails(store):
+    cid = run(store.append_messages("u", turn(0)))
+    with pytest.raises(ConversationNotFound):
+        run(store.append_messages("otro", turn(1), cid))
+    assert run(store.get_conversation("u", cid))["message_count"] == 2
+
+
+def test_concurrent_appends_keep_every_message(store):
+    cid = run(store.append_messages("u", turn(0)))
+
+    async def many():
+        await asyncio.gather(*(store.append_messages("u", turn(i), cid) for i in range(1, 21)))
+
+    run(many())
+    conv = run(store.get_conversation("u", cid, limit=100))
+    assert conv["message_count"] == 42 and len(conv["messages"]) == 42
+
+
+def test_delete_cascades_to_messages(store):
+    cid = run(store.append_messages("u", turn(0)))
+    assert not run(store.delete_conversation("otro", cid))
+    assert run(store.delete_conversation("u", cid))
+    assert store._conn.execute("SELECT COUNT(*) FROM conversation_messages").fetchone()[0] == 0
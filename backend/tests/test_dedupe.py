@@ -0,0 +1,129 @@
+# tests/test_dedupe.py
+"""
+Borrado de chunks con casi duplicados fusionados, en los dos órdenes: el
+archivo del que se queda primero y el del descartado primero. Chroma se
+sustituye por una colección en memoria con la misma API.
+"""
+import pytest
+
+import dedupe
+from dedupe import DuplicateAliases, all_source_refs, extra_refs, filter_near_duplicates, release
+
+PARAGRAPH = (
+    "La guía describe cómo medir el impacto social de un proyecto: objetivos, agentes "
+    "involucrados, resultados, verificación y seguimiento."
+)
+
+
+class FakeCollection:
+    def __init__(self, name="test"):
+        self.name = name
+        self.rows = {}
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, ids=None, offset=0, limit=None, include=()):
+        keys = [i for i in ids if i in self.rows] if ids is not None else list(self.rows)[offset:][:limit]
+        return {
+            "ids": keys,
+            "documents": [self.rows[k]["document"] for k in keys],
+            "metadatas": [dict(self.rows[k]["metadata"]) for k in keys],
+            "embeddings": [self.rows[k]["embedding"] for k in keys],
+        }
+
+    def add(self, ids, documents, metadatas, embeddings):
+        for cid, doc, meta, emb in zip(ids, documents, metadatas, embeddings):
+            self.rows[cid] = {"document": doc, "metadata": dict(meta), "embedding": emb}
+
+    def update(self, ids, metadatas):
+        for cid, meta in zip(ids, metadatas):
+            self.rows[cid]["metadata"] = dict(meta)
+
+    def delete(self, ids):
+        for cid in ids:
+            self.rows.pop(cid, None)
+
+
+class FakeVectorDB:
+    def __init__(self, persist_directory):
+        self._collection = FakeCollection()
+        self._persist_directory = str(persist_directory)
+
+    def add(self, texts, metadatas, ids):
+        texts, metadatas, ids, merged = filter_near_duplicates(self, texts, metadatas, ids)
+        self._collection.add(ids, texts, metadatas, [[float(len(t))] for t in texts])
+        return ids, merged
+
+    def delete_ids(self, ids):
+        # como vectorstore.delete_ids
+        release(self, ids)
+        self._collection.delete(ids)
+
+
+@pytest.fixture
+def vectordb(tmp_path):
+    dedupe._indexes.clear()
+    db = FakeVectorDB(tmp_path)
+    db.add([PARAGRAPH], [{"file_name": "guia.pdf", "page_number": 3, "corpus_id": "c"}], ["guia"])
+    db.add([PARAGRAPH + " "], [{"file_name": "guia-rev.pdf", "page_number": 5, "corpus_id": "c"}], ["rev"])
+    yield db
+    dedupe._indexes.clear()
+
+
+def files(db):
+    return sorted(
+        ref["file_name"] for row in db._collection.rows.values() for ref in all_source_refs(row["metadata"])
+    )
+
+
+def aliases(db):
+    return DuplicateAliases.for_collection(db._persist_directory, db._collection.name).entries
+
+
+def test_duplicate_is_merged_into_survivor(vectordb):
+    # solo cambian las fuentes de un chunk que ya estaba: quien llama tiene que enterarse (caché de respuestas)
+    added, merged = vectordb.add([PARAGRAPH], [{"file_name": "copia.pdf", "page_number": 1, "corpus_id": "c"}], ["copia"])
+    assert added == [] and merged == ["guia"]
+    assert list(vectordb._collection.rows) == ["guia"]
+    assert files(vectordb) == ["copia.pdf", "guia-rev.pdf", "guia.pdf"]
+    assert aliases(vectordb) == {"rev": "guia", "copia": "guia"}
+
+
+def test_delete_survivor_first_promotes_duplicate(vectordb):
+    vectordb.delete_ids(["guia"])
+    row = vectordb._collection.rows["rev"]
+    assert list(vectordb._collection.rows) == ["rev"]
+    assert row["document"] == PARAGRAPH
+    assert row["metadata"]["file_name"] == "guia-rev.pdf"
+    assert row["metadata"]["page_number"] == 5
+    assert extra_refs(row["metadata"]) == []
+    assert aliases(vectordb) == {}
+    # el índice apunta al promovido: otra copia se fusiona en él
+    vectordb.add([PARAGRAPH], [{"file_name": "otra.pdf", "page_number": 1, "corpus_id": "c"}], ["otra"])
+    assert files(vectordb) == ["guia-rev.pdf", "otra.pdf"]
+
+    vectordb.delete_ids(["rev"])
+    assert list(vectordb._collection.rows) == ["otra"]
+    assert files(vectordb) == ["otra.pdf"]
+
+    vectordb.delete_ids(["otra"])
+    assert vectordb._collection.rows == {}
+    assert aliases(vectordb) == {}
+
+
+def test_delete_duplicate_first_prunes_its_source(vectordb):
+    vectordb.delete_ids(["rev"])
+    assert list(vectordb._collection.rows) == ["guia"]
+    assert files(vectordb) == ["guia.pdf"]
+    assert aliases(vectordb) == {}
+
+    vectordb.delete_ids(["guia"])
+    assert vectordb._collection.rows == {}
+    assert aliases(vectordb) == {}
+
+
+def test_delete_both_at_once(vectordb):
+    vectordb.delete_ids(["guia", "rev"])
+    assert vectordb._collection.rows == {}
+    assert aliases(vectordb) == {}
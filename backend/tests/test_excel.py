@@ -0,0 +1,75 @@
+# tests/test_excel.py
+"""Troceo de hojas de Excel por filas completas (excel.chunk_rows) y lectura en streaming"""
+import datetime
+
+from excel import chunk_rows, format_cell, is_xlsx, iter_excel_chunks
+
+HEADER = ("Código", "Indicador", "Valor", None)
+
+
+def rows(n):
+    return [HEADER] + [(f"IND-{i}", f"Indicador {i}", float(i), None) for i in range(n)]
+
+
+def test_chunks_repeat_the_header_and_keep_excel_row_numbers():
+    chunks = list(chunk_rows(rows(45), "Datos", {"file_name": "a.xlsx"}, rows_per_chunk=20))
+    assert [(m["row_start"], m["row_end"]) for _, m in chunks] == [(2, 21), (22, 41), (42, 46)]
+    text, meta = chunks[0]
+    lines = text.splitlines()
+    assert lines[0] == "Hoja: Datos (filas 2-21)"
+    assert lines[1] == "Código | Indicador | Valor"
+    assert lines[2] == "IND-0 | Indicador 0 | 0"
+    assert len(lines) == 22
+    assert meta["file_name"] == "a.xlsx" and meta["sheet"] == "Datos" and meta["page_number"] == "Datos 2-21"
+
+
+def test_rows_are_never_split_and_max_chars_closes_chunks_early():
+    long_rows = [("Texto",)] + [("x" * 300,) for _ in range(10)]
+    chunks = list(chunk_rows(long_rows, "Notas", {}, rows_per_chunk=20, max_chars=1000))
+    assert len(chunks) == 4
+    for text, _ in chunks:
+        body = text.splitlines()[2:]
+        assert body and all(line == "x" * 300 for line in body)
+    assert sum(m["row_end"] - m["row_start"] + 1 for _, m in chunks) == 10
+
+
+def test_empty_rows_are_skipped_and_single_row_sheets_are_kept():
+    sparse = [(None, None), HEADER, (None,), ("IND-1", "Uno", 1), ()]
+    chunks = list(chunk_rows(sparse, "Hoja1", {}))
+    assert len(chunks) == 1 and chunks[0][1]["row_start"] == 4 and chunks[0][1]["row_end"] == 4
+
+    only_header = list(chunk_rows([HEADER], "Sola", {}))
+    assert len(only_header) == 1
+    assert only_header[0][0].splitlines() == ["Hoja: Sola (filas 1-1)", "Código | Indicador | Valor"]
+    assert list(chunk_rows([(None,), ()], "Vacía", {})) == []
+
+
+def test_format_cell():
+    assert format_cell(3.0) == "3"
+    assert format_cell(2.5) == "2.5"
+    assert format_cell(datetime.datetime(2024, 5, 1)) == "2024-05-01"
+    assert format_cell("a |  b\nc") == "a / b c"
+    assert format_cell(None) == ""
+
+
+def test_iter_excel_chunks_reads_every_sheet(tmp_path):
+    from openpyxl import Workbook
+
+    path = tmp_path / "libro.xlsx"
+    workbook = Workbook()
+    first = workbook.active
+    first.title = "Uno"
+    for row in rows(3):
+        first.append(row)
+    second = workbook.create_sheet("Dos")
+    for row in rows(25):
+        second.append(row)
+    workbook.save(path)
+
+    assert is_xlsx(str(path))
+    chunks = list(iter_excel_chunks(str(path), {"file_name": "libro.xlsx"}, rows_per_chunk=20))
+    assert [(m["sheet"], m["row_start"], m["row_end"]) for _, m in chunks] == [
+        ("Uno", 2, 4),
+        ("Dos", 2, 21),
+        ("Dos", 22, 26),
+    ]
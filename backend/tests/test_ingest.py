@@ -0,0 +1,98 @@
+# tests/test_ingest.py
+"""
+- Pipeline paralelo de ingest.py cuando falla la escritura en Chroma: el error
+  llega al hilo principal y run_pipeline termina, falle el último lote (ya se
+  ha leído _END) o uno intermedio (el productor sigue encolando).
+- Ingesta incremental sobre una colección sin manifest.
+"""
+import threading
+from pathlib import Path
+
+import pytest
+
+import ingest
+
+
+def fake_file_chunks(pdf_file):
+    # en el módulo para que el pool de procesos la pueda serializar
+    return [
+        {"page_content": f"Fragmento {i} de {pdf_file.name}", "metadata": {"file_name": pdf_file.name, "page_number": 1}}
+        for i in range(5)
+    ]
+
+
+def failing_add(vectordb, texts, metadatas):
+    raise RuntimeError("Chroma no disponible")
+
+
+def run_with_timeout(batch_size, files, tmp_path, seconds=60):
+    result = {}
+
+    def target():
+        try:
+            ingest.run_pipeline(
+                files,
+                {f.name: "hash" for f in files},
+                None,
+                {"files": {}},
+                tmp_path / "manifest.json",
+                1,
+                batch_size,
+            )
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), "run_pipeline no ha terminado"
+    return result
+
+
+@pytest.fixture
+def failing_writer(monkeypatch):
+    monkeypatch.setattr(ingest, "get_file_chunks", fake_file_chunks)
+    monkeypatch.setattr(ingest, "add_unique_texts", failing_add)
+
+
+def test_last_flush_error_is_raised(failing_writer, tmp_path):
+    # lote mayor que el archivo: el único flush es el final, después de _END
+    result = run_with_timeout(100, [Path("guia.pdf")], tmp_path)
+    assert isinstance(result.get("error"), RuntimeError)
+    assert not (tmp_path / "manifest.json").exists()
+
+
+def test_intermediate_flush_error_is_raised(failing_writer, tmp_path):
+    files = [Path(f"guia-{i}.pdf") for i in range(6)]
+    result = run_with_timeout(1, files, tmp_path)
+    assert isinstance(result.get("error"), RuntimeError)
+
+
+class FakeCollection:
+    def __init__(self, count):
+        self._count = count
+
+    def count(self):
+        return self._count
+
+
+class FakeVectorDB:
+    def __init__(self, count):
+        self._collection = FakeCollection(count)
+
+
+@pytest.fixture
+def legacy_collection(monkeypatch):
+    monkeypatch.setattr(ingest, "get_embeddings", lambda: None)
+    monkeypatch.setattr(ingest, "get_vectordb", lambda embeddings, persist_directory: FakeVectorDB(120))
+
+
+def test_refuses_incremental_run_without_manifest(legacy_collection, tmp_path):
+    with pytest.raises(SystemExit, match="--full"):
+        ingest.ingest_pdfs(pdf_dir=tmp_path, persist_directory=str(tmp_path))
+
+
+def test_incremental_run_with_manifest(legacy_collection, tmp_path):
+    ingest.save_manifest({"files": {}}, tmp_path / ingest.MANIFEST_PATH.name)
+    stats = ingest.ingest_pdfs(pdf_dir=tmp_path, persist_directory=str(tmp_path))
+    assert stats["docs"] == 0
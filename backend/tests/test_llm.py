@@ -0,0 +1,171 @@
+# tests/test_llm.py
+"""
+Llamadas al LLM sin red:
+- HedgedLLM con endpoints falsos que tardan lo que se les diga antes del primer token
+- SingleFlight y LLMGate con corrutinas de prueba
+"""
+import asyncio
+
+import pytest
+
+import llm
+from llm import Completion, Endpoint, HedgedLLM
+
+
+class FakeClient:
+    def __init__(self, delay: float, text: str = "hola mundo", error: Exception = None):
+        self.delay = delay
+        self.text = text
+        self.error = error
+        self.calls = 0
+
+    async def astream(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        for word in self.text.split():
+            yield Completion(word + " ")
+
+
+def endpoint(name, delay, **kwargs) -> Endpoint:
+    return Endpoint(name, "http://127.0.0.1", "fake", timeout=5, _client=FakeClient(delay, **kwargs))
+
+
+@pytest.fixture
+def fast_hedging(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_HEDGE_MIN_SAMPLES", 3)
+    monkeypatch.setattr(llm, "LLM_HEDGE_MIN_SECONDS", 0.01)
+    monkeypatch.setattr(llm, "LLM_HEDGE_DEFAULT_SECONDS", 0.02)
+
+
+def test_hedges_to_next_endpoint_when_first_token_is_late(fast_hedging):
+    slow, fast = endpoint("slow", 1.0, text="lento"), endpoint("fast", 0.01, text="rápido")
+    hedged = HedgedLLM([slow, fast])
+    answer = asyncio.run(hedged.ainvoke("pregunta"))
+    assert answer.content.strip() == "rápido"
+    assert hedged.hedged == 1
+    assert fast.wins == 1 and slow.cancelled == 1
+
+
+def test_cancelled_losers_do_not_count_as_latency(fast_hedging, monkeypatch):
+    primary, secondary = endpoint("primary", 0.06), endpoint("secondary", 1.0)
+    hedged = HedgedLLM([primary, secondary])
+
+    async def run():
+        for _ in range(5):
+            await hedged.ainvoke("pregunta")
+
+    # sin medidas el plazo es de 20 ms: cada llamada lanza también el secundario y lo cancela
+    asyncio.run(run())
+    assert primary.wins == 5
+    assert secondary.cancelled == 5 and len(secondary.first_tokens) == 0
+    monkeypatch.setattr(llm, "LLM_HEDGE_DEFAULT_SECONDS", 5)
+    assert [e.name for e in hedged.ordered()] == ["primary", "secondary"]
+    assert hedged.expected_seconds(primary) == pytest.approx(0.06, abs=0.05)
+
+
+def test_hedge_delay_uses_raw_samples(fast_hedging):
+    e = endpoint("e", 0)
+    for seconds in [0.2] * 18 + [5.1, 5.1]:
+        e.observe_first_token(seconds)
+    # el histograma de /metrics redondearía el p95 al límite del bucket (10 s)
+    assert HedgedLLM([e]).hedge_delay(e) == pytest.approx(5.1)
+    assert HedgedLLM([e]).expected_seconds(e) == pytest.approx(0.2)
+
+
+def test_fails_over_and_demotes_failing_endpoint(fast_hedging):
+    broken = endpoint("broken", 0, error=RuntimeError("500"))
+    backup = endpoint("backup", 0.01, text="respaldo")
+    hedged = HedgedLLM([broken, backup])
+    answer = asyncio.run(hedged.ainvoke("pregunta"))
+    assert answer.content.strip() == "respaldo"
+    assert broken.failures == 1 and backup.wins == 1
+    assert hedged.ordered()[0] is backup
+
+
+def test_raises_when_every_endpoint_fails(fast_hedging):
+    hedged = HedgedLLM([endpoint("a", 0, error=RuntimeError("a")), endpoint("b", 0, error=RuntimeError("b"))])
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedged.ainvoke("pregunta"))
+
+
+def test_single_flight_shares_one_call():
+    flight = llm.SingleFlight()
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "respuesta"
+
+    async def run():
+        return await asyncio.gather(*(flight.call("k", answer) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["respuesta"] * 5
+    assert len(calls) == 1 and flight.coalesced == 4
+    # terminada la llamada no se guarda nada: la siguiente vuelve a ejecutarse
+    asyncio.run(flight.call("k", answer))
+    assert len(calls) == 2
+
+
+def test_single_flight_stream_replays_tokens_to_late_joiners():
+    flight = llm.SingleFlight()
+    calls = []
+
+    async def tokens():
+        calls.append(1)
+        for t in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield t
+
+    async def collect(delay):
+        await asyncio.sleep(delay)
+        return [t async for t in flight.stream("k", tokens)]
+
+    async def run():
+        return await asyncio.gather(collect(0), collect(0.015))
+
+    assert asyncio.run(run()) == [["a", "b", "c"], ["a", "b", "c"]]
+    assert len(calls) == 1 and flight.coalesced == 1
+
+
+def test_single_flight_propagates_errors_to_every_waiter():
+    flight = llm.SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LLM caído")
+
+    async def run():
+        return await asyncio.gather(*(flight.call("k", fail) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(run()))
+
+
+def test_gate_rejects_when_queue_is_full():
+    gate = llm.LLMGate(max_concurrency=1, max_queue=1)
+    release = None
+
+    async def hold():
+        async with gate.slot():
+            await release.wait()
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.ensure_future(hold())  # ocupa el único hueco
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(hold())  # espera en la cola
+        await asyncio.sleep(0)
+        assert gate.in_flight == 1 and gate.waiting == 1
+        with pytest.raises(llm.LLMBusy) as busy:
+            async with gate.slot():
+                pass
+        release.set()
+        await asyncio.gather(first, second)
+        return busy.value
+
+    busy = asyncio.run(run())
+    assert busy.status_code == 503 and int(busy.headers["Retry-After"]) >= 1
+    assert gate.rejected == 1 and gate.in_flight == 0 and gate.waiting == 0
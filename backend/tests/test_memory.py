@@ -0,0 +1,77 @@
+# tests/test_memory.py
+"""
+Memoria de /chat sobre SQLiteConversationStore: ningún mensaje se queda
+fuera del prompt (ni en el resumen ni en la ventana) y el resumen se lanza
+con los contadores que ya trajo load_memory.
+"""
+import asyncio
+
+import pytest
+
+import db
+import memory
+from db import SQLiteConversationStore
+from llm import Completion
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def ainvoke(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return Completion("resumen nuevo")
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = SQLiteConversationStore(":memory:")
+    monkeypatch.setattr(db, "_store", store)
+    return store
+
+
+async def add_turns(store, n, cid=None):
+    for i in range(n):
+        cid = await store.append_messages(
+            "u", [{"role": "user", "content": f"pregunta {i}"}, {"role": "assistant", "content": f"respuesta {i}"}], cid
+        )
+    return cid
+
+
+def test_loads_every_message_the_summary_does_not_cover(store):
+    async def run():
+        cid = await add_turns(store, 7)  # 14 mensajes, sin resumen
+        first = await memory.load_memory("u", cid)
+        await store.save_summary("u", cid, "resumen", 10)
+        second = await memory.load_memory("u", cid)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert len(first.messages) == 14 and first.message_count == 14
+    assert [m["content"] for m in second.messages] == ["pregunta 5", "respuesta 5", "pregunta 6", "respuesta 6"]
+    assert second.summary == "resumen" and second.summarized_count == 10
+
+
+def test_schedule_summary_uses_loaded_counts(store, monkeypatch):
+    llm = FakeLLM()
+
+    async def no_summary_read(*args):
+        raise AssertionError("get_summary no debería llamarse")
+
+    monkeypatch.setattr(store, "get_summary", no_summary_read)
+
+    async def run(turns):
+        cid = await add_turns(store, turns)
+        mem = await memory.load_memory("u", cid)
+        await add_turns(store, 1, cid)
+        memory.schedule_summary(llm, "u", cid, mem)
+        await asyncio.gather(*memory._tasks)
+        return await store.load_history("u", cid, 100)
+
+    # 4 + 1 turnos = 10 mensajes: solo 4 fuera de la ventana de 6, no se resume
+    info = asyncio.run(run(4))
+    assert llm.prompts == [] and info["summarized_count"] == 0
+    # 7 + 1 turnos = 16 mensajes: 10 fuera de la ventana, se pliegan [0, 10)
+    info = asyncio.run(run(7))
+    assert len(llm.prompts) == 1 and "pregunta 4" in llm.prompts[0] and "pregunta 5" not in llm.prompts[0]
+    assert info["summarized_count"] == 10 and len(info["messages"]) == 6
@@ -0,0 +1,11 @@
+# tests/test_metrics.py
+"""Exportación de /metrics en formato de texto de Prometheus"""
+from metrics import register_counter, register_gauge, render_prometheus
+
+
+def test_counters_and_gauges_are_typed():
+    register_gauge("test_queue_depth", "Cola de prueba", lambda: 3)
+    register_counter("test_requests_total", "Peticiones de prueba", lambda: 7)
+    lines = render_prometheus().splitlines()
+    assert "# TYPE test_queue_depth gauge" in lines and "test_queue_depth 3" in lines
+    assert "# TYPE test_requests_total counter" in lines and "test_requests_total 7" in lines
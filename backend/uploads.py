@@ -0,0 +1,147 @@
+# uploads.py
+"""Guardado de uploads en streaming, con límite de tamaño y direccionado por contenido"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB por lectura
+# margen para las cabeceras multipart por encima del tamaño del archivo
+MULTIPART_OVERHEAD = 64 * 1024
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+UPLOAD_REGISTRY_PATH = os.getenv("UPLOAD_REGISTRY_PATH", "vector_db/uploads_manifest.json")
+# directorio base de pdf_uploads/ y excel_uploads/
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", ".")
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    sha256: str
+    size: int
+    file_name: str  # nombre original, para citarlo como fuente
+
+
+async def save_upload(
+    file: UploadFile,
+    dest_dir: str,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> StoredUpload:
+    """
+    Copia el upload a disco por bloques calculando su sha256 sobre la marcha.
+    El archivo final se llama <sha256><ext>, así dos archivos con el mismo
+    nombre no se pisan. Si supera `max_bytes` se descarta y se responde 413.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    file_name = os.path.basename(file.filename or "upload")
+    ext = os.path.splitext(file_name)[1].lower()
+    tmp_path = os.path.join(dest_dir, f".{uuid.uuid4().hex}.part")
+
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                block = await file.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise too_large(max_bytes)
+                h.update(block)
+                f.write(block)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    sha256 = h.hexdigest()
+    final_path = os.path.join(dest_dir, f"{sha256}{ext}")
+    os.replace(tmp_path, final_path)
+    return StoredUpload(path=final_path, sha256=sha256, size=size, file_name=file_name)
+
+
+def too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Archivo demasiado grande (máximo {max_bytes // (1024 * 1024)} MB)",
+    )
+
+
+class UploadSizeLimit:
+    """
+    Middleware ASGI que corta las subidas demasiado grandes mientras llegan.
+    Starlette vuelca el multipart entero a disco antes de que save_upload lo
+    lea, así que sin Content-Length (Transfer-Encoding: chunked) el 413 de
+    save_upload llegaría después de recibir todo el cuerpo.
+    """
+
+    def __init__(self, app, paths, max_bytes: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            # ni siquiera se empieza a leer el cuerpo
+            exc = too_large(self.max_bytes - MULTIPART_OVERHEAD)
+            await JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI propaga las HTTPException que salen al leer el formulario
+                    raise too_large(self.max_bytes - MULTIPART_OVERHEAD)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class UploadRegistry:
+    """
+    Archivos ya ingeridos -> nombre y nº de chunks, por usuario y corpus
+    (cada usuario tiene su propia colección: el mismo archivo subido por otro
+    no está en la suya)
+    """
+
+    def __init__(self, path: str = UPLOAD_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+
+    @staticmethod
+    def key(user_id: str, corpus_id: str, sha256: str) -> str:
+        return f"{user_id}/{corpus_id}/{sha256}"
+
+    def get(self, user_id: str, corpus_id: str, sha256: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._entries.get(self.key(user_id, corpus_id, sha256))
+
+    def record(self, user_id: str, corpus_id: str, sha256: str, file_name: str, chunks: int) -> None:
+        with self._lock:
+            self._entries[self.key(user_id, corpus_id, sha256)] = {"file_name": file_name, "chunks": chunks}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
@@ -0,0 +1,205 @@
+# vectorstore.py
+"""Inicialización de ChromaDB, escritura sin duplicados y búsqueda por usuario (base + sus subidas)"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import Chroma
+    from langchain.schema import Document
+    from langchain_core.embeddings import Embeddings
+
+from dedupe import filter_near_duplicates, release
+from metrics import span
+
+VECTOR_DB_DIR = os.getenv("VECTOR_DB_DIR", "vector_db")
+# colección del corpus compartido (ingest.py); es el nombre por defecto de LangChain
+BASE_COLLECTION = "langchain"
+# corpus por defecto de las subidas de un usuario (se puede separar por asignatura, proyecto...)
+DEFAULT_CORPUS = "personal"
+
+# Chroma (SQLite) no admite lotes arbitrariamente grandes
+ADD_BATCH_SIZE = 1000
+
+
+def get_vectordb(embeddings: Embeddings, persist_directory: str = VECTOR_DB_DIR) -> Chroma:
+    from langchain_community.vectorstores import Chroma
+
+    return Chroma(
+        collection_name=BASE_COLLECTION, embedding_function=embeddings, persist_directory=persist_directory
+    )
+
+
+def chunk_id(text: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Id determinista de un chunk: mismo texto del mismo archivo en el mismo
+    corpus -> mismo id. Los chunks de ingest.py no llevan corpus_id (su id no cambia).
+    """
+    meta = metadata or {}
+    file_name = str(meta.get("file_name", meta.get("source", "")))
+    corpus_id = meta.get("corpus_id")
+    key = f"{file_name}\0{text}" if corpus_id is None else f"{corpus_id}\0{file_name}\0{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def query_collection(
+    vectordb: Chroma, vectors: List[List[float]], k: int, where: Optional[Dict[str, Any]] = None
+) -> List[List[Tuple[Document, List[float], float]]]:
+    """
+    Top-k de varias consultas en una sola llamada a Chroma. Por consulta,
+    lista de (documento, embedding del chunk, distancia); el embedding sirve para MMR.
+    """
+    from langchain.schema import Document
+
+    result = vectordb._collection.query(
+        query_embeddings=vectors,
+        n_results=k,
+        where=where,
+        include=["documents", "metadatas", "embeddings", "distances"],
+    )
+    out = []
+    for texts, metas, embeddings, distances in zip(
+        result["documents"], result["metadatas"], result["embeddings"], result["distances"]
+    ):
+        out.append([
+            (Document(page_content=text, metadata=meta or {}), list(emb), dist)
+            for text, meta, emb, dist in zip(texts, metas, embeddings, distances)
+        ])
+    return out
+
+
+def tenant_collection_name(user_id: str) -> str:
+    """Colección de un usuario (los nombres de Chroma admiten 3-63 caracteres [a-zA-Z0-9._-])"""
+    return "user_" + hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:40]
+
+
+class TenantIndex:
+    """
+    Colección base (la de ingest.py, compartida) + una colección por usuario
+    con sus subidas. Cada búsqueda consulta solo la base y la del usuario, así
+    que su coste no depende de lo que hayan subido los demás.
+    """
+
+    def __init__(self, base: Chroma, embeddings: Embeddings):
+        self.base = base
+        self.embeddings = embeddings
+        self._tenants: Dict[str, Chroma] = {}
+        self._lock = threading.Lock()
+        # chromadb < 0.6 devuelve objetos Collection; >= 0.6, nombres
+        names = [getattr(c, "name", c) for c in base._client.list_collections()]
+        self._known = {n for n in names if n.startswith("user_")}
+
+    def collection(self, user_id: str, create: bool = False) -> Optional[Chroma]:
+        """Colección del usuario; None si todavía no ha subido nada (salvo create=True)"""
+        from langchain_community.vectorstores import Chroma
+
+        name = tenant_collection_name(user_id)
+        with self._lock:
+            if name in self._tenants:
+                return self._tenants[name]
+            if not create and name not in self._known:
+                return None
+            vectordb = Chroma(
+                collection_name=name, embedding_function=self.embeddings, client=self.base._client
+            )
+            self._tenants[name] = vectordb
+            self._known.add(name)
+            return vectordb
+
+    def search_many(
+        self, user_id: Optional[str], vectors: List[List[float]], k: int, corpus_id: Optional[str] = None
+    ) -> List[Tuple[List[Document], List[List[float]]]]:
+        """
+        Top-k por consulta entre la base y los documentos del usuario (de
+        `corpus_id` si se indica), fusionados por distancia.
+        """
+        per_collection = [query_collection(self.base, vectors, k)]
+        tenant = self.collection(user_id) if user_id else None
+        if tenant is not None:
+            where = {"corpus_id": corpus_id} if corpus_id else None
+            per_collection.append(query_collection(tenant, vectors, k, where))
+
+        out = []
+        for hits_per_collection in zip(*per_collection):
+            hits = sorted((h for hits in hits_per_collection for h in hits), key=lambda h: h[2])[:k]
+            out.append(([h[0] for h in hits], [h[1] for h in hits]))
+        return out
+
+    def search(
+        self, user_id: Optional[str], vector: List[float], k: int, corpus_id: Optional[str] = None
+    ) -> Tuple[List[Document], List[List[float]]]:
+        return self.search_many(user_id, [vector], k, corpus_id)[0]
+
+
+def existing_ids(vectordb: Chroma, ids: List[str]) -> set:
+    found = set()
+    for i in range(0, len(ids), ADD_BATCH_SIZE):
+        found.update(vectordb.get(ids=ids[i : i + ADD_BATCH_SIZE], include=[])["ids"])
+    return found
+
+
+def add_unique_texts(
+    vectordb: Chroma,
+    texts: List[str],
+    metadatas: List[Dict[str, Any]],
+    progress: Optional[Callable[[int], None]] = None,
+) -> Tuple[List[str], List[str]]:
+    """
+    Añade solo los chunks que no estén ya en el índice, ni idénticos ni casi
+    duplicados (dedupe.py), dentro del mismo corpus: corpus_id va en el id del
+    chunk y el casi duplicado solo se busca en su corpus. Devuelve los ids añadidos
+    y los de chunks ya indexados que han ganado fuentes de casi duplicados;
+    `progress(n)` se llama tras cada lote escrito.
+    """
+    ids = [chunk_id(t, m) for t, m in zip(texts, metadatas)]
+
+    # quitar duplicados dentro del propio lote y los que ya están indexados
+    already = existing_ids(vectordb, list(set(ids)))
+    new_texts, new_metas, new_ids = [], [], []
+    for text, meta, cid in zip(texts, metadatas, ids):
+        if cid in already:
+            continue
+        already.add(cid)
+        new_texts.append(text)
+        new_metas.append(meta)
+        new_ids.append(cid)
+    new_texts, new_metas, new_ids, merged_ids = filter_near_duplicates(vectordb, new_texts, new_metas, new_ids)
+
+    for i in range(0, len(new_ids), ADD_BATCH_SIZE):
+        batch_texts = new_texts[i : i + ADD_BATCH_SIZE]
+        # embedding y escritura por separado para poder medir cada etapa
+        with span("index.embed"):
+            vectors = vectordb.embeddings.embed_documents(batch_texts)
+        with span("index.write"):
+            vectordb._collection.add(
+                ids=new_ids[i : i + ADD_BATCH_SIZE],
+                embeddings=vectors,
+                metadatas=new_metas[i : i + ADD_BATCH_SIZE],
+                documents=batch_texts,
+            )
+        if progress:
+            progress(len(new_ids[i : i + ADD_BATCH_SIZE]))
+    return new_ids, merged_ids
+
+
+def add_unique_documents(
+    vectordb: Chroma,
+    docs: List[Document],
+    progress: Optional[Callable[[int], None]] = None,
+) -> Tuple[List[str], List[str]]:
+    return add_unique_texts(
+        vectordb,
+        [d.page_content for d in docs],
+        [d.metadata or {} for d in docs],
+        progress=progress,
+    )
+
+
+def delete_ids(vectordb: Chroma, ids: List[str]) -> None:
+    # antes de borrar: los casi duplicados descartados de otros archivos no se pierden con ellos
+    release(vectordb, ids)
+    for i in range(0, len(ids), ADD_BATCH_SIZE):
+        vectordb.delete(ids=ids[i : i + ADD_BATCH_SIZE])
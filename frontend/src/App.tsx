@@ -12,6 +12,7 @@ type Source = {
 };
 
 type Message = {
+  id?: number;
   role: "user" | "assistant";
   content: string;
   sources?: Source[];
@@ -21,6 +22,17 @@ type ConversationSummary = {
   id: string;
   title: string | null;
   created_at: string;
+  message_count?: number;
+  last_activity?: string | null;
+};
+
+type IngestJob = {
+  id: string;
+  status: "queued" | "running" | "done" | "error";
+  chunks_processed: number;
+  chunks_added: number;
+  chunks_skipped: number;
+  error: string | null;
 };
 
 type Conversation = {
@@ -28,6 +40,8 @@ type Conversation = {
   title: string | null;
   created_at: string;
   messages: Message[];
+  has_more?: boolean;
+  next_before?: number | null;
 };
 
 const API_BASE = "https://usuariobot-production.up.railway.app";
@@ -49,6 +63,9 @@ function App() {
   const [isLoading, setIsLoading] = useState(false);
   const [accessToken, setAccessToken] = useState<string | null>(null);
   const [conversations, setConversations] = useState<ConversationSummary[]>([]);
+  // Paginación: cursor de la barra lateral y ventana de mensajes anteriores
+  const [conversationsCursor, setConversationsCursor] = useState<string | null>(null);
+  const [olderBefore, setOlderBefore] = useState<number | null>(null);
   const [currentConversationId, setCurrentConversationId] = useState<string | null>(null);
   const [editingId, setEditingId] = useState<string | null>(null);
   const [editingTitle, setEditingTitle] = useState("");
@@ -78,16 +95,22 @@ function App() {
     };
   }, []);
 
-  const loadConversations = async (token: string) => {
+  const loadConversations = async (token: string, cursor?: string) => {
     try {
-      const res = await fetch(`${API_BASE}/conversations`, {
+      const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+      const res = await fetch(`${API_BASE}/conversations${params}`, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
       if (!res.ok) return;
-      const data: { conversations?: ConversationSummary[] } = await res.json();
-      setConversations(data.conversations ?? []);
+      const data: {
+        conversations?: ConversationSummary[];
+        next_cursor?: string | null;
+      } = await res.json();
+      const page = data.conversations ?? [];
+      setConversations((prev) => (cursor ? [...prev, ...page] : page));
+      setConversationsCursor(data.next_cursor ?? null);
     } catch (e) {
       console.error("Error cargando conversaciones", e);
     }
@@ -106,12 +129,34 @@ function App() {
       if (data.conversation?.messages) {
         setMessages(data.conversation.messages);
         setCurrentConversationId(id);
+        setOlderBefore(data.conversation.has_more ? data.conversation.next_before ?? null : null);
       }
     } catch (e) {
       console.error("Error cargando conversación", e);
     }
   };
 
+  const loadOlderMessages = async () => {
+    if (!accessToken || !currentConversationId || olderBefore === null) return;
+    try {
+      const res = await fetch(
+        `${API_BASE}/conversations/${currentConversationId}?before=${olderBefore}`,
+        {
+          headers: {
+            Authorization: `Bearer ${accessToken}`,
+          },
+        }
+      );
+      if (!res.ok) return;
+      const data: { conversation?: Conversation } = await res.json();
+      const older = data.conversation?.messages ?? [];
+      setMessages((prev) => [...older, ...prev]);
+      setOlderBefore(data.conversation?.has_more ? data.conversation.next_before ?? null : null);
+    } catch (e) {
+      console.error("Error cargando mensajes anteriores", e);
+    }
+  };
+
   useEffect(() => {
     if (accessToken) {
       loadConversations(accessToken);
@@ -119,6 +164,7 @@ function App() {
       setConversations([]);
       setMessages([]);
       setCurrentConversationId(null);
+      setOlderBefore(null);
     }
   }, [accessToken]);
 
@@ -228,6 +274,7 @@ function App() {
 
       if (currentConversationId === id) {
         setCurrentConversationId(null);
+        setOlderBefore(null);
         setMessages([]);
       }
     } catch (e) {
@@ -244,6 +291,25 @@ function App() {
     setStatusTimeoutId(id);
   };
 
+  // Los uploads devuelven un job_id; consultamos /jobs/{id} hasta que termina
+  const waitForJob = async (jobId: string): Promise<IngestJob> => {
+    for (;;) {
+      const res = await fetch(`${API_BASE}/jobs/${jobId}`, {
+        headers: {
+          Authorization: `Bearer ${accessToken}`,
+        },
+      });
+      if (!res.ok) {
+        throw new Error("Error consultando el trabajo de ingesta");
+      }
+      const data: { job: IngestJob } = await res.json();
+      if (data.job.status === "done" || data.job.status === "error") {
+        return data.job;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1500));
+    }
+  };
+
   const handleUploadPdf = async (file: File) => {
     if (!accessToken) return;
 
@@ -266,9 +332,16 @@ function App() {
         return;
       }
 
-      const data = await res.json();
+      const data: { job_id: string } = await res.json();
+      setAutoClearingStatus(`Indexando PDF "${file.name}"...`);
+      const job = await waitForJob(data.job_id);
+      if (job.status === "error") {
+        console.error("Error en la ingesta:", job.error);
+        setAutoClearingStatus("Error al subir el PDF.");
+        return;
+      }
       setAutoClearingStatus(
-        `PDF "${file.name}" subido correctamente. Se han indexado ${data.chunks_added} fragmentos.`
+        `PDF "${file.name}" subido correctamente. Se han indexado ${job.chunks_added} fragmentos.`
       );
     } catch (e) {
       console.error("Error llamando a /upload-pdf", e);
@@ -299,9 +372,16 @@ function App() {
         return;
       }
 
-      const data = await res.json();
+      const data: { job_id: string } = await res.json();
+      setAutoClearingStatus(`Indexando Excel "${file.name}"...`);
+      const job = await waitForJob(data.job_id);
+      if (job.status === "error") {
+        console.error("Error en la ingesta:", job.error);
+        setAutoClearingStatus("Error al subir el Excel.");
+        return;
+      }
       setAutoClearingStatus(
-        `Excel "${file.name}" subido correctamente. Se han indexado ${data.chunks_added} fragmentos.`
+        `Excel "${file.name}" subido correctamente. Se han indexado ${job.chunks_added} fragmentos.`
       );
     } catch (e) {
       console.error("Error llamando a /upload-excel", e);
@@ -332,9 +412,16 @@ function App() {
         return;
       }
 
-      const data = await res.json();
+      const data: { job_id: string } = await res.json();
+      setAutoClearingStatus(`Indexando URL...`);
+      const job = await waitForJob(data.job_id);
+      if (job.status === "error") {
+        console.error("Error en la ingesta:", job.error);
+        setAutoClearingStatus("Error al cargar la URL.");
+        return;
+      }
       setAutoClearingStatus(
-        `URL cargada correctamente. Se han indexado ${data.chunks_added} fragmentos.`
+        `URL cargada correctamente. Se han indexado ${job.chunks_added} fragmentos.`
       );
     } catch (e) {
       console.error("Error llamando a /upload-url", e);
@@ -396,7 +483,8 @@ function App() {
                         )}
                       </div>
                       <div className="text-[10px] text-muted-foreground">
-                        {new Date(c.created_at).toLocaleString()}
+                        {new Date(c.last_activity ?? c.created_at).toLocaleString()}
+                        {c.message_count !== undefined && ` · ${c.message_count} mensajes`}
                       </div>
                     </button>
                     {!isEditing && (
@@ -427,6 +515,18 @@ function App() {
               );
             })
           )}
+          {conversationsCursor && (
+            <Button
+              variant="outline"
+              size="xs"
+              className="w-full"
+              onClick={() =>
+                accessToken && loadConversations(accessToken, conversationsCursor)
+              }
+            >
+              Cargar más
+            </Button>
+          )}
         </div>
       </Card>
 
@@ -480,6 +580,7 @@ function App() {
               size="sm"
               onClick={() => {
                 setCurrentConversationId(null);
+                setOlderBefore(null);
                 setMessages([]);
               }}
             >
@@ -492,6 +593,7 @@ function App() {
                 setAccessToken(null);
                 setMessages([]);
                 setCurrentConversationId(null);
+                setOlderBefore(null);
               }}
             >
               Cerrar sesión
@@ -507,6 +609,13 @@ function App() {
 
         <div className="flex-1 px-4 py-3 overflow-y-auto">
           <div className="space-y-4">
+            {olderBefore !== null && (
+              <div className="flex justify-center">
+                <Button variant="outline" size="xs" onClick={loadOlderMessages}>
+                  Cargar mensajes anteriores
+                </Button>
+              </div>
+            )}
             {messages.map((m, i) => (
               <div
                 key={i}